@@ -0,0 +1,136 @@
+import json
+import time
+
+
+class CommandTracker:
+    """
+    Last command sent and acknowledged per command topic, to publish only commands that changed
+
+    A command is sent when:
+    - nothing was sent on its topic yet,
+    - one of `compare_keys` differs from the last sent command (numbers within `tolerance` are equal, so the Niagara
+      random setpoint offset doesn't count as a change),
+    - the last send is older than `keepalive_seconds`,
+    - or acknowledgements are tracked (`track_acks`) and the last command wasn't acknowledged within `ack_timeout_seconds`
+
+    Args:
+        compare_keys (tuple): Message keys compared between commands
+        keepalive_seconds (float): Resend an unchanged command after this time, 0 to resend on every call
+        tolerance (float): Numeric values closer than this are treated as equal
+        track_acks (bool): Resend commands which were not acknowledged by `acknowledge`
+        ack_timeout_seconds (float): How long to wait for an acknowledgement before resending
+
+    """
+
+    def __init__(self, compare_keys: tuple=("mode", "set_temperature"), keepalive_seconds: float=900, tolerance: float=0.5,
+                 track_acks: bool=False, ack_timeout_seconds: float=120):
+        self.compare_keys = tuple(compare_keys)
+        self.keepalive_seconds = keepalive_seconds
+        self.tolerance = tolerance
+        self.track_acks = track_acks
+        self.ack_timeout_seconds = ack_timeout_seconds
+        self._sent = dict()  # {<topic>: (<unix_timestamp>, <message>)}
+        self._acknowledged = dict()  # {<topic>: <unix_timestamp>}
+        self.stats = {"sent": 0, "suppressed": 0, "acknowledged": 0}
+
+    def _changed(self, message: dict, last_message: dict):
+        for key in self.compare_keys:
+            value, last_value = message.get(key), last_message.get(key)
+            if isinstance(value, (int, float)) and isinstance(last_value, (int, float)):
+                if abs(value - last_value) >= self.tolerance:
+                    return True
+            elif value != last_value:
+                return True
+        return False
+
+    def should_send(self, topic: str, message: dict, now: float=None):
+        """Check if a command has to be published, counting suppressed commands"""
+        now = time.time() if now is None else now
+        last = self._sent.get(topic)
+        if (last is None) or self._changed(message, last[1]) or (now - last[0] >= self.keepalive_seconds):
+            return True
+        if self.track_acks and (self._acknowledged.get(topic, -1) < last[0]) and (now - last[0] >= self.ack_timeout_seconds):
+            return True
+        self.stats["suppressed"] += 1
+        return False
+
+    def mark_sent(self, topic: str, message: dict, now: float=None):
+        self._sent[topic] = (time.time() if now is None else now, dict(message))
+        self.stats["sent"] += 1
+
+    def acknowledge(self, topic: str, now: float=None):
+        """Record that the device behind `topic` confirmed the last sent command"""
+        if topic not in self._sent:
+            return False
+        self._acknowledged[topic] = time.time() if now is None else now
+        self.stats["acknowledged"] += 1
+        return True
+
+    def last_command(self, topic: str):
+        """Get (unix_timestamp, message) of the last sent command, or None"""
+        return self._sent.get(topic)
+
+    def is_acknowledged(self, topic: str):
+        last = self._sent.get(topic)
+        return (last is not None) and (self._acknowledged.get(topic, -1) >= last[0])
+
+    def to_state(self):
+        """Last sent commands and acknowledgements as plain data, for the agent snapshot"""
+        return {"sent": {topic: [unix_timestamp, dict(message)] for topic, (unix_timestamp, message) in self._sent.items()},
+                "acknowledged": dict(self._acknowledged)}
+
+    def restore_state(self, state: dict, topics: set=None):
+        """Restore `to_state` (only `topics` when given), unchanged commands are then not resent before the keepalive"""
+        for topic, (unix_timestamp, message) in (state or dict()).get("sent", dict()).items():
+            if (topics is None) or (topic in topics):
+                self._sent[topic] = (unix_timestamp, dict(message))
+        for topic, unix_timestamp in (state or dict()).get("acknowledged", dict()).items():
+            if topic in self._sent:
+                self._acknowledged[topic] = unix_timestamp
+
+    def forget(self, topics: list=None):
+        """Drop the state of `topics` (all topics when None), their next command is always sent"""
+        if topics is None:
+            self._sent = dict()
+            self._acknowledged = dict()
+            return
+        for topic in topics:
+            self._sent.pop(topic, None)
+            self._acknowledged.pop(topic, None)
+
+
+COMMAND_BATCH_MESSAGE_TYPE = "command_batch"
+
+
+def pack_command_batch(commands: list, unix_timestamp: float=None):
+    """
+    Build the envelope sent instead of one pub/sub message per command
+
+    Args:
+        commands (list): [{"topic": <command topic>, "message": <command message>}, ...] in publishing order
+
+    Returns:
+        envelope (dict): {"commands": [...], "count": <int>, "unix_timestamp": <float>}, published with
+                         `{"message_type": "command_batch"}` in its headers
+
+    """
+    return {
+        "commands": [{"topic": str(command["topic"]), "message": command["message"]} for command in commands],
+        "count": len(commands),
+        "unix_timestamp": time.time() if unix_timestamp is None else unix_timestamp
+    }
+
+
+def unpack_command_batch(headers: dict, message):
+    """
+    Unbatching contract for the agent forwarding commands to MQTT / BACnet (ex. `mqtt_logger`)
+
+    Returns [(<command topic>, <command message>), ...] in publishing order. A message without the
+    `command_batch` message type in its headers is a single command and is returned as is with topic None,
+    so the receiver keeps using the pub/sub topic it came from.
+    """
+    if (headers or dict()).get("message_type") != COMMAND_BATCH_MESSAGE_TYPE:
+        return [(None, message)]
+    if isinstance(message, str):
+        message = json.loads(message)
+    return [(command.get("topic"), command.get("message")) for command in message.get("commands", list())]
@@ -0,0 +1,76 @@
+def diff_zone_mapping(old_mapping: dict, new_mapping: dict):
+    """
+    Compare two `thermal_zone_mapping`s zone by zone
+
+    Returns:
+        (added, removed, changed) (tuple): Zone names only in `new_mapping`, only in `old_mapping`, and in both with
+                                           different device infos (device ids or zone options), in mapping order
+
+    """
+    old_mapping = old_mapping or dict()
+    new_mapping = new_mapping or dict()
+    added = [zone_name for zone_name in new_mapping.keys() if zone_name not in old_mapping]
+    removed = [zone_name for zone_name in old_mapping.keys() if zone_name not in new_mapping]
+    changed = [zone_name for zone_name, device_infos in new_mapping.items()
+               if (zone_name in old_mapping) and (old_mapping[zone_name] != device_infos)]
+    return added, removed, changed
+
+
+class DeviceZoneIndex:
+    """
+    Zones of every device listed under `key` ("iaq_device_ids", "fcu_device_ids", "oau_device_ids") of a mapping
+
+    The index is updated zone by zone, so applying a mapping change costs O(devices of the changed zones) instead of
+    a pass over the whole building. The zone lists of a device are updated in place: references to them (ex. topic
+    routes) stay valid as long as the device is mapped.
+
+    Args:
+        key (str): Device ids key of the zone infos
+
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.device_zones = dict()  # {<device_id>: [<zone_name>, ...]}
+        self._zone_devices = dict()  # {<zone_name>: [<device_id>, ...]}
+
+    def __contains__(self, device_id):
+        return device_id in self.device_zones
+
+    def zone_device_ids(self, zone_name: str):
+        return list(self._zone_devices.get(zone_name, list()))
+
+    def update(self, thermal_zone_mapping: dict, zone_names: list):
+        """
+        Read `zone_names` again from the mapping, zones not in the mapping are dropped
+
+        Returns:
+            (added, removed) (tuple): Device ids which were not mapped before / are not mapped anymore (a device moved
+                                      from a zone to another is in neither)
+
+        """
+        emptied, added = list(), list()
+        for zone_name in dict.fromkeys(zone_names):
+            for device_id in self._zone_devices.pop(zone_name, list()):
+                zone_list = self.device_zones[device_id]
+                zone_list.remove(zone_name)
+                if len(zone_list) <= 0:
+                    emptied.append(device_id)
+
+            device_infos = thermal_zone_mapping.get(zone_name)
+            if device_infos is None:
+                continue
+            device_ids = list(dict.fromkeys(device_infos.get(self.key, list())))
+            self._zone_devices[zone_name] = device_ids
+            for device_id in device_ids:
+                zone_list = self.device_zones.get(device_id)
+                if zone_list is None:
+                    zone_list = self.device_zones[device_id] = list()
+                    added.append(device_id)
+                zone_list.append(zone_name)
+
+        # emptied lists are dropped at the end, a device moving between zones keeps its list
+        removed = [device_id for device_id in dict.fromkeys(emptied) if len(self.device_zones[device_id]) <= 0]
+        for device_id in removed:
+            del self.device_zones[device_id]
+        return added, removed
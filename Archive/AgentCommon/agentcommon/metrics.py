@@ -0,0 +1,107 @@
+import bisect
+import functools
+import os
+import time
+
+# histogram upper bounds (seconds) of stage durations, from sub-millisecond decodes to a CrateDB timeout
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class StageHistogram:
+    """Fixed-bucket histogram of one stage's durations (count, sum and max are kept next to the bucket counts)"""
+    __slots__ = ("bounds", "bucket_counts", "count", "sum", "max")
+
+    def __init__(self, bounds: tuple=STAGE_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.bucket_counts = [0] * (len(self.bounds) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.bucket_counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def cumulative_counts(self):
+        """[(<upper bound>, <observations <= bound>), ..., ("+Inf", <count>)]"""
+        counts, total = list(), 0
+        for bound, bucket_count in zip(self.bounds + ("+Inf",), self.bucket_counts):
+            total += bucket_count
+            counts.append((bound, total))
+        return counts
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum, "max": self.max,
+                "buckets": [[bound, count] for bound, count in self.cumulative_counts()]}
+
+
+class StageMetrics:
+    """
+    Per-stage duration histograms of the control loop hot path (query, decode, pivot, resample, aPMV, setpoint search,
+    publish, ...)
+
+    Observing a duration is a `perf_counter` pair, a bisect and a few integer increments, cheap enough to stay on in
+    production. Snapshots are published by the agent on its metrics topic and can be written as a Prometheus text file.
+
+    """
+
+    def __init__(self, bounds: tuple=STAGE_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.histograms = dict()  # {<stage>: StageHistogram}
+        self.started = time.time()
+
+    def observe(self, stage: str, seconds: float):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = StageHistogram(self.bounds)
+        histogram.observe(seconds)
+
+    def timed(self, stage: str):
+        """Decorator recording the duration of every call of a function under `stage`"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(stage, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """{"since": <unix_timestamp>, "stages": {<stage>: {"count", "sum", "max", "buckets": [[<le>, <count>], ...]}}}"""
+        return {"since": self.started, "stages": {stage: histogram.to_dict() for stage, histogram in self.histograms.items()}}
+
+    def reset(self):
+        self.histograms = dict()
+        self.started = time.time()
+
+    def to_prometheus(self, namespace: str, labels: dict=None):
+        """Render the histograms in the Prometheus text exposition format, as `<namespace>_stage_duration_seconds`"""
+        name = f"{namespace}_stage_duration_seconds"
+        base_labels = "".join(f',{key}="{_escape_label(value)}"' for key, value in (labels or dict()).items())
+        lines = [f"# HELP {name} Duration of control loop stages",
+                 f"# TYPE {name} histogram"]
+        for stage, histogram in sorted(self.histograms.items()):
+            stage_labels = f'stage="{_escape_label(stage)}"{base_labels}'
+            for bound, count in histogram.cumulative_counts():
+                lines.append(f'{name}_bucket{{{stage_labels},le="{bound}"}} {count}')
+            lines.append(f"{name}_sum{{{stage_labels}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{stage_labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, namespace: str, labels: dict=None):
+        """Write `to_prometheus` to `path` for the node_exporter textfile collector (atomic rename, no partial reads)"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as prometheus_file:
+            prometheus_file.write(self.to_prometheus(namespace, labels))
+        os.replace(tmp_path, path)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
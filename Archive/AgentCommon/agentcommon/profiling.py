@@ -0,0 +1,170 @@
+import cProfile
+import glob
+import json
+import os
+import pstats
+import time
+import tracemalloc
+
+
+def agent_data_dir(configured_dir: str=None):
+    """
+    Get the data directory of the agent, None when there is none
+
+    A configured directory (`data_dir`) is used as is, and created if needed. Otherwise, only when the agent was
+    started by the VOLTTRON platform (`AGENT_UUID` is set), the `<agent>.agent-data` directory VOLTTRON created in the
+    agent install directory, which is the working directory of the agent process. Nothing is guessed or created in
+    other cases (ex. agent run from a source checkout, benchmarks).
+    """
+    if configured_dir:
+        os.makedirs(configured_dir, exist_ok=True)
+        return configured_dir
+    if not os.environ.get("AGENT_UUID"):
+        return None
+    candidates = [candidate for candidate in glob.glob(os.path.join(os.getcwd(), "*.agent-data")) if os.path.isdir(candidate)]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+class TickProfiler:
+    """
+    On-demand cProfile / tracemalloc session over the next `ticks` ticks or the next `seconds` seconds
+
+    In tick mode cProfile only runs between `tick_started` and `tick_finished` (tracemalloc keeps tracing from the
+    first tick on), and the session ends after `ticks` full ticks. In time mode it runs from `start` until `stop` (the
+    agent schedules the stop). Results are written to `output_dir`: a pstats file (open with `python -m pstats <file>`)
+    and the top allocators as text, and a summary (top functions by cumulative time, top allocators) is kept in
+    `last_result`.
+
+    Args:
+        name (str): Prefix of the result files, ex. the agent identity
+
+    """
+
+    def __init__(self, name: str="agent"):
+        self.name = name
+        self.session = None
+        self.last_result = None
+
+    @property
+    def active(self):
+        return self.session is not None
+
+    def start(self, output_dir: str, ticks: int=None, seconds: float=None, cpu: bool=True, memory: bool=False, top: int=20):
+        """Arm a profiling session, tick mode unless `seconds` is given (default: 1 tick)"""
+        if self.session is not None:
+            raise RuntimeError("a profiling session is already running")
+        if (not cpu) and (not memory):
+            raise ValueError("nothing to profile, enable `cpu` and/or `memory`")
+        mode = "seconds" if seconds else "ticks"
+        self.session = {
+            "mode": mode,
+            "ticks": None if mode == "seconds" else max(1, int(ticks or 1)),
+            "seconds": float(seconds) if seconds else None,
+            "ticks_done": 0,
+            "top": max(1, int(top)),
+            "output_dir": output_dir,
+            "started": time.time(),
+            "profile": cProfile.Profile() if cpu else None,
+            "memory": memory,
+            "own_tracemalloc": False,
+            "memory_started": False,
+            "elapsed_profiled": 0.0,
+            "_tick_start": None,
+        }
+        if mode == "seconds":
+            self._enable()
+        return self.status()
+
+    def status(self):
+        if self.session is None:
+            return {"active": False}
+        return {"active": True,
+                **{key: value for key, value in self.session.items()
+                   if key in ("mode", "ticks", "seconds", "ticks_done", "top", "output_dir", "started", "memory")},
+                "cpu": self.session["profile"] is not None}
+
+    def _enable(self):
+        session = self.session
+        if session["memory"] and not session["memory_started"]:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                session["own_tracemalloc"] = True
+            session["memory_started"] = True
+        if session["profile"] is not None:
+            session["profile"].enable()
+        session["_tick_start"] = time.perf_counter()
+
+    def _disable(self):
+        session = self.session
+        if session["profile"] is not None:
+            session["profile"].disable()
+        if session["_tick_start"] is not None:
+            session["elapsed_profiled"] += time.perf_counter() - session["_tick_start"]
+            session["_tick_start"] = None
+
+    def tick_started(self):
+        if (self.session is not None) and (self.session["mode"] == "ticks") and (self.session["_tick_start"] is None):
+            self._enable()
+
+    def tick_finished(self, full_tick: bool=True):
+        """Pause the tick profiling, return the summary when the session just completed (else None)"""
+        if (self.session is None) or (self.session["mode"] != "ticks") or (self.session["_tick_start"] is None):
+            return None
+        self._disable()
+        if full_tick:
+            self.session["ticks_done"] += 1
+        if self.session["ticks_done"] >= self.session["ticks"]:
+            return self.stop()
+        return None
+
+    def stop(self):
+        """End the session, write the result files and return the summary (None when no session is running)"""
+        session = self.session
+        if session is None:
+            return None
+        if session["mode"] == "seconds" or session["_tick_start"] is not None:
+            self._disable()
+        self.session = None
+
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(session["started"])) + f".{int(session['started'] * 1000) % 1000:03d}"
+        prefix = os.path.join(session["output_dir"], f"{self.name}-{stamp}")
+        result = {"mode": session["mode"], "ticks": session["ticks_done"], "started": session["started"],
+                  "finished": time.time(), "profiled_seconds": session["elapsed_profiled"]}
+
+        if session["profile"] is not None:
+            stats = pstats.Stats(session["profile"])
+            result["pstats_file"] = f"{prefix}.pstats"
+            stats.dump_stats(result["pstats_file"])
+            result["total_seconds"] = stats.total_tt
+            result["top_functions"] = _top_functions(stats, session["top"])
+
+        if session["memory"]:
+            # leave out the profiler's own allocations
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, cProfile.__file__),
+                                                                  tracemalloc.Filter(False, pstats.__file__),
+                                                                  tracemalloc.Filter(False, tracemalloc.__file__)])
+            current, peak = tracemalloc.get_traced_memory()
+            if session["own_tracemalloc"]:
+                tracemalloc.stop()
+            result["traced_memory_bytes"] = current
+            result["peak_memory_bytes"] = peak
+            result["top_allocators"] = [{"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                                         "size_bytes": stat.size, "count": stat.count}
+                                        for stat in snapshot.statistics("lineno")[:session["top"]]]
+            result["allocators_file"] = f"{prefix}.allocators.txt"
+            with open(result["allocators_file"], "w") as allocators_file:
+                for stat in snapshot.statistics("lineno")[:max(100, session["top"])]:
+                    allocators_file.write(f"{stat}\n")
+
+        result["summary_file"] = f"{prefix}.summary.json"
+        with open(result["summary_file"], "w") as summary_file:
+            json.dump(result, summary_file, indent=2)
+        self.last_result = result
+        return result
+
+
+def _top_functions(stats: pstats.Stats, top: int):
+    """Top functions by cumulative time, [{"function", "calls", "tottime", "cumtime"}, ...]"""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    return [{"function": f"{filename}:{lineno}({function_name})", "calls": calls, "tottime": tottime, "cumtime": cumtime}
+            for (filename, lineno, function_name), (_, calls, tottime, cumtime, _) in rows]
@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+import tempfile
+import time
+
+_log = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 2
+SNAPSHOT_FILE_NAME = "runtime_state.json"
+
+
+def _json_default(value):
+    """numpy scalars (ex. values backfilled from a dataframe) as Python numbers"""
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not plain snapshot data")
+
+
+def save_snapshot(path: str, state: dict, unix_timestamp: float=None):
+    """
+    Write the runtime state of an agent to `path` atomically
+
+    `state` must be plain data (dicts with str keys, lists, numbers, str, bool, None), it is written as JSON so that
+    the file doesn't depend on the agent's classes and can be read back after an upgrade. The file is written to a
+    temporary file in the same directory, flushed to disk and renamed over `path` with `os.replace`, so a crash while
+    saving leaves the previous snapshot intact.
+
+    Returns:
+        size (int): Size of the snapshot file in bytes
+
+    """
+    payload = {"version": SNAPSHOT_VERSION,
+               "unix_timestamp": time.time() if unix_timestamp is None else unix_timestamp,
+               "state": state}
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as snapshot_file:
+            json.dump(payload, snapshot_file, default=_json_default)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return os.path.getsize(path)
+
+
+def load_snapshot(path: str, max_age_seconds: float=None, now: float=None):
+    """
+    Read a snapshot written by `save_snapshot`
+
+    Returns:
+        (state, unix_timestamp): the saved state and when it was saved, or (None, None) when there is no snapshot, it
+                                 can't be read, has another version or is older than `max_age_seconds`
+
+    """
+    if not os.path.exists(path):
+        return None, None
+    try:
+        with open(path) as snapshot_file:
+            payload = json.load(snapshot_file)
+    except (OSError, ValueError) as e:
+        _log.error(f"Snapshot `{path}` could not be read: {e}")
+        return None, None
+    if (not isinstance(payload, dict)) or (payload.get("version") != SNAPSHOT_VERSION):
+        _log.warning(f"Snapshot `{path}` has an unsupported version, ignored")
+        return None, None
+    now = time.time() if now is None else now
+    unix_timestamp = payload.get("unix_timestamp", 0)
+    if (max_age_seconds is not None) and (max_age_seconds > 0) and (now - unix_timestamp > max_age_seconds):
+        _log.info(f"Snapshot `{path}` is older than {max_age_seconds} s, ignored")
+        return None, None
+    return payload.get("state"), unix_timestamp
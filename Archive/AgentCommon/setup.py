@@ -0,0 +1,11 @@
+from setuptools import setup, find_packages
+
+# Code shared by the FCU and OAU agents, installed in the VOLTTRON environment before the agents
+setup(
+    name='agentcommon',
+    version='0.1',
+    author="Pamekitti",
+    author_email="pamekitti.p@gmail.com",
+    install_requires=[],
+    packages=find_packages('.'),
+)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# import `agentcommon` from this checkout
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+if PACKAGE_DIR not in sys.path:
+    sys.path.insert(0, PACKAGE_DIR)
@@ -0,0 +1,27 @@
+import os
+
+from agentcommon.profiling import agent_data_dir
+
+
+def test_configured_dir_is_created(tmp_path):
+    data_dir = str(tmp_path / "fcuagent-data")
+    assert agent_data_dir(data_dir) == data_dir
+    assert os.path.isdir(data_dir)
+
+
+def test_no_dir_outside_the_platform(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("AGENT_UUID", raising=False)
+    (tmp_path / "other.agent-data").mkdir()
+    assert agent_data_dir() is None
+    assert os.listdir(tmp_path) == ["other.agent-data"]
+
+
+def test_platform_data_dir_is_found_not_created(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("AGENT_UUID", "00000000-0000-0000-0000-000000000000")
+    assert agent_data_dir() is None
+    assert os.listdir(tmp_path) == []
+
+    (tmp_path / "fcuagentagent-0.1.agent-data").mkdir()
+    assert agent_data_dir() == str(tmp_path / "fcuagentagent-0.1.agent-data")
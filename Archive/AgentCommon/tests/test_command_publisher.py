@@ -0,0 +1,49 @@
+from agentcommon.command_publisher import CommandTracker, pack_command_batch, unpack_command_batch
+
+TOPIC = "mqtt/fcu_control/DaikinCCC-FCU-1-01/command"
+
+
+def test_unchanged_command_is_suppressed_until_the_keepalive():
+    tracker = CommandTracker(keepalive_seconds=900)
+    message = {"mode": "cool", "set_temperature": 25.1}
+    assert tracker.should_send(TOPIC, message, now=0)
+    tracker.mark_sent(TOPIC, message, now=0)
+
+    # the random setpoint offset is within the tolerance
+    assert not tracker.should_send(TOPIC, {"mode": "cool", "set_temperature": 25.2}, now=60)
+    assert tracker.should_send(TOPIC, {"mode": "cool", "set_temperature": 26}, now=60)
+    assert tracker.should_send(TOPIC, message, now=900)
+    assert tracker.stats["suppressed"] == 1
+
+
+def test_unacknowledged_command_is_resent():
+    tracker = CommandTracker(track_acks=True, ack_timeout_seconds=120)
+    message = {"mode": "cool", "set_temperature": 25}
+    tracker.mark_sent(TOPIC, message, now=0)
+    assert not tracker.should_send(TOPIC, message, now=60)
+    assert tracker.should_send(TOPIC, message, now=120)
+
+    tracker.acknowledge(TOPIC, now=130)
+    assert not tracker.should_send(TOPIC, message, now=200)
+
+
+def test_state_round_trip_keeps_only_mapped_topics():
+    tracker = CommandTracker()
+    tracker.mark_sent(TOPIC, {"mode": "cool", "set_temperature": 25}, now=0)
+    tracker.mark_sent("mqtt/fcu_control/removed/command", {"mode": "fan"}, now=0)
+    tracker.acknowledge(TOPIC, now=1)
+
+    restored = CommandTracker()
+    restored.restore_state(tracker.to_state(), topics={TOPIC})
+    assert restored.last_command(TOPIC) == (0, {"mode": "cool", "set_temperature": 25})
+    assert restored.is_acknowledged(TOPIC)
+    assert restored.last_command("mqtt/fcu_control/removed/command") is None
+
+
+def test_command_batch_round_trip():
+    commands = [{"topic": TOPIC, "message": {"mode": "cool"}}, {"topic": "other/command", "message": {"mode": "off"}}]
+    envelope = pack_command_batch(commands, unix_timestamp=0)
+    assert envelope["count"] == 2
+    assert unpack_command_batch({"message_type": "command_batch"}, envelope) == [(TOPIC, {"mode": "cool"}),
+                                                                                 ("other/command", {"mode": "off"})]
+    assert unpack_command_batch({}, {"mode": "cool"}) == [(None, {"mode": "cool"})]
@@ -0,0 +1,58 @@
+from agentcommon.config_diff import DeviceZoneIndex, diff_zone_mapping
+
+MAPPING = {
+    "Floor 1: 1": {"iaq_device_ids": ["iaq-1"], "fcu_device_ids": ["fcu-1"]},
+    "Floor 1: 2": {"iaq_device_ids": ["iaq-2", "iaq-shared"], "fcu_device_ids": ["fcu-2"]},
+    "Floor 1: 3": {"iaq_device_ids": ["iaq-shared"], "fcu_device_ids": ["fcu-3"]},
+}
+
+
+def test_diff_zone_mapping():
+    new_mapping = {
+        "Floor 1: 1": MAPPING["Floor 1: 1"],
+        "Floor 1: 2": {"iaq_device_ids": ["iaq-2"], "fcu_device_ids": ["fcu-2"]},
+        "Floor 1: 4": {"iaq_device_ids": ["iaq-4"], "fcu_device_ids": ["fcu-4"]},
+    }
+    assert diff_zone_mapping(MAPPING, new_mapping) == (["Floor 1: 4"], ["Floor 1: 3"], ["Floor 1: 2"])
+    assert diff_zone_mapping(None, MAPPING) == (list(MAPPING), [], [])
+    assert diff_zone_mapping(MAPPING, MAPPING) == ([], [], [])
+
+
+def test_zone_options_count_as_a_change():
+    new_mapping = {**MAPPING, "Floor 1: 1": {**MAPPING["Floor 1: 1"], "co2_smoothing": "median"}}
+    assert diff_zone_mapping(MAPPING, new_mapping) == ([], [], ["Floor 1: 1"])
+
+
+def test_index_matches_a_full_rebuild():
+    index = DeviceZoneIndex("iaq_device_ids")
+    assert index.update(MAPPING, list(MAPPING)) == (["iaq-1", "iaq-2", "iaq-shared"], [])
+    assert index.device_zones["iaq-shared"] == ["Floor 1: 2", "Floor 1: 3"]
+
+    new_mapping = {
+        "Floor 1: 1": MAPPING["Floor 1: 1"],
+        "Floor 1: 2": {"iaq_device_ids": ["iaq-2"]},
+        "Floor 1: 4": {"iaq_device_ids": ["iaq-4", "iaq-shared"]},
+    }
+    added, removed, changed = diff_zone_mapping(MAPPING, new_mapping)
+    assert index.update(new_mapping, added + removed + changed) == (["iaq-4"], [])
+
+    rebuilt = DeviceZoneIndex("iaq_device_ids")
+    rebuilt.update(new_mapping, list(new_mapping))
+    assert {device_id: sorted(zones) for device_id, zones in index.device_zones.items()} == \
+           {device_id: sorted(zones) for device_id, zones in rebuilt.device_zones.items()}
+    assert index.zone_device_ids("Floor 1: 3") == []
+
+
+def test_moved_device_keeps_its_zone_list():
+    index = DeviceZoneIndex("fcu_device_ids")
+    index.update(MAPPING, list(MAPPING))
+    zone_list = index.device_zones["fcu-1"]
+
+    new_mapping = {**MAPPING, "Floor 1: 1": {"fcu_device_ids": []}, "Floor 1: 3": {"fcu_device_ids": ["fcu-3", "fcu-1"]}}
+    assert index.update(new_mapping, ["Floor 1: 1", "Floor 1: 3"]) == ([], [])
+    # references to the zone list (ex. topic routes) stay valid
+    assert index.device_zones["fcu-1"] is zone_list
+    assert zone_list == ["Floor 1: 3"]
+
+    assert index.update({}, ["Floor 1: 3"]) == ([], ["fcu-3", "fcu-1"])
+    assert "fcu-1" not in index
@@ -0,0 +1,40 @@
+from agentcommon.metrics import StageMetrics
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = StageMetrics(bounds=(0.01, 0.1))
+    for seconds in (0.005, 0.05, 0.05, 1.0):
+        metrics.observe("query", seconds)
+    stage = metrics.snapshot()["stages"]["query"]
+    assert stage["count"] == 4
+    assert stage["max"] == 1.0
+    assert stage["buckets"] == [[0.01, 1], [0.1, 3], ["+Inf", 4]]
+
+
+def test_timed_records_failed_calls():
+    metrics = StageMetrics()
+
+    @metrics.timed("decode")
+    def decode(fail):
+        if fail:
+            raise ValueError("invalid payload")
+        return "ok"
+
+    assert decode(False) == "ok"
+    try:
+        decode(True)
+    except ValueError:
+        pass
+    assert metrics.snapshot()["stages"]["decode"]["count"] == 2
+
+
+def test_prometheus_text(tmp_path):
+    metrics = StageMetrics(bounds=(0.1,))
+    metrics.observe('say "hi"', 0.05)
+    path = str(tmp_path / "fcuagent.prom")
+    metrics.write_prometheus(path, namespace="fcuagent", labels={"identity": "fcu_control"})
+    with open(path) as prometheus_file:
+        text = prometheus_file.read()
+    assert '# TYPE fcuagent_stage_duration_seconds histogram' in text
+    assert 'fcuagent_stage_duration_seconds_bucket{stage="say \\"hi\\"",identity="fcu_control",le="+Inf"} 1' in text
+    assert 'fcuagent_stage_duration_seconds_count{stage="say \\"hi\\"",identity="fcu_control"} 1' in text
@@ -0,0 +1,34 @@
+import json
+import os
+
+import pytest
+
+from agentcommon.profiling import TickProfiler
+
+
+def work():
+    return sum(i * i for i in range(10000))
+
+
+def test_tick_session_ends_after_full_ticks(tmp_path):
+    profiler = TickProfiler(name="fcuagent")
+    profiler.start(str(tmp_path), ticks=2, memory=True)
+    for full_tick in (True, False, True):
+        profiler.tick_started()
+        work()
+        result = profiler.tick_finished(full_tick=full_tick)
+    assert not profiler.active
+    assert result["ticks"] == 2
+    assert result is profiler.last_result
+    for key in ("pstats_file", "allocators_file", "summary_file"):
+        assert os.path.isfile(result[key])
+    with open(result["summary_file"]) as summary_file:
+        assert json.load(summary_file)["ticks"] == 2
+
+
+def test_nothing_to_profile_is_rejected(tmp_path):
+    profiler = TickProfiler()
+    with pytest.raises(ValueError):
+        profiler.start(str(tmp_path), cpu=False, memory=False)
+    assert not profiler.active
+    assert profiler.stop() is None
@@ -0,0 +1,31 @@
+import json
+
+import numpy as np
+
+from agentcommon.snapshot import SNAPSHOT_VERSION, load_snapshot, save_snapshot
+
+NOW = 1700000000.0
+
+
+def test_snapshot_is_plain_json(tmp_path):
+    path = str(tmp_path / "runtime_state.json")
+    save_snapshot(path, {"setpoint_offset": {"Floor 1: 1": np.float64(0.5)}, "count": np.int64(3)}, unix_timestamp=NOW)
+    with open(path) as snapshot_file:
+        payload = json.load(snapshot_file)
+    assert payload == {"version": SNAPSHOT_VERSION, "unix_timestamp": NOW,
+                       "state": {"setpoint_offset": {"Floor 1: 1": 0.5}, "count": 3}}
+
+
+def test_old_unreadable_or_other_version_snapshots_are_ignored(tmp_path):
+    path = str(tmp_path / "runtime_state.json")
+    save_snapshot(path, {"a": 1}, unix_timestamp=NOW - 7200)
+    assert load_snapshot(path, max_age_seconds=3600, now=NOW) == (None, None)
+
+    with open(path, "w") as snapshot_file:
+        json.dump({"version": SNAPSHOT_VERSION - 1, "unix_timestamp": NOW, "state": {"a": 1}}, snapshot_file)
+    assert load_snapshot(path, now=NOW) == (None, None)
+
+    with open(path, "wb") as snapshot_file:
+        snapshot_file.write(b"\x80\x05not json")
+    assert load_snapshot(path, now=NOW) == (None, None)
+    assert load_snapshot(str(tmp_path / "missing.json")) == (None, None)
@@ -9,6 +9,7 @@ Other agent integration:
 To start the agent, run the following commands:
 ```
 vctl remove --tag fcu_control
+pip install ~/alto_os/Agents/Services/AgentCommon
 python ~/volttron/scripts/install-agent.py -s ~/alto_os/Agents/Services/FCUAgent -t fcu_control -i fcu_control
 vctl config store fcu_control config ~/alto_os/Agents/Services/FCUAgent/config
 vctl enable --tag fcu_control
@@ -19,14 +20,29 @@ vctl start --tag fcu_control
 __docformat__ = 'reStructuredText'
 
 import logging
+import os
 import sys
 import json
+import time
+import heapq
+import gevent
+import gevent.pool
 import pendulum
 from volttron.platform.agent import utils
 from volttron.platform.vip.agent import Agent, Core, RPC
 from volttron.platform.scheduling import periodic, cron
+from agentcommon.config_diff import DeviceZoneIndex, diff_zone_mapping
+from agentcommon.command_publisher import CommandTracker, COMMAND_BATCH_MESSAGE_TYPE, pack_command_batch
+from agentcommon.profiling import TickProfiler, agent_data_dir
+from agentcommon.snapshot import SNAPSHOT_FILE_NAME, save_snapshot, load_snapshot
 
-from .automation_logic import fcu_control_logics
+from .automation_logic import IAQ_DATAPOINTS, FCU_DATAPOINTS, construct_control_message, fcu_control_decision, get_data, get_zones_data, get_zones_device_ids, get_zones_lookback, split_zones_data, split_device_data, split_aggregated_zones_data
+from .data_handler import get_connection_pool_stats, close_connection_pools
+from .setpoint_table import SetpointTable
+from .sensor_window import SensorWindow, _message_timestamp
+from .bucket_aggregator import BucketAggregator, IAQ_AGGREGATIONS, FCU_AGGREGATIONS
+from .feedback_store import FeedbackStore, FEEDBACK_TYPES
+from .metrics import STAGE_METRICS
 
 _log = logging.getLogger(__name__)
 utils.setup_logging()
@@ -87,10 +103,50 @@ class Fcuagent(Agent):
         self.lookback_interval = self.automation.get('lookback_interval', 15)
         self.feedback_expired_minutes = self.automation.get('feedback_expired_minutes', 30)
         self.feedback_mqtt_topic = self.automation.get('feedback_mqtt_topic', "rl_correct/subiot/example/command")
+        self.feedback_coalesce_seconds = self.automation.get('feedback_coalesce_seconds', 5)
+        self.batch_query = self.automation.get('batch_query', False)
+        self.streaming = self.automation.get('streaming', False)
+        self.streaming_iaq_topic = self.automation.get('streaming_iaq_topic', "sensor/tuya_air_quality/{device_id}/event")
+        self.streaming_fcu_topic = self.automation.get('streaming_fcu_topic', "sensor/fcu/{device_id}/event")
+        self.streaming_gap_minutes = self.automation.get('streaming_gap_minutes', 5)
+        self.incremental_aggregation = self.automation.get('incremental_aggregation', False)
+        self.server_side_aggregation = self.automation.get('server_side_aggregation', False)
+        self.decision_cache_ttl_seconds = self.automation.get('decision_cache_ttl_seconds', 60)
+        self.change_only_commands = self.automation.get('change_only_commands', False)
+        self.command_keepalive_seconds = self.automation.get('command_keepalive_seconds', 900)
+        self.command_ack_topic = self.automation.get('command_ack_topic', None)
+        self.command_ack_timeout_seconds = self.automation.get('command_ack_timeout_seconds', 120)
+        self.batch_commands = self.automation.get('batch_commands', False)
+        self.command_batch_topic = self.automation.get('command_batch_topic', "mqtt/fcu_control/batch/command")
+        self.concurrent_zones = self.automation.get('concurrent_zones', False)
+        self.zone_concurrency = self.automation.get('zone_concurrency', 8)
+        self.tick_deadline_seconds = self.automation.get('tick_deadline_seconds', 60)
+        self.metrics_topic = self.automation.get('metrics_topic', "metrics/fcu_automation/stages")
+        self.metrics_publish_interval = self.automation.get('metrics_publish_interval', 60)
+        self.metrics_prometheus_path = self.automation.get('metrics_prometheus_path', None)
+        self.snapshot_interval = self.automation.get('snapshot_interval', 60)
+        self.snapshot_max_age_seconds = self.automation.get('snapshot_max_age_seconds', 3600)
+        self.data_dir = self.automation.get('data_dir', None)
         self.vr = self.apmv.get('vr', 0.1)
         self.met = self.apmv.get('met', 1.1)
         self.clo = self.apmv.get('clo', 0.65)
         self.a_coefficient = self.apmv.get('a_coefficient', 0.2)
+
+        # streaming mode: in-memory window of IAQ/FCU telemetry from the message bus, CrateDB only backfills gaps
+        self.sensor_window = SensorWindow(window_minutes=get_zones_lookback(self.thermal_zone_mapping, self.lookback_interval))
+        self._telemetry_topics = dict()  # {<topic>: <device_id>}
+        self._iaq_telemetry_topics = set()
+        # device -> zones of the mapping, updated zone by zone on config changes
+        self.iaq_device_index = DeviceZoneIndex("iaq_device_ids")
+        self.fcu_device_index = DeviceZoneIndex("fcu_device_ids")
+        # streaming mode with `incremental_aggregation`: running 5-minute buckets updated on every telemetry message
+        _retention_minutes = get_zones_lookback(self.thermal_zone_mapping, self.lookback_interval) + 5
+        self.iaq_aggregator = BucketAggregator(IAQ_AGGREGATIONS, retention_minutes=_retention_minutes)
+        self.fcu_aggregator = BucketAggregator(FCU_AGGREGATIONS, retention_minutes=_retention_minutes)
+
+        # aPMV -> setpoint lookup table, built on `configure` and rebuilt only when the `apmv` config changes
+        self.setpoint_table = None
+        self._setpoint_table_key = None
         
         # FCU setpoint offset based on recent tenant feedbacks
         self.setpoint_offset = dict()
@@ -101,6 +157,43 @@ class Fcuagent(Agent):
         self.setpoint_random_offset_options = [0.1, 0.2]  # select small value so that Niagara will always ceil-round the setpoint value
         self.setpoint_random_offset_state = False
 
+        # feedback expiry timer: heap of (<expiry_unix_timestamp>, <zone_name>) and the single scheduled expiry event
+        self._feedback_expiry_heap = list()
+        self._feedback_expiry_event = None
+        self._feedback_expiry_deadline = None
+
+        # feedback coalescing: pending re-evaluation event per zone, and event/evaluation counters
+        self._pending_zone_evaluations = dict()  # {<zone_name>: <scheduled event>}
+        self.feedback_metrics = {"events_received": 0, "events_coalesced": 0, "evaluations_run": 0}
+
+        # last control decision of each zone (base setpoint before offsets, aPMV, data), reused by feedback re-evaluations
+        # for `decision_cache_ttl_seconds` (full ticks always decide on fresh data)
+        self.zone_decisions = dict()  # {<zone_name>: {"unix_timestamp": <float>, "decision": <dict from `fcu_control_decision`>}}
+
+        # last command per FCU, to publish only changed commands (`change_only_commands`) plus keepalive resends
+        self.command_tracker = CommandTracker(compare_keys=("mode", "set_temperature"))
+
+        # scheduled publication of the per-stage timings (`STAGE_METRICS`) on `metrics_topic`
+        self._metrics_event = None
+
+        # `fcu_automation` cron job, replaced when `trigger_interval` changes
+        self._automation_event = None
+        self._automation_interval = None
+
+        # on-demand cProfile / tracemalloc session (`start_profiling` RPC), no restart nor config change needed
+        self.profiler = TickProfiler(name="fcuagent")
+        self._profiling_stop_event = None
+
+        # warm start: runtime state saved every `snapshot_interval` seconds to the agent data directory (`data_dir`, else the
+        # one VOLTTRON created for the agent), reloaded on start
+        self._snapshot_event = None
+        self._configured = False
+
+        # zones which missed `tick_deadline_seconds` on the last `fcu_automation` run (concurrent mode), and their
+        # greenlets left to finish in the background (a killed greenlet could be in the middle of a CrateDB query)
+        self.late_zones = list()
+        self._late_greenlets = dict()  # {<zone_name>: <greenlet>}
+
         self.default_config = {
             "cratedb_config": self.cratedb_config,
             "automation": self.automation,
@@ -114,6 +207,30 @@ class Fcuagent(Agent):
             "lookback_interval": self.lookback_interval,
             "feedback_expired_minutes": self.feedback_expired_minutes,
             "feedback_mqtt_topic": self.feedback_mqtt_topic,
+            "feedback_coalesce_seconds": self.feedback_coalesce_seconds,
+            "batch_query": self.batch_query,
+            "streaming": self.streaming,
+            "streaming_iaq_topic": self.streaming_iaq_topic,
+            "streaming_fcu_topic": self.streaming_fcu_topic,
+            "streaming_gap_minutes": self.streaming_gap_minutes,
+            "incremental_aggregation": self.incremental_aggregation,
+            "server_side_aggregation": self.server_side_aggregation,
+            "decision_cache_ttl_seconds": self.decision_cache_ttl_seconds,
+            "change_only_commands": self.change_only_commands,
+            "command_keepalive_seconds": self.command_keepalive_seconds,
+            "command_ack_topic": self.command_ack_topic,
+            "command_ack_timeout_seconds": self.command_ack_timeout_seconds,
+            "batch_commands": self.batch_commands,
+            "command_batch_topic": self.command_batch_topic,
+            "concurrent_zones": self.concurrent_zones,
+            "zone_concurrency": self.zone_concurrency,
+            "tick_deadline_seconds": self.tick_deadline_seconds,
+            "metrics_topic": self.metrics_topic,
+            "metrics_publish_interval": self.metrics_publish_interval,
+            "metrics_prometheus_path": self.metrics_prometheus_path,
+            "snapshot_interval": self.snapshot_interval,
+            "snapshot_max_age_seconds": self.snapshot_max_age_seconds,
+            "data_dir": self.data_dir,
             "vr": self.vr,
             "met": self.met,
             "clo": self.clo,
@@ -148,6 +265,17 @@ class Fcuagent(Agent):
             _log.error("ERROR PROCESSING CONFIGURATION: {}".format(e))
             return
 
+        # drop pooled connections opened with the previous database config
+        if cratedb_config != self.cratedb_config:
+            close_connection_pools()
+
+        # settings of the running config, to rebuild only what the new one changes
+        _previous_mapping = self.thermal_zone_mapping
+        _previous_settings = (self.automation, self.apmv, self.cratedb_config)
+        _previous_feedback_expired_minutes = self.feedback_expired_minutes
+        _previous_subscriptions = (self.feedback_mqtt_topic, self.command_ack_topic, self.streaming,
+                                   self.streaming_iaq_topic, self.streaming_fcu_topic)
+
         self.cratedb_config = cratedb_config
         self.automation = automation
         self.apmv = apmv
@@ -161,36 +289,144 @@ class Fcuagent(Agent):
         self.lookback_interval = self.automation.get('lookback_interval', 15)
         self.feedback_expired_minutes = self.automation.get('feedback_expired_minutes', 30)
         self.feedback_mqtt_topic = self.automation.get('feedback_mqtt_topic', "rl_correct/subiot/example/command")
+        self.feedback_coalesce_seconds = self.automation.get('feedback_coalesce_seconds', 5)
+        self.batch_query = self.automation.get('batch_query', False)
+        self.streaming = self.automation.get('streaming', False)
+        self.streaming_iaq_topic = self.automation.get('streaming_iaq_topic', "sensor/tuya_air_quality/{device_id}/event")
+        self.streaming_fcu_topic = self.automation.get('streaming_fcu_topic', "sensor/fcu/{device_id}/event")
+        self.streaming_gap_minutes = self.automation.get('streaming_gap_minutes', 5)
+        self.incremental_aggregation = self.automation.get('incremental_aggregation', False)
+        self.server_side_aggregation = self.automation.get('server_side_aggregation', False)
+        self.decision_cache_ttl_seconds = self.automation.get('decision_cache_ttl_seconds', 60)
+        self.change_only_commands = self.automation.get('change_only_commands', False)
+        self.command_keepalive_seconds = self.automation.get('command_keepalive_seconds', 900)
+        self.command_ack_topic = self.automation.get('command_ack_topic', None)
+        self.command_ack_timeout_seconds = self.automation.get('command_ack_timeout_seconds', 120)
+        self.batch_commands = self.automation.get('batch_commands', False)
+        self.command_batch_topic = self.automation.get('command_batch_topic', "mqtt/fcu_control/batch/command")
+        self.concurrent_zones = self.automation.get('concurrent_zones', False)
+        self.zone_concurrency = self.automation.get('zone_concurrency', 8)
+        self.tick_deadline_seconds = self.automation.get('tick_deadline_seconds', 60)
+        self.metrics_topic = self.automation.get('metrics_topic', "metrics/fcu_automation/stages")
+        self.metrics_publish_interval = self.automation.get('metrics_publish_interval', 60)
+        self.metrics_prometheus_path = self.automation.get('metrics_prometheus_path', None)
+        self.snapshot_interval = self.automation.get('snapshot_interval', 60)
+        self.snapshot_max_age_seconds = self.automation.get('snapshot_max_age_seconds', 3600)
+        self.data_dir = self.automation.get('data_dir', None)
         self.vr = self.apmv.get('vr', 0.1)
         self.met = self.apmv.get('met', 1.1)
         self.clo = self.apmv.get('clo', 0.65)
         self.a_coefficient = self.apmv.get('a_coefficient', 0.2)
+        self._update_setpoint_table()
+        self.sensor_window.window_minutes = get_zones_lookback(self.thermal_zone_mapping, self.lookback_interval)
+        self.iaq_aggregator.retention_minutes = self.sensor_window.window_minutes + 5
+        self.fcu_aggregator.retention_minutes = self.sensor_window.window_minutes + 5
         
-        # reset setpoint offset
-        self.setpoint_offset = dict()
-        for zone_name in self.thermal_zone_mapping.keys():
-            self.setpoint_offset[zone_name] = 0
-        
-        # update state for tenant feedback in each thermal zone
-        """ schema
-        self.tenant_feedback_states = {
-            "zone_1": {
-                "Too Hot": [{"unix_timestamp": 1234567890, "line_id": "U123123123"},
-                            {"unix_timestamp": 1234567890, "line_id": "U231231231"}],
-                "Too Cold": []
-            }
-        }
+        # tracker settings apply in place, the last commands are kept
+        self.command_tracker.keepalive_seconds = self.command_keepalive_seconds
+        self.command_tracker.track_acks = bool(self.command_ack_topic)
+        self.command_tracker.ack_timeout_seconds = self.command_ack_timeout_seconds
+
+        if not self._configured:
+            # start: build every zone, then warm start from the last snapshot
+            self.tenant_feedback_states = FeedbackStore()
+            self._update_zones(None, update_subscriptions=False)
+            self._restore_runtime_state(self._load_snapshot())
+            self._configured = True
+            self._create_subscriptions()
+        else:
+            # cached decisions depend on the thresholds, aPMV parameters and data source
+            if (self.automation, self.apmv, self.cratedb_config) != _previous_settings:
+                self.zone_decisions = dict()
+            if self.feedback_expired_minutes != _previous_feedback_expired_minutes:
+                self._rebuild_feedback_expiry()
+            _resubscribe = (self.feedback_mqtt_topic, self.command_ack_topic, self.streaming,
+                            self.streaming_iaq_topic, self.streaming_fcu_topic) != _previous_subscriptions
+            self._update_zones(_previous_mapping, update_subscriptions=not _resubscribe)
+            if _resubscribe:
+                self._create_subscriptions()
+        _log.debug(f"{self.core.identity}: tenant feedback states={self.tenant_feedback_states}")
+
+        self._schedule_metrics_publish()
+        self._schedule_snapshot()
+        self._schedule_automation()
+
+    def _schedule_automation(self):
+        """Schedule the `fcu_automation` cron job, replacing the previous one only when `trigger_interval` changed"""
+        if (self._automation_event is not None) and (self._automation_interval == int(self.trigger_interval)):
+            return
+        if self._automation_event is not None:
+            self._automation_event.cancel()
+        self._automation_interval = int(self.trigger_interval)
+        self._automation_event = self.core.schedule(cron(f"*/{self._automation_interval} * * * *"), self.fcu_automation)
+
+    def _update_zones(self, previous_mapping: dict=None, update_subscriptions: bool=True):
         """
-        self.tenant_feedback_states = dict()
-        for zone_name in self.thermal_zone_mapping.keys():
-            self.tenant_feedback_states[str(zone_name)] = {"Too Hot": list(), "Too Cold": list()}
-        _log.debug(f"{self.core.identity}: initialized self.tenant_feedback_states={self.tenant_feedback_states}")
+        Apply the `thermal_zone_mapping` changes since `previous_mapping` (None: every zone)
 
-        self._create_subscriptions()
-        
-        # trigger FCU automation function
-        self.core.schedule(cron(f"*/{int(self.trigger_interval)} * * * *"), self.fcu_automation)
-        self.core.schedule(cron("0 */2 * * *"), self._periodic_check_feedback_states)  # recheck and update feedback states every X hours
+        Only added, removed and changed zones are touched. Added zones start without feedback and with a 0 offset,
+        removed zones lose their feedbacks, offset, cached decision and pending evaluation, changed zones (other devices)
+        lose their cached decision. Devices no longer mapped leave the streaming windows and the command tracker, and
+        with `update_subscriptions` the telemetry topics of added / removed devices are (un)subscribed.
+        """
+        if previous_mapping is None:
+            updated_zone_names = list(self.thermal_zone_mapping.keys())
+            removed_zone_names = [zone_name for zone_name in list(self.setpoint_offset.keys()) + self.tenant_feedback_states.zone_names()
+                                  if zone_name not in self.thermal_zone_mapping]
+        else:
+            added_zone_names, removed_zone_names, changed_zone_names = diff_zone_mapping(previous_mapping, self.thermal_zone_mapping)
+            updated_zone_names = added_zone_names + changed_zone_names
+            if len(updated_zone_names) + len(removed_zone_names) <= 0:
+                return
+
+        for zone_name in removed_zone_names:
+            self.tenant_feedback_states.remove_zone(zone_name)
+            self.setpoint_offset.pop(zone_name, None)
+            self.zone_decisions.pop(zone_name, None)
+            _event = self._pending_zone_evaluations.pop(zone_name, None)
+            if _event is not None:
+                _event.cancel()
+        for zone_name in updated_zone_names:
+            self.tenant_feedback_states.add_zone(zone_name)
+            self.setpoint_offset.setdefault(zone_name, 0)
+            self.zone_decisions.pop(zone_name, None)
+
+        added_iaq_ids, removed_iaq_ids = self.iaq_device_index.update(self.thermal_zone_mapping, updated_zone_names + removed_zone_names)
+        added_fcu_ids, removed_fcu_ids = self.fcu_device_index.update(self.thermal_zone_mapping, updated_zone_names + removed_zone_names)
+        self.sensor_window.remove_devices(removed_iaq_ids + removed_fcu_ids)
+        self.iaq_aggregator.remove_devices(removed_iaq_ids)
+        self.fcu_aggregator.remove_devices(removed_fcu_ids)
+        self.command_tracker.forget([message["topic"] for message in construct_control_message(removed_fcu_ids)])
+
+        if update_subscriptions and self.streaming:
+            for template, device_ids in ((self.streaming_iaq_topic, removed_iaq_ids), (self.streaming_fcu_topic, removed_fcu_ids)):
+                for device_id in device_ids:
+                    topic = template.format(device_id=device_id)
+                    self._telemetry_topics.pop(topic, None)
+                    self._iaq_telemetry_topics.discard(topic)
+                    self.vip.pubsub.unsubscribe(peer='pubsub', prefix=topic, callback=self._handle_telemetry)
+            for template, device_ids in ((self.streaming_iaq_topic, added_iaq_ids), (self.streaming_fcu_topic, added_fcu_ids)):
+                for device_id in device_ids:
+                    topic = template.format(device_id=device_id)
+                    self._telemetry_topics[topic] = device_id
+                    if template == self.streaming_iaq_topic:
+                        self._iaq_telemetry_topics.add(topic)
+                    _log.debug(f"Subscribing to topic: {topic}")
+                    self.vip.pubsub.subscribe(peer='pubsub', prefix=topic, callback=self._handle_telemetry)
+        _log.info(f"{self.core.identity}: Zones updated: {len(updated_zone_names)} added / changed, {len(removed_zone_names)} removed")
+
+    def _update_setpoint_table(self):
+        """Build the aPMV -> setpoint lookup table when the `apmv` config has changed"""
+        rh_step = self.apmv.get('setpoint_table_rh_step', 1.0)
+        mrt_range = self.apmv.get('setpoint_table_mrt_range', None)
+        _key = (self.vr, self.met, self.clo, self.a_coefficient, rh_step, json.dumps(mrt_range))
+        if (self.setpoint_table is not None) and (_key == self._setpoint_table_key):
+            return
+
+        self.setpoint_table = SetpointTable(vr=self.vr, met=self.met, clo=self.clo, a_coefficient=self.a_coefficient,
+                                            rh_step=rh_step, mrt_range=mrt_range)
+        self._setpoint_table_key = _key
+        _log.debug(f"{self.core.identity}: built setpoint table for apmv={self.apmv}")
 
     def _create_subscriptions(self):
         """
@@ -200,16 +436,68 @@ class Fcuagent(Agent):
         self.vip.pubsub.unsubscribe("pubsub", None, None)
 
         # handle message from `subiot` agent on Tenant feedback
-        self.vip.pubsub.subscribe(peer='pubsub',
-                                prefix=self.feedback_mqtt_topic,
-                                callback=self._handle_tenant_feedback)
-        
-        # TODO: handle message from `room` agent on FCU IoT data from tenant manual controls
         # REMARK: DEDE zone names not fully sync with LineOA Tenant Feedback zone names yet
         self.vip.pubsub.subscribe(peer='pubsub',
                                 prefix=self.feedback_mqtt_topic,
                                 callback=self._handle_tenant_feedback)
 
+        # acknowledgements of sent commands, {"topic": <command topic>}
+        if self.command_ack_topic:
+            self.vip.pubsub.subscribe(peer='pubsub',
+                                      prefix=self.command_ack_topic,
+                                      callback=self._handle_command_ack)
+
+        # TODO: handle message from `room` agent on FCU IoT data from tenant manual controls
+
+        # streaming mode: IAQ and FCU telemetry feeding `self.sensor_window`
+        self._telemetry_topics = dict()
+        self._iaq_telemetry_topics = set()
+        if self.streaming:
+            for device_id in self.iaq_device_index.device_zones.keys():
+                self._telemetry_topics[self.streaming_iaq_topic.format(device_id=device_id)] = device_id
+                self._iaq_telemetry_topics.add(self.streaming_iaq_topic.format(device_id=device_id))
+            for device_id in self.fcu_device_index.device_zones.keys():
+                self._telemetry_topics[self.streaming_fcu_topic.format(device_id=device_id)] = device_id
+            for topic in self._telemetry_topics.keys():
+                _log.debug(f"Subscribing to topic: {topic}")
+                self.vip.pubsub.subscribe(peer='pubsub',
+                                          prefix=topic,
+                                          callback=self._handle_telemetry)
+
+    def _handle_telemetry(self, peer, sender, bus, topic, headers, message):
+        """Callback triggered by IAQ/FCU telemetry in streaming mode, keep the reading in `self.sensor_window`"""
+        device_id = self._telemetry_topics.get(topic)
+        if device_id is None:
+            return
+
+        if isinstance(message, str):
+            try:
+                message = json.loads(message)
+            except ValueError:
+                _log.debug(f"{self.core.identity}: Invalid telemetry payload on topic `{topic}`: {message}")
+                return
+        if isinstance(message, dict):
+            if self.incremental_aggregation:
+                # set the timestamp once so that the window and the aggregator agree
+                if _message_timestamp(message) is None:
+                    message = {**message, "unix_timestamp": time.time()}
+                aggregator = self.iaq_aggregator if topic in self._iaq_telemetry_topics else self.fcu_aggregator
+                aggregator.add_sample(device_id, _message_timestamp(message), message)
+            self.sensor_window.add_message(device_id, message)
+
+    def _handle_command_ack(self, peer, sender, bus, topic, headers, message):
+        """Callback triggered when the MQTT agent / Niagara confirms a command: {"topic": <command topic>}"""
+        if isinstance(message, str):
+            try:
+                message = json.loads(message)
+            except ValueError:
+                message = dict()
+        _command_topic = message.get("topic") if isinstance(message, dict) else None
+        if _command_topic is None:
+            _log.debug(f"{self.core.identity}: Invalid command acknowledgement on topic `{topic}`: {message}")
+            return
+        self.command_tracker.acknowledge(str(_command_topic))
+
     def _handle_tenant_feedback(self, peer, sender, bus, topic, headers, message):
         """
         Callback triggered by the subscription setup using the topic from the agent's config file
@@ -237,61 +525,117 @@ class Fcuagent(Agent):
         line_id = message.get("lineId")
         
         _log.debug(f"{self.core.identity}: Received Tenant Feedback: {message}")
+        self.feedback_metrics["events_received"] += 1
         
-        # update to `self.tenant_feedback_states`
-        self._remove_expired_feedbacks(zone_name, self.feedback_expired_minutes)  # handle expired feedbacks
+        # update to `self.tenant_feedback_states` (expired feedbacks are removed by `_handle_feedback_expiry`)
         self._append_new_feedback(zone_name, feedback, line_id)  # append new feedback
 
         # calculate FCU offset of the selected zone
         self._update_fcu_setpoint_offset(zone_name)
         
         # trigger FCU automation control: apply FCU setpoint offset, construct MQTT messages, and send to MQTTAgent
-        # TODO: update FCU setpoint based on current setpoint value (currently recalculate again from aPMV in `fcu_control_logics` function)
-        self.fcu_automation(selected_zone_name=zone_name)
-    
-    def _remove_expired_feedbacks(self, zone_name, expired_minutes: int=30):
-        """Remove expired feedbacks from `self.tenant_feedback_states` when the feedback is older than 30 minutes"""
-        _now = pendulum.now(tz="Asia/Bangkok")
-        _tenant_feedback_state = self.tenant_feedback_states.get(str(zone_name), dict())
+        # (the zone's cached decision is reused when recent, only the new offset is applied to its base setpoint)
+        self._request_zone_evaluation(zone_name)
 
-        for feedback_type, feedbacks in _tenant_feedback_state.items():
-            for feedback in feedbacks:
-                _feedback_time = pendulum.from_timestamp(feedback.get("unix_timestamp"), tz="Asia/Bangkok")
-                _diff = _now.diff(_feedback_time)
-                if _diff.in_minutes() > expired_minutes:
-                    _tenant_feedback_state[feedback_type].remove(feedback)
+    def _request_zone_evaluation(self, zone_name):
+        """
+        Re-evaluate a zone after a feedback change. Requests arriving within `feedback_coalesce_seconds` of the first
+        pending one are merged into a single `fcu_automation` run of the zone.
+        """
+        if zone_name in self._pending_zone_evaluations:
+            self.feedback_metrics["events_coalesced"] += 1
+            return
+        if self.feedback_coalesce_seconds <= 0:
+            self._run_zone_evaluation(zone_name)
+            return
+        self._pending_zone_evaluations[zone_name] = self.core.schedule(
+            pendulum.from_timestamp(time.time() + self.feedback_coalesce_seconds), self._run_zone_evaluation, zone_name)
 
-        # update feedback state
-        self.tenant_feedback_states[str(zone_name)] = _tenant_feedback_state
+    def _run_zone_evaluation(self, zone_name):
+        self._pending_zone_evaluations.pop(zone_name, None)
+        self.feedback_metrics["evaluations_run"] += 1
+        self.fcu_automation(selected_zone_name=zone_name)
 
+    def _reset_pending_zone_evaluations(self):
+        for _event in self._pending_zone_evaluations.values():
+            _event.cancel()
+        self._pending_zone_evaluations = dict()
+    
     def _append_new_feedback(self, zone_name, feedback_type, line_id):
-        """Append new feedback to `self.tenant_feedback_states` when the feedback is not in the list"""
-        _now = pendulum.now(tz="Asia/Bangkok")
-        _tenant_feedback_state = self.tenant_feedback_states.get(str(zone_name), dict())
-
+        """Append new feedback to `self.tenant_feedback_states` when the same line_id hasn't given it yet"""
         # check if feedback_type is valid
-        if _tenant_feedback_state.get(feedback_type) is None:
-            _tenant_feedback_state = {"Too Hot": list(), "Too Cold": list()}
+        if feedback_type not in FEEDBACK_TYPES:
             _log.exception(f"{self.core.identity}: invalid feedback zone name: zone_name={zone_name} feedback_type={feedback_type}")
+            return
+        _now = time.time()
+        if self.tenant_feedback_states.add(zone_name, feedback_type, line_id, unix_timestamp=_now):
+            self._push_feedback_expiry(zone_name, self.tenant_feedback_states.expiry_time(_now, self.feedback_expired_minutes))
+
+    def _rebuild_feedback_expiry(self):
+        """Reschedule the expiry of every kept feedback, after a `feedback_expired_minutes` change"""
+        self._reset_feedback_expiry()
+        for zone_name, zone_feedbacks in self.tenant_feedback_states.to_dict().items():
+            for type_feedbacks in zone_feedbacks.values():
+                for feedback in type_feedbacks:
+                    heapq.heappush(self._feedback_expiry_heap, (self.tenant_feedback_states.expiry_time(
+                        feedback["unix_timestamp"], self.feedback_expired_minutes), zone_name))
+        self._schedule_feedback_expiry()
 
-        # check if the same line_id has already given feedback
-        if line_id not in [feedback.get("line_id") for feedback in _tenant_feedback_state[feedback_type]]:
-            _tenant_feedback_state[feedback_type].append({"unix_timestamp": _now.timestamp(), "line_id": line_id})
+    def _reset_feedback_expiry(self):
+        """Cancel the scheduled feedback expiry and clear pending deadlines"""
+        if self._feedback_expiry_event is not None:
+            self._feedback_expiry_event.cancel()
+        self._feedback_expiry_heap = list()
+        self._feedback_expiry_event = None
+        self._feedback_expiry_deadline = None
 
-        # update feedback state
-        self.tenant_feedback_states[str(zone_name)] = _tenant_feedback_state
+    def _push_feedback_expiry(self, zone_name, expiry_unix_timestamp: float):
+        heapq.heappush(self._feedback_expiry_heap, (expiry_unix_timestamp, str(zone_name)))
+        self._schedule_feedback_expiry()
+
+    def _schedule_feedback_expiry(self):
+        """Keep a single scheduled event at the earliest pending feedback expiry"""
+        _deadline = self._feedback_expiry_heap[0][0] if self._feedback_expiry_heap else None
+        if _deadline == self._feedback_expiry_deadline:
+            return
+        if self._feedback_expiry_event is not None:
+            self._feedback_expiry_event.cancel()
+            self._feedback_expiry_event = None
+        self._feedback_expiry_deadline = _deadline
+        if _deadline is not None:
+            self._feedback_expiry_event = self.core.schedule(pendulum.from_timestamp(_deadline), self._handle_feedback_expiry)
+
+    def _handle_feedback_expiry(self):
+        """Remove feedbacks reaching their expiry, re-evaluate only the zones whose setpoint offset changed"""
+        self._feedback_expiry_event = None
+        self._feedback_expiry_deadline = None
+        _now = time.time()
+
+        expired_zone_names = list()
+        while self._feedback_expiry_heap and (self._feedback_expiry_heap[0][0] <= _now):
+            _, zone_name = heapq.heappop(self._feedback_expiry_heap)
+            if zone_name not in expired_zone_names:
+                expired_zone_names.append(zone_name)
+        self._schedule_feedback_expiry()
+
+        for zone_name in expired_zone_names:
+            if self.tenant_feedback_states.expire(zone_name, self.feedback_expired_minutes, now=_now) <= 0:
+                continue
+            _setpoint_offset = self.setpoint_offset.get(zone_name, 0)
+            self._update_fcu_setpoint_offset(zone_name)
+            if self.setpoint_offset.get(zone_name, 0) != _setpoint_offset:
+                _log.debug(f"{self.core.identity}: feedbacks expired in zone `{zone_name}`, setpoint offset {_setpoint_offset} -> {self.setpoint_offset.get(zone_name, 0)}")
+                self._request_zone_evaluation(zone_name)
 
     def _update_fcu_setpoint_offset(self, zone_name):
-        zone_tenant_feedback = self.tenant_feedback_states.get(zone_name)
-        if zone_tenant_feedback is None:
+        if zone_name not in self.tenant_feedback_states:
             _log.exception(f"{self.core.identity}: (_update_fcu_setpoint_offset) invalid feedback zone name: zone_name={zone_name}")
             return
         # calculate FCU setpoint offset
-        count_hot = zone_tenant_feedback.get("Too Hot", list())
-        count_cold = zone_tenant_feedback.get("Too Cold", list())
-        if len(count_hot) > len(count_cold):
+        count_hot, count_cold = self.tenant_feedback_states.counts(zone_name)
+        if count_hot > count_cold:
             self.setpoint_offset[zone_name] = -1
-        elif len(count_hot) < len(count_cold):
+        elif count_hot < count_cold:
             self.setpoint_offset[zone_name] = 1
         else:
             self.setpoint_offset[zone_name] = 0
@@ -303,17 +647,89 @@ class Fcuagent(Agent):
         - selected_zone_name: str   : selected zone name to apply FCU automation controls
                                       if `selected_zone_name` is None, apply for all zones defined in config
         """
+        _tick_start = time.perf_counter()
+        self.profiler.tick_started()
+        selected_zones = {zone_name: device_infos for zone_name, device_infos in self.thermal_zone_mapping.items()
+                          if (selected_zone_name is None) or (zone_name == selected_zone_name)}
+        apmv_params = {"vr": self.vr, "met": self.met, "clo": self.clo, "a_coefficient": self.a_coefficient}
 
-        for zone_name, device_infos in self.thermal_zone_mapping.items():
-            # consider only selected zones: all zones or 1 zone
-            if (selected_zone_name is not None) and (zone_name != selected_zone_name):
-                continue
+        # fetch data only for zones without a recent cached decision
+        _now = time.time()
+        # the cache is resolved once here and the decisions are passed to `_evaluate_zone`, so a decision expiring
+        # during the tick can't leave a zone without data. Full (cron) ticks always decide on fresh data, the cache only
+        # serves the feedback re-evaluations of a zone between ticks
+        cached_decisions = dict()
+        if selected_zone_name is not None:
+            cached_decisions = {zone_name: self._get_cached_decision(zone_name, _now) for zone_name in selected_zones.keys()}
+        stale_zones = {zone_name: device_infos for zone_name, device_infos in selected_zones.items()
+                       if cached_decisions.get(zone_name) is None}
+
+        # streaming mode: use in-memory telemetry window
+        # batch mode: query data of every considered zone at once instead of 2 queries per zone
+        # (`server_side_aggregation`: CrateDB returns 5-minute buckets, 1 query for IAQ and 1 for FCU devices)
+        zones_data = dict()
+        if len(stale_zones) <= 0:
+            pass
+        elif self.streaming:
+            zones_data = self._get_streaming_zones_data(stale_zones, apmv_params)
+        elif self.batch_query:
+            zones_data = get_zones_data(cratedb_config=self.cratedb_config,
+                                        thermal_zone_mapping=stale_zones,
+                                        lookback=self.lookback_interval,
+                                        apmv_params=apmv_params,
+                                        server_side_aggregation=self.server_side_aggregation)
 
-            # update tenant feedback states (`fcu_automation` trigger from `_handle_tenant_feedback` alreday handle feedback-state update)
-            if selected_zone_name is None:
-                self._remove_expired_feedbacks(zone_name)  # handle expired feedbacks
-                self._update_fcu_setpoint_offset(zone_name)  # calculate FCU offset
+        # prepare every zone in mapping order so that feedback offsets and the alternating random offset don't depend
+        # on which zone finishes first
+        zone_jobs = list()
+        for zone_name, device_infos in selected_zones.items():
+            # `setpoint_offset` is kept up to date by `_handle_tenant_feedback` and `_handle_feedback_expiry`
+            # select setpoint random offset value, options: [0.1, 0.2]
+            setpoint_random_offset = self.setpoint_random_offset_options[int(self.setpoint_random_offset_state)]
+            # switch `setpoint_random_offset` state (betwen 0.1 <-> 0.2)
+            self.setpoint_random_offset_state = not self.setpoint_random_offset_state
+
+            iaq_df, fcu_df = zones_data.get(zone_name, (None, None))
+            zone_jobs.append((zone_name, device_infos, iaq_df, fcu_df, setpoint_random_offset, cached_decisions.get(zone_name)))
+
+        # `batch_commands`: collect commands of every zone and publish them in 1 envelope at the end of the tick
+        tick_messages = list()
+        if not self.concurrent_zones:
+            for zone_job in zone_jobs:
+                # publish command message to MQTTAgent -> MQTTBroker -> Niagara
+                if self.batch_commands:
+                    tick_messages.extend(self._evaluate_zone(*zone_job))
+                else:
+                    self.send_control_commands(self._evaluate_zone(*zone_job))
+        else:
+            zones_messages = self._evaluate_zones_concurrently(zone_jobs)
+            # publish in mapping order, so commands of a device keep their order across ticks
+            for zone_name, *_ in zone_jobs:
+                if self.batch_commands:
+                    tick_messages.extend(zones_messages.get(zone_name, list()))
+                else:
+                    self.send_control_commands(zones_messages.get(zone_name, list()))
+        if self.batch_commands:
+            self.send_control_commands(tick_messages)
+        # full ticks and feedback-triggered single zone runs are kept apart
+        STAGE_METRICS.observe("tick" if selected_zone_name is None else "zone_tick", time.perf_counter() - _tick_start)
+        _profiling_result = self.profiler.tick_finished(full_tick=selected_zone_name is None)
+        if _profiling_result is not None:
+            _log.info(f"{self.core.identity}: Profiling finished after {_profiling_result['ticks']} ticks: {_profiling_result['summary_file']}")
+
+        _log.debug(f"{self.core.identity}: CrateDB connection pool stats: {get_connection_pool_stats()}")
+
+    def _get_cached_decision(self, zone_name: str, now: float=None):
+        """Get the cached control decision of a zone, or None when there is none or it is older than the TTL"""
+        _cached = self.zone_decisions.get(zone_name)
+        now = time.time() if now is None else now
+        if (_cached is None) or (now - _cached["unix_timestamp"] >= self.decision_cache_ttl_seconds):
+            return None
+        return _cached["decision"]
 
+    def _evaluate_zone(self, zone_name: str, device_infos: dict, iaq_df, fcu_df, setpoint_random_offset: float, decision: dict=None):
+        """Compute the FCU control messages of 1 zone, with setpoint offsets applied, `decision` is the zone's cached decision if any"""
+        if decision is None:
             # IoT devices in 1 Thermal Zone
             iaq_device_ids = device_infos.get("iaq_device_ids", list())
             fcu_device_ids = device_infos.get("fcu_device_ids", list())
@@ -321,50 +737,123 @@ class Fcuagent(Agent):
             # TODO: handle case that can't access CrateDB cloud database
             # REMARK: FCU's datapoint names in DEDE and Synergy is different, please check carefully before deployment
             # REMARK: DEDE zone names not fully sync with LineOA Tenant Feedback zone names yet
-            mqtt_messages, _, _ = fcu_control_logics(cratedb_config=self.cratedb_config,
-                                                     iaq_device_ids=iaq_device_ids,
-                                                     fcu_device_ids=fcu_device_ids,
-                                                     aPMV_min=self.aPMV_min,
-                                                     aPMV_target=self.aPMV_target,
-                                                     aPMV_max=self.aPMV_max,
-                                                     rH_max=self.rH_max,
-                                                     vr=self.vr,
-                                                     met=self.met,
-                                                     clo=self.clo,
-                                                     a_coefficient=self.a_coefficient,
-                                                     lookback=self.lookback_interval,
-                                                     fixed_humidity=50)
-
-            # update FCU setpoint from offset value
-            fcu_setpoit_offset = self.setpoint_offset.get(zone_name, 0)
-            
-            # select setpoint random offset value, options: [0.1, 0.2]
-            setpoint_random_offset = self.setpoint_random_offset_options[int(self.setpoint_random_offset_state)]
+            decision = fcu_control_decision(cratedb_config=self.cratedb_config,
+                                            iaq_device_ids=iaq_device_ids,
+                                            fcu_device_ids=fcu_device_ids,
+                                            aPMV_min=self.aPMV_min,
+                                            aPMV_target=self.aPMV_target,
+                                            aPMV_max=self.aPMV_max,
+                                            rH_max=self.rH_max,
+                                            vr=self.vr,
+                                            met=self.met,
+                                            clo=self.clo,
+                                            a_coefficient=self.a_coefficient,
+                                            lookback=self.lookback_interval,
+                                            fixed_humidity=50,
+                                            iaq_df=iaq_df,
+                                            fcu_df=fcu_df,
+                                            preprocessed=(self.streaming or self.batch_query),
+                                            setpoint_table=self.setpoint_table)
+            if self.decision_cache_ttl_seconds > 0:
+                self.zone_decisions[zone_name] = {"unix_timestamp": time.time(), "decision": decision}
 
-            # apply FCU setpoint offset
-            # TODO: error handling on invalid MQTT message
-            for mqtt_message in mqtt_messages:
-                # set lower-bound action setpoint constraint
-                _message = mqtt_message.get("message", dict())
-                if _message["set_temperature"] <= 24:
-                    _message["set_temperature"] = 24
-                _message["set_temperature"] += fcu_setpoit_offset
-                
-                # apply random offset to prevent redundant commands on Niagara
-                _message["set_temperature"] += setpoint_random_offset
-                mqtt_message["message"] = _message
-
-            # publish command message to MQTTAgent -> MQTTBroker -> Niagara
-            self.send_control_commands(mqtt_messages)
-            
-            # switch `setpoint_random_offset` state (betwen 0.1 <-> 0.2)
-            self.setpoint_random_offset_state = not self.setpoint_random_offset_state
+        mqtt_messages = construct_control_message(decision["fcu_device_ids"], mode=decision["mode"], set_temperature=decision["set_temperature"])
+
+        # update FCU setpoint from offset value
+        fcu_setpoit_offset = self.setpoint_offset.get(zone_name, 0)
+
+        # apply FCU setpoint offset
+        # TODO: error handling on invalid MQTT message
+        for mqtt_message in mqtt_messages:
+            # set lower-bound action setpoint constraint
+            _message = mqtt_message.get("message", dict())
+            if _message["set_temperature"] <= 24:
+                _message["set_temperature"] = 24
+            _message["set_temperature"] += fcu_setpoit_offset
 
+            # apply random offset to prevent redundant commands on Niagara
+            _message["set_temperature"] += setpoint_random_offset
+            mqtt_message["message"] = _message
+
+        return mqtt_messages
+
+    def _evaluate_zones_concurrently(self, zone_jobs: list):
+        """
+        Evaluate zones in a greenlet pool of `zone_concurrency`, waiting at most `tick_deadline_seconds`.
+        Zones missing the deadline are reported in `self.late_zones` and their commands are not sent this tick. Their
+        greenlets are not killed but left to finish (their result is dropped), and a zone still running from an earlier
+        tick is not evaluated again until it has finished.
+        """
+        self._late_greenlets = {zone_name: greenlet for zone_name, greenlet in self._late_greenlets.items() if not greenlet.ready()}
+        _pool = gevent.pool.Pool(max(1, int(self.zone_concurrency)))
+        greenlets = [(zone_job[0], self._late_greenlets.get(zone_job[0]) or _pool.spawn(self._evaluate_zone, *zone_job))
+                     for zone_job in zone_jobs]
+        _pool.join(timeout=self.tick_deadline_seconds)
+
+        zones_messages = dict()
+        self.late_zones = list()
+        for zone_name, greenlet in greenlets:
+            if (not greenlet.ready()) or (zone_name in self._late_greenlets):
+                # still running, or result of an earlier tick's evaluation
+                self.late_zones.append(zone_name)
+                self._late_greenlets[zone_name] = greenlet
+            elif greenlet.successful():
+                zones_messages[zone_name] = greenlet.value
+            else:
+                _log.error(f"{self.core.identity}: FCU automation failed on zone `{zone_name}`: {greenlet.exception}")
+
+        if len(self.late_zones) > 0:
+            _log.warning(f"{self.core.identity}: {len(self.late_zones)} zones missed the {self.tick_deadline_seconds}s tick deadline: {self.late_zones}")
+        return zones_messages
+
+    @STAGE_METRICS.timed("stream_window")
+    def _get_streaming_zones_data(self, thermal_zone_mapping: dict, apmv_params: dict):
+        """Get preprocessed zone data from the telemetry window, backfilling devices without recent data from CrateDB"""
+        _now = time.time()
+        self.sensor_window.expire(_now)
+
+        device_ids = get_zones_device_ids(thermal_zone_mapping)
+        max_lookback = get_zones_lookback(thermal_zone_mapping, self.lookback_interval)
+
+        # backfill on start or after gaps in the telemetry stream
+        gap_device_ids = self.sensor_window.gap_devices(device_ids, self.streaming_gap_minutes, _now)
+        if len(gap_device_ids) > 0:
+            _log.debug(f"{self.core.identity}: backfilling {len(gap_device_ids)} devices from CrateDB")
+            try:
+                backfill_df = get_data(cratedb_config=self.cratedb_config, device_ids=gap_device_ids, lookback=max_lookback,
+                                       datapoints=IAQ_DATAPOINTS + FCU_DATAPOINTS)
+                if self.incremental_aggregation:
+                    iaq_device_ids = [device_id for device_infos in thermal_zone_mapping.values() for device_id in device_infos.get("iaq_device_ids", list())]
+                    fcu_device_ids = [device_id for device_infos in thermal_zone_mapping.values() for device_id in device_infos.get("fcu_device_ids", list())]
+                    self.iaq_aggregator.add_records(split_device_data(backfill_df, iaq_device_ids))
+                    self.fcu_aggregator.add_records(split_device_data(backfill_df, fcu_device_ids))
+                self.sensor_window.add_records(backfill_df)
+            except Exception as e:
+                _log.error(f"{self.core.identity}: could not backfill telemetry window from CrateDB: {e}")
+
+        if self.incremental_aggregation:
+            self.iaq_aggregator.expire(_now)
+            self.fcu_aggregator.expire(_now)
+            return split_aggregated_zones_data(self.iaq_aggregator, self.fcu_aggregator, thermal_zone_mapping,
+                                               lookback=self.lookback_interval,
+                                               apmv_params=apmv_params,
+                                               now=_now)
+
+        df = self.sensor_window.to_frame(device_ids, max_lookback, _now)
+        return split_zones_data(df, thermal_zone_mapping,
+                                lookback=self.lookback_interval,
+                                apmv_params=apmv_params,
+                                now=pendulum.from_timestamp(_now, tz="Asia/Bangkok"))
+
+    @STAGE_METRICS.timed("publish")
     def send_control_commands(self, mqtt_messages: list):
-        """Send control commands to MQTTAgent -> MQTTBroker -> Niagara"""
+        """Send control commands to MQTTAgent -> MQTTBroker -> Niagara
+        With `batch_commands`, all commands are sent in 1 envelope on `command_batch_topic` (see `unpack_command_batch`)
+        """
         _header = {"requesterID": self.core.identity,
                   "message_type": "command"}
 
+        _batch = list()
         for mqtt_message in mqtt_messages:
             _topic_name = mqtt_message.get("topic", None)
             _message = mqtt_message.get("message", None)
@@ -372,7 +861,17 @@ class Fcuagent(Agent):
             if _topic_name is None or _message is None:
                 _log.error(f"Invalid MQTT control message from FCUAgent: topic=`{_topic_name}`, message={_message}")
                 continue
-            
+
+            # skip commands equal to the last one sent to the FCU, until the keepalive resend is due
+            if self.change_only_commands:
+                if not self.command_tracker.should_send(str(_topic_name), _message):
+                    continue
+                self.command_tracker.mark_sent(str(_topic_name), _message)
+
+            if self.batch_commands:
+                _batch.append({"topic": _topic_name, "message": _message})
+                continue
+
             self.vip.pubsub.publish(
                 peer='pubsub', 
                 topic=str(_topic_name), 
@@ -381,12 +880,200 @@ class Fcuagent(Agent):
             )
             _log.info(f"{self.core.identity}: Published message to MQTTAgent: topic=`{_topic_name}`, message={_message}")
 
-    def _periodic_check_feedback_states(self):
-        """Periodically check feedback states and remove expired feedbacks, prevent memory leak.
-        Will be trigger once every X hour.
+        if len(_batch) > 0:
+            self.vip.pubsub.publish(
+                peer='pubsub',
+                topic=self.command_batch_topic,
+                message=pack_command_batch(_batch),
+                headers={**_header, "message_type": COMMAND_BATCH_MESSAGE_TYPE}
+            )
+            _log.info(f"{self.core.identity}: Published {len(_batch)} commands to MQTTAgent: topic=`{self.command_batch_topic}`")
+            _log.debug(f"{self.core.identity}: Batched commands: {_batch}")
+
+    def _snapshot_path(self):
+        """Snapshot file in the agent data directory, None when there is no data directory"""
+        data_dir = agent_data_dir(self.data_dir)
+        return None if data_dir is None else os.path.join(data_dir, SNAPSHOT_FILE_NAME)
+
+    def _snapshot_state(self):
+        """Runtime state which is not rebuilt from the config: feedbacks, offsets, last commands, streaming windows"""
+        return {
+            "feedbacks": self.tenant_feedback_states.to_dict(),
+            "setpoint_offset": dict(self.setpoint_offset),
+            "setpoint_random_offset_state": self.setpoint_random_offset_state,
+            "commands": self.command_tracker.to_state(),
+            "sensor_window": self.sensor_window.to_state() if self.streaming else None,
+            "iaq_aggregator": self.iaq_aggregator.to_state() if self.streaming else None,
+            "fcu_aggregator": self.fcu_aggregator.to_state() if self.streaming else None,
+        }
+
+    def _restore_runtime_state(self, state: dict):
+        """Restore `_snapshot_state` into the freshly configured agent (after `_update_zones`), dropping zones / devices not in the mapping"""
+        if not state:
+            return
+        _now = time.time()
+        for zone_name, zone_feedbacks in state.get("feedbacks", dict()).items():
+            if zone_name not in self.tenant_feedback_states:
+                continue
+            feedbacks = sorted((feedback["unix_timestamp"], feedback_type, feedback["line_id"])
+                               for feedback_type, type_feedbacks in zone_feedbacks.items() for feedback in type_feedbacks)
+            for unix_timestamp, feedback_type, line_id in feedbacks:
+                _expiry = self.tenant_feedback_states.expiry_time(unix_timestamp, self.feedback_expired_minutes)
+                if _expiry <= _now:
+                    continue
+                if self.tenant_feedback_states.add(zone_name, feedback_type, line_id, unix_timestamp=unix_timestamp):
+                    self._push_feedback_expiry(zone_name, _expiry)
+            # offsets follow from the restored (unexpired) feedbacks
+            self._update_fcu_setpoint_offset(zone_name)
+
+        self.setpoint_random_offset_state = bool(state.get("setpoint_random_offset_state", self.setpoint_random_offset_state))
+
+        fcu_command_topics = {message["topic"] for message in construct_control_message(
+            [device_id for device_infos in self.thermal_zone_mapping.values() for device_id in device_infos.get("fcu_device_ids", list())])}
+        self.command_tracker.restore_state(state.get("commands"), topics=fcu_command_topics)
+
+        # streaming windows: devices no longer mapped get no new samples and expire out of the window
+        if self.streaming:
+            self.sensor_window.restore_state(state.get("sensor_window"))
+            self.sensor_window.expire(_now)
+            for name in ("iaq_aggregator", "fcu_aggregator"):
+                getattr(self, name).restore_state(state.get(name))
+                getattr(self, name).expire(_now)
+
+    def _load_snapshot(self):
+        """Get the runtime state of the last snapshot, None when disabled, missing or older than `snapshot_max_age_seconds`"""
+        if self.snapshot_interval <= 0:
+            return None
+        _start = time.perf_counter()
+        try:
+            _path = self._snapshot_path()
+            if _path is None:
+                _log.warning(f"{self.core.identity}: No agent data directory, snapshots are disabled (set `data_dir` in the config)")
+                return None
+            state, unix_timestamp = load_snapshot(_path, max_age_seconds=self.snapshot_max_age_seconds)
+        except OSError as e:
+            _log.error(f"{self.core.identity}: Snapshot could not be loaded: {e}")
+            return None
+        if state is not None:
+            _log.info(f"{self.core.identity}: Loaded snapshot saved {time.time() - unix_timestamp:.0f} s ago in {(time.perf_counter() - _start) * 1000:.1f} ms")
+        return state
+
+    def _save_snapshot(self):
+        try:
+            _path = self._snapshot_path()
+            if _path is None:
+                # already reported by `_load_snapshot`
+                return
+            _size = save_snapshot(_path, self._snapshot_state())
+            _log.debug(f"{self.core.identity}: Saved snapshot ({_size} bytes)")
+        except Exception as e:
+            _log.error(f"{self.core.identity}: Snapshot could not be saved: {e}")
+
+    def _schedule_snapshot(self):
+        """(Re)schedule the next snapshot, `snapshot_interval` <= 0 disables it"""
+        if self._snapshot_event is not None:
+            self._snapshot_event.cancel()
+            self._snapshot_event = None
+        if self.snapshot_interval > 0:
+            self._snapshot_event = self.core.schedule(pendulum.from_timestamp(time.time() + self.snapshot_interval),
+                                                      self._handle_snapshot)
+
+    def _handle_snapshot(self):
+        self._snapshot_event = None
+        self._save_snapshot()
+        self._schedule_snapshot()
+
+    @Core.receiver("onstop")
+    def onstop(self, sender, **kwargs):
+        """Save a last snapshot so that a restart picks up the latest state"""
+        if self._configured and (self.snapshot_interval > 0):
+            self._save_snapshot()
+
+    def _schedule_metrics_publish(self):
+        """(Re)schedule the next publication of the stage metrics, `metrics_publish_interval` <= 0 disables it"""
+        if self._metrics_event is not None:
+            self._metrics_event.cancel()
+            self._metrics_event = None
+        if self.metrics_publish_interval > 0:
+            self._metrics_event = self.core.schedule(pendulum.from_timestamp(time.time() + self.metrics_publish_interval),
+                                                     self._publish_metrics)
+
+    def _publish_metrics(self):
+        """Publish the stage histograms on `metrics_topic` and write them to `metrics_prometheus_path` when set"""
+        self._metrics_event = None
+        try:
+            self.vip.pubsub.publish(
+                peer='pubsub',
+                topic=self.metrics_topic,
+                message={"unix_timestamp": time.time(), **STAGE_METRICS.snapshot()},
+                headers={"requesterID": self.core.identity, "message_type": "metrics"}
+            )
+            if self.metrics_prometheus_path:
+                STAGE_METRICS.write_prometheus(self.metrics_prometheus_path, namespace="fcuagent",
+                                               labels={"identity": self.core.identity})
+        except Exception as e:
+            _log.error(f"{self.core.identity}: Stage metrics could not be published: {e}")
+        finally:
+            self._schedule_metrics_publish()
+
+    @RPC.export
+    def get_command_stats(self):
+        """Get command publisher counters (sent, suppressed as unchanged, acknowledged)"""
+        return dict(self.command_tracker.stats)
+
+    @RPC.export
+    def get_feedback_metrics(self):
+        """Get tenant feedback counters: events received, events merged into a pending evaluation, evaluations run"""
+        return {**self.feedback_metrics, "pending_zones": list(self._pending_zone_evaluations.keys())}
+
+    @RPC.export
+    def get_connection_pool_stats(self):
+        """Get CrateDB connection pool counters (checkouts, waits, reconnects, created, closed)"""
+        return get_connection_pool_stats()
+
+    @RPC.export
+    def start_profiling(self, ticks: int=None, seconds: float=None, cpu: bool=True, memory: bool=False, top: int=20):
         """
-        for zone_name in self.tenant_feedback_states.keys():
-            self._remove_expired_feedbacks(zone_name, self.feedback_expired_minutes)
+        Profile the next `ticks` `fcu_automation` ticks (default 1), or everything the agent does for the next `seconds`
+        - cpu: cProfile, written as a pstats file
+        - memory: tracemalloc, the top allocators are written as text
+        Result files go to the agent data directory, the summary is returned by `get_profiling_result` / `stop_profiling`
+        """
+        try:
+            data_dir = agent_data_dir(self.data_dir)
+            if data_dir is None:
+                return {"error": "no agent data directory, set `data_dir` in the config", **self.profiler.status()}
+            status = self.profiler.start(data_dir, ticks=ticks, seconds=seconds, cpu=cpu, memory=memory, top=top)
+        except (RuntimeError, ValueError, OSError) as e:
+            return {"error": str(e), **self.profiler.status()}
+        if seconds:
+            self._profiling_stop_event = self.core.schedule(pendulum.from_timestamp(time.time() + float(seconds)), self._stop_profiling)
+        _log.info(f"{self.core.identity}: Profiling started: {status}")
+        return status
+
+    def _stop_profiling(self):
+        self._profiling_stop_event = None
+        result = self.profiler.stop()
+        if result is not None:
+            _log.info(f"{self.core.identity}: Profiling finished after {result['profiled_seconds']:.1f} s: {result['summary_file']}")
+        return result
+
+    @RPC.export
+    def stop_profiling(self):
+        """Stop the running profiling session now and return its summary (None when no session is running)"""
+        if self._profiling_stop_event is not None:
+            self._profiling_stop_event.cancel()
+        return self._stop_profiling()
+
+    @RPC.export
+    def get_profiling_result(self):
+        """Get the state of the running profiling session and the summary of the last finished one"""
+        return {"session": self.profiler.status(), "last_result": self.profiler.last_result}
+
+    @RPC.export
+    def get_stage_metrics(self):
+        """Get per-stage duration histograms (query, decode, pivot, resample, apmv, setpoint_search, publish, tick, ...)"""
+        return STAGE_METRICS.snapshot()
 
 
 def main():
@@ -1,13 +1,28 @@
+import time
 import pendulum
 import numpy as np
 import pandas as pd
 
 from pythermalcomfort.models import a_pmv
 
-from .data_handler import query_data_from_database
+from .data_handler import query_data_from_database, _convert_columns_to_float
+from .metrics import STAGE_METRICS
+from .setpoint_table import SetpointTable
+from .bucket_aggregator import BucketAggregator, IAQ_AGGREGATIONS, FCU_AGGREGATIONS
 
+# lookback (minutes) used for thermal zones without IAQ sensor
+FCU_ONLY_LOOKBACK = 30
 
-def get_data(cratedb_config: dict(), device_ids: list, lookback: int=30):
+# columns and datapoints read by the control logic
+QUERY_COLUMNS = ["timestamp", "device_id", "datapoint", "value"]
+IAQ_DATAPOINTS = list(IAQ_AGGREGATIONS.keys())
+FCU_DATAPOINTS = list(FCU_AGGREGATIONS.keys())
+
+
+def get_data(cratedb_config: dict(), device_ids: list, lookback: int=30, aggregation: dict=None, datapoints: list=None):
+    """Query the last `lookback` minutes of `device_ids`, only fetching `datapoints` when given
+    With `aggregation` (see `query_data_from_database`), CrateDB returns 5-minute buckets instead of raw rows
+    """
     _now = pendulum.now(tz="Asia/Bangkok")
     _end_unix = _now.timestamp()
     _start_unix = _now.subtract(minutes=lookback).timestamp()
@@ -27,12 +42,222 @@ def get_data(cratedb_config: dict(), device_ids: list, lookback: int=30):
     df = query_data_from_database(cratedb_config=cratedb_config,
                                   filters=filters,
                                   table_name=table_name,
-                                  pivot_datapoint_column=True)
+                                  pivot_datapoint_column=True,
+                                  columns=QUERY_COLUMNS,
+                                  datapoints=datapoints,
+                                  columnar=True,
+                                  aggregation=aggregation)
     return df
 
 
+def get_zones_data(cratedb_config: dict(), thermal_zone_mapping: dict, lookback: int=15, apmv_params: dict=None, server_side_aggregation: bool=False):
+    """Query IAQ and FCU data of every thermal zone with a single query, then split it by zone in memory
+
+    Thermal zones without IAQ sensor keep their `FCU_ONLY_LOOKBACK`-minute FCU window, so the query covers the
+    longest window needed and each zone is trimmed to its own lookback afterwards (see `split_zones_data`).
+
+    With `server_side_aggregation`, CrateDB buckets and aggregates the data (one query for IAQ and one for FCU devices)
+    and the returned frames are already preprocessed, like with `apmv_params`.
+
+    Returns:
+        zones_data (dict): {<zone_name>: (iaq_df, fcu_df)}
+    """
+    device_ids = get_zones_device_ids(thermal_zone_mapping)
+    max_lookback = get_zones_lookback(thermal_zone_mapping, lookback)
+
+    _now = pendulum.now(tz="Asia/Bangkok")
+    if server_side_aggregation:
+        iaq_device_ids = [device_id for device_infos in thermal_zone_mapping.values() for device_id in device_infos.get("iaq_device_ids", list())]
+        fcu_device_ids = [device_id for device_infos in thermal_zone_mapping.values() for device_id in device_infos.get("fcu_device_ids", list())]
+        try:
+            iaq_df = get_data(cratedb_config=cratedb_config, device_ids=list(dict.fromkeys(iaq_device_ids)), lookback=lookback,
+                              aggregation={"bucket_minutes": 5, "datapoints": IAQ_AGGREGATIONS}) if iaq_device_ids else pd.DataFrame([])
+            fcu_df = get_data(cratedb_config=cratedb_config, device_ids=list(dict.fromkeys(fcu_device_ids)), lookback=max_lookback,
+                              aggregation={"bucket_minutes": 5, "datapoints": FCU_AGGREGATIONS}) if fcu_device_ids else pd.DataFrame([])
+        except:
+            iaq_df = pd.DataFrame([])
+            fcu_df = pd.DataFrame([])
+        return split_resampled_zones_data(iaq_df, fcu_df, thermal_zone_mapping, lookback=lookback, apmv_params=apmv_params, now=_now)
+
+    try:
+        df = get_data(cratedb_config=cratedb_config, device_ids=device_ids, lookback=max_lookback,
+                      datapoints=IAQ_DATAPOINTS + FCU_DATAPOINTS) if device_ids else pd.DataFrame([])
+    except:
+        df = pd.DataFrame([])
+
+    return split_zones_data(df, thermal_zone_mapping, lookback=lookback, apmv_params=apmv_params, now=_now)
+
+
+def get_zones_device_ids(thermal_zone_mapping: dict):
+    """Get unique IAQ and FCU device ids of every thermal zone"""
+    device_ids = list()
+    for device_infos in thermal_zone_mapping.values():
+        device_ids.extend(device_infos.get("iaq_device_ids", list()))
+        device_ids.extend(device_infos.get("fcu_device_ids", list()))
+    return list(dict.fromkeys(device_ids))
+
+
+def get_zones_lookback(thermal_zone_mapping: dict, lookback: int=15):
+    """Get the longest lookback needed by the thermal zones (zones without IAQ sensor use `FCU_ONLY_LOOKBACK`)"""
+    max_lookback = lookback
+    for device_infos in thermal_zone_mapping.values():
+        if len(device_infos.get("iaq_device_ids", list())) == 0:
+            max_lookback = max(max_lookback, FCU_ONLY_LOOKBACK)
+    return max_lookback
+
+
+def split_zones_data(df: pd.DataFrame, thermal_zone_mapping: dict, lookback: int=15, apmv_params: dict=None, now=None):
+    """Split multi-zone data (same layout as `get_data`) into each zone's lookback window
+
+    When `apmv_params` (vr, met, clo, a_coefficient) is given, the data of all zones is resampled at once and aPMV is
+    computed for every zone's rows in a single call before splitting (use `fcu_control_logics(preprocessed=True)`).
+
+    Returns:
+        zones_data (dict): {<zone_name>: (iaq_df, fcu_df)} with the same layout as `get_data`,
+                           or as `resample_iaq_data` / `resample_fcu_data` when `apmv_params` is given
+    """
+    _now = pendulum.now(tz="Asia/Bangkok") if now is None else now
+
+    if apmv_params is not None:
+        return _preprocess_zones_data(df, thermal_zone_mapping, _now, lookback, apmv_params)
+
+    zones_data = dict()
+    for zone_name, device_infos in thermal_zone_mapping.items():
+        iaq_device_ids = device_infos.get("iaq_device_ids", list())
+        fcu_device_ids = device_infos.get("fcu_device_ids", list())
+        zone_lookback = lookback if len(iaq_device_ids) > 0 else FCU_ONLY_LOOKBACK
+        _start = pd.Timestamp(_now.subtract(minutes=zone_lookback).naive())
+        zones_data[zone_name] = (split_device_data(df, iaq_device_ids, start=_start),
+                                 split_device_data(df, fcu_device_ids, start=_start))
+    return zones_data
+
+
+def _preprocess_zones_data(df: pd.DataFrame, thermal_zone_mapping: dict, _now, lookback: int, apmv_params: dict):
+    """Resample multi-zone data once per lookback window and compute aPMV of all IAQ rows in one call, then split by zone"""
+    iaq_device_ids = list()
+    fcu_lookbacks = dict()  # {<lookback>: [<fcu_device_id>, ...]}, FCU-only zones use their own window
+    for device_infos in thermal_zone_mapping.values():
+        zone_iaq_device_ids = device_infos.get("iaq_device_ids", list())
+        iaq_device_ids.extend(zone_iaq_device_ids)
+        zone_lookback = lookback if len(zone_iaq_device_ids) > 0 else FCU_ONLY_LOOKBACK
+        for fcu_device_id in device_infos.get("fcu_device_ids", list()):
+            fcu_lookbacks.setdefault(zone_lookback, list()).append(fcu_device_id)
+
+    iaq_df = split_device_data(df, iaq_device_ids, start=pd.Timestamp(_now.subtract(minutes=lookback).naive()))
+    if len(iaq_df) > 0:
+        iaq_df = resample_iaq_data(iaq_df, **apmv_params)
+    fcu_dfs = dict()
+    for fcu_lookback, fcu_device_ids in fcu_lookbacks.items():
+        fcu_df = split_device_data(df, fcu_device_ids, start=pd.Timestamp(_now.subtract(minutes=fcu_lookback).naive()))
+        fcu_dfs[fcu_lookback] = resample_fcu_data(fcu_df) if len(fcu_df) > 0 else fcu_df
+
+    zones_data = dict()
+    for zone_name, device_infos in thermal_zone_mapping.items():
+        zone_iaq_device_ids = device_infos.get("iaq_device_ids", list())
+        zone_lookback = lookback if len(zone_iaq_device_ids) > 0 else FCU_ONLY_LOOKBACK
+        zones_data[zone_name] = (split_device_data(iaq_df, zone_iaq_device_ids),
+                                 split_device_data(fcu_dfs.get(zone_lookback, pd.DataFrame([])), device_infos.get("fcu_device_ids", list())))
+    return zones_data
+
+
+def split_aggregated_zones_data(iaq_aggregator: BucketAggregator, fcu_aggregator: BucketAggregator, thermal_zone_mapping: dict,
+                                lookback: int=15, apmv_params: dict=None, now: float=None):
+    """Get each zone's preprocessed data from incremental 5-minute aggregators (see `split_resampled_zones_data`)"""
+    _now = pendulum.now(tz="Asia/Bangkok") if now is None else pendulum.from_timestamp(now, tz="Asia/Bangkok")
+    iaq_df = iaq_aggregator.to_frame(get_zones_device_ids(thermal_zone_mapping), lookback, _now.timestamp())
+    fcu_df = fcu_aggregator.to_frame(get_zones_device_ids(thermal_zone_mapping), get_zones_lookback(thermal_zone_mapping, lookback), _now.timestamp())
+    return split_resampled_zones_data(iaq_df, fcu_df, thermal_zone_mapping, lookback=lookback, apmv_params=apmv_params, now=_now)
+
+
+def split_resampled_zones_data(iaq_df: pd.DataFrame, fcu_df: pd.DataFrame, thermal_zone_mapping: dict, lookback: int=15, apmv_params: dict=None, now=None):
+    """Split multi-zone 5-minute frames (layout of `resample_iaq_data` without aPMV / `resample_fcu_data`) by zone,
+    computing aPMV of all IAQ rows in one call
+
+    Each zone keeps the buckets ending after the start of its lookback window.
+
+    Returns:
+        zones_data (dict): {<zone_name>: (iaq_df, fcu_df)} with the same layout as `resample_iaq_data` / `resample_fcu_data`
+    """
+    _now = pendulum.now(tz="Asia/Bangkok") if now is None else now
+    apmv_params = dict() if apmv_params is None else apmv_params
+    if len(iaq_df) > 0:
+        iaq_df = iaq_df.copy()
+        iaq_df['aPMV'] = compute_apmv(iaq_df['temperature'].values, iaq_df['humidity'].values, **apmv_params)
+
+    zones_data = dict()
+    for zone_name, device_infos in thermal_zone_mapping.items():
+        zone_iaq_device_ids = device_infos.get("iaq_device_ids", list())
+        zone_lookback = lookback if len(zone_iaq_device_ids) > 0 else FCU_ONLY_LOOKBACK
+        _start = pd.Timestamp(_now.subtract(minutes=zone_lookback).naive())
+        zone_iaq_df = split_device_data(iaq_df, zone_iaq_device_ids)
+        zone_fcu_df = split_device_data(fcu_df, device_infos.get("fcu_device_ids", list()))
+        zones_data[zone_name] = (zone_iaq_df[zone_iaq_df['datetime'] > _start] if len(zone_iaq_df) > 0 else zone_iaq_df,
+                                 zone_fcu_df[zone_fcu_df['datetime'] > _start] if len(zone_fcu_df) > 0 else zone_fcu_df)
+    return zones_data
+
+
+def split_device_data(df: pd.DataFrame, device_ids: list, start: pd.Timestamp=None):
+    """Select rows of `device_ids` (and newer than `start`) from a multi-device dataframe returned by `get_data`"""
+    if (len(df) <= 0) or ('device_id' not in df.columns) or (len(device_ids) == 0):
+        return pd.DataFrame([])
+
+    mask = df['device_id'].isin(device_ids)
+    if start is not None:
+        mask &= (df.index >= start)
+    _df = df[mask]
+    if len(_df) <= 0:
+        return pd.DataFrame([])
+
+    # datapoints of other devices may have kept a column as object, re-apply float conversion on the selected rows
+    return _convert_columns_to_float(_df.copy(), skip_columns=('device_id', 'datetime'))
+
+
+@STAGE_METRICS.timed("apmv")
+def compute_apmv(temperature, humidity, vr: float=0.1, met: float=1.1, clo: float=0.7, a_coefficient: float=0.2):
+    """Compute aPMV of whole temperature/humidity arrays with one `a_pmv` call (MRT is assumed equal to air temperature)"""
+    temperature = np.asarray(temperature, dtype=float)
+    humidity = np.asarray(humidity, dtype=float)
+    if temperature.size <= 0:
+        return np.array([], dtype=float)
+    return np.asarray(a_pmv(tdb=temperature, tr=temperature, vr=vr, rh=humidity, met=met, clo=clo, a_coefficient=a_coefficient, wme=0), dtype=float)
+
+
+def resample_iaq_data(iaq_df: pd.DataFrame, vr: float=0.1, met: float=1.1, clo: float=0.7, a_coefficient: float=0.2):
+    """Resample IAQ data into 5-minute buckets per device and compute aPMV of every bucket in one call
+    `iaq_df` may hold devices of many thermal zones
+    """
+    _start = time.perf_counter()
+    iaq_df = iaq_df.groupby('device_id').resample('5T', label='right').agg({
+        'humidity': 'mean',
+        'temperature': 'mean'
+    }).reset_index()
+    STAGE_METRICS.observe("resample", time.perf_counter() - _start)
+    iaq_df['aPMV'] = compute_apmv(iaq_df['temperature'].values, iaq_df['humidity'].values, vr=vr, met=met, clo=clo, a_coefficient=a_coefficient)
+    return iaq_df
+
+
+@STAGE_METRICS.timed("resample")
+def resample_fcu_data(fcu_df: pd.DataFrame):
+    """Resample FCU data into 5-minute buckets per device
+    `fcu_df` may hold devices of many thermal zones
+    """
+    return fcu_df.groupby('device_id').resample('5T', label='right').agg({
+        # DEDE data schema (mode, set_temperature, room_temperature)
+        # Original data schema (fan, mode, room_temperature, set_temperature)
+        'mode': 'last',
+        'set_temperature': 'last',
+        'room_temperature': 'mean'
+    }).reset_index()
+
+
 # TODO: validate more on `a_pmv` function
-def get_target_temperature(aPMV_target: float, rh: float, mrt: float=None, vr: float=0.1, met: float=1.1, clo: float=0.7, a_coefficient: float=0.2, left=False):
+@STAGE_METRICS.timed("setpoint_search")
+def get_target_temperature(aPMV_target: float, rh: float, mrt: float=None, vr: float=0.1, met: float=1.1, clo: float=0.7, a_coefficient: float=0.2, left=False,
+                           setpoint_table: SetpointTable=None):
+    # use the precomputed table when given (built from the same `vr`, `met`, `clo`, `a_coefficient`)
+    if setpoint_table is not None:
+        return setpoint_table.lookup(aPMV_target=aPMV_target, rh=rh, mrt=mrt, left=left)
+
     setpoints = [_t for _t in range(18, 31)]
     tr = mrt
     for idx, setpoint in enumerate(setpoints):
@@ -66,26 +291,60 @@ def construct_control_message(fcu_device_ids: list, mode: int=1, set_temperature
 
 
 def fcu_control_logics(cratedb_config: dict(), iaq_device_ids: list, fcu_device_ids: list, aPMV_min: float=0, aPMV_target: float=0.25, aPMV_max: float=0.5,
-                       rH_max: float=0.6, vr: float=0.1, met: float=1.1, clo: float=0.7, a_coefficient: float=0.2, lookback=15, fixed_humidity=50):
+                       rH_max: float=0.6, vr: float=0.1, met: float=1.1, clo: float=0.7, a_coefficient: float=0.2, lookback=15, fixed_humidity=50,
+                       iaq_df: pd.DataFrame=None, fcu_df: pd.DataFrame=None, preprocessed: bool=False, setpoint_table: SetpointTable=None):
+    """Decide FCU controls of one thermal zone
+    `iaq_df` and `fcu_df` can be given as pre-fetched data (ex. from `get_zones_data`) to skip querying CrateDB,
+    with `preprocessed=True` when they are already resampled (and `iaq_df` holds `aPMV`)
+    `setpoint_table` can be given to look up target temperatures instead of scanning setpoints with `a_pmv`
+    """
+    decision = fcu_control_decision(cratedb_config=cratedb_config, iaq_device_ids=iaq_device_ids, fcu_device_ids=fcu_device_ids,
+                                    aPMV_min=aPMV_min, aPMV_target=aPMV_target, aPMV_max=aPMV_max, rH_max=rH_max,
+                                    vr=vr, met=met, clo=clo, a_coefficient=a_coefficient, lookback=lookback, fixed_humidity=fixed_humidity,
+                                    iaq_df=iaq_df, fcu_df=fcu_df, preprocessed=preprocessed, setpoint_table=setpoint_table)
+    mqtt_messages = construct_control_message(decision["fcu_device_ids"], mode=decision["mode"], set_temperature=decision["set_temperature"])
+    return mqtt_messages, decision["iaq_df"], decision["fcu_df"]
+
+
+def _control_decision(fcu_device_ids: list, mode: int=1, set_temperature: float=25, aPMV: float=None, aPMV_zone: str=None,
+                      iaq_df: pd.DataFrame=None, fcu_df: pd.DataFrame=None):
+    return {
+        "fcu_device_ids": list(fcu_device_ids),
+        "mode": mode,
+        "set_temperature": set_temperature,
+        "aPMV": aPMV,
+        "aPMV_zone": aPMV_zone,
+        "iaq_df": pd.DataFrame([]) if iaq_df is None else iaq_df,
+        "fcu_df": pd.DataFrame([]) if fcu_df is None else fcu_df
+    }
+
+
+def fcu_control_decision(cratedb_config: dict(), iaq_device_ids: list, fcu_device_ids: list, aPMV_min: float=0, aPMV_target: float=0.25, aPMV_max: float=0.5,
+                         rH_max: float=0.6, vr: float=0.1, met: float=1.1, clo: float=0.7, a_coefficient: float=0.2, lookback=15, fixed_humidity=50,
+                         iaq_df: pd.DataFrame=None, fcu_df: pd.DataFrame=None, preprocessed: bool=False, setpoint_table: SetpointTable=None):
+    """Same logic as `fcu_control_logics`, returning the decision before it is turned into MQTT messages
+    {"fcu_device_ids": <FCUs to control>, "mode": <mode>, "set_temperature": <base setpoint>, "aPMV": <current aPMV>,
+     "aPMV_zone": "PMV-A" | "PMV-B" | "PMV-C" | "PMV-D", "iaq_df": <IAQ data>, "fcu_df": <FCU data>}
+    `aPMV` and `aPMV_zone` are None for zones without IAQ sensor
+    """
+    prefetched = (iaq_df is not None) and (fcu_df is not None)
+
     # Case 1: thermal zone with no IAQ sensor
     if len(iaq_device_ids) == 0:
         try:
             # prepare FCU data
-            fcu_df = get_data(cratedb_config=cratedb_config, device_ids=fcu_device_ids, lookback=30)
+            if not prefetched:
+                fcu_df = get_data(cratedb_config=cratedb_config, device_ids=fcu_device_ids, lookback=FCU_ONLY_LOOKBACK, datapoints=FCU_DATAPOINTS)
         except:
             iaq_df = pd.DataFrame([])
             fcu_df = pd.DataFrame([])
         
         if len(fcu_df) <= 0:
-            return list(), pd.DataFrame([]), fcu_df
+            return _control_decision(list(), fcu_df=fcu_df)
         
         # preprocess data
-        fcu_df = fcu_df.groupby('device_id').resample('5T', label='right').agg({
-            # DEDE data schema (mode, set_temperature, room_temperature)
-            'mode': 'last',
-            'set_temperature': 'last',
-            'room_temperature': 'mean'
-        }).reset_index()
+        if not preprocessed:
+            fcu_df = resample_fcu_data(fcu_df)
         
         # check recent 30-min FCU mode
         fcu_ONs = list()
@@ -98,42 +357,29 @@ def fcu_control_logics(cratedb_config: dict(), iaq_device_ids: list, fcu_device_
             if all("off" not in _fcu_mode for _fcu_mode in _fcu_modes):
                 fcu_ONs.append(fcu_name)
 
-        # construct control messages
-        mqtt_messages = list()
         # estimate setpoint temperature from fixed humidity value (50%)
-        set_temperature = get_target_temperature(aPMV_target=aPMV_target, rh=fixed_humidity, vr=vr, met=met, clo=clo, a_coefficient=a_coefficient, left=False)
-        mqtt_messages: list = construct_control_message(fcu_ONs, mode=1, set_temperature=set_temperature)
-        
-        return mqtt_messages, pd.DataFrame([]), fcu_df
+        set_temperature = get_target_temperature(aPMV_target=aPMV_target, rh=fixed_humidity, vr=vr, met=met, clo=clo, a_coefficient=a_coefficient, left=False, setpoint_table=setpoint_table)
+        return _control_decision(fcu_ONs, mode=1, set_temperature=set_temperature, fcu_df=fcu_df)
 
     # Case 2: thermal zone with IAQ sensor
     else:
         try:
             # prepare IAQ and FCU data
-            iaq_df = get_data(cratedb_config=cratedb_config, device_ids=iaq_device_ids, lookback=lookback)
-            fcu_df = get_data(cratedb_config=cratedb_config, device_ids=fcu_device_ids, lookback=lookback)
+            if not prefetched:
+                iaq_df = get_data(cratedb_config=cratedb_config, device_ids=iaq_device_ids, lookback=lookback, datapoints=IAQ_DATAPOINTS)
+                fcu_df = get_data(cratedb_config=cratedb_config, device_ids=fcu_device_ids, lookback=lookback, datapoints=FCU_DATAPOINTS)
         except:
             iaq_df = pd.DataFrame([])
             fcu_df = pd.DataFrame([])
         
         if (len(iaq_df) <= 0) or (len(fcu_df) <= 0):
-            return list(), iaq_df, fcu_df
+            return _control_decision(list(), iaq_df=iaq_df, fcu_df=fcu_df)
 
         # TODO: handle missing data
         # preprocess data
-        iaq_df = iaq_df.groupby('device_id').resample('5T', label='right').agg({
-            'humidity': 'mean',
-            'temperature': 'mean'
-        }).reset_index()
-        iaq_df['aPMV'] = iaq_df.apply(lambda x: a_pmv(tdb=x.temperature, tr=x.temperature, vr=vr, rh=x.humidity, met=met, clo=clo, a_coefficient=a_coefficient, wme=0), axis=1)
-
-        fcu_df = fcu_df.groupby('device_id').resample('5T', label='right').agg({
-            # DEDE data schema (mode, set_temperature, room_temperature)
-            # Original data schema (fan, mode, room_temperature, set_temperature)
-            'mode': 'last',
-            'set_temperature': 'last',
-            'room_temperature': 'mean'
-        }).reset_index()
+        if not preprocessed:
+            iaq_df = resample_iaq_data(iaq_df, vr=vr, met=met, clo=clo, a_coefficient=a_coefficient)
+            fcu_df = resample_fcu_data(fcu_df)
 
         # 2. identify aPMV zone
         # get current aPMV value
@@ -168,24 +414,26 @@ def fcu_control_logics(cratedb_config: dict(), iaq_device_ids: list, fcu_device_
         if humidity_mean >= rH_max:
             if current_aPMV_zone in ["PMV-A", "PMV-B"]:
                 # send dry mode control for 15 min
-                mqtt_messages = construct_control_message(fcu_device_ids, mode=5)
+                decision = _control_decision(fcu_device_ids, mode=5)
             else:
                 # send cool mode (precool) for 15 min at aPMVmin temperature
-                set_temperature = get_target_temperature(aPMV_target=aPMV_min, rh=current_humidity, vr=vr, met=met, clo=clo, a_coefficient=a_coefficient, left=True)
-                mqtt_messages = construct_control_message(fcu_device_ids, mode=1, set_temperature=set_temperature)
-            return mqtt_messages, iaq_df, fcu_df
+                set_temperature = get_target_temperature(aPMV_target=aPMV_min, rh=current_humidity, vr=vr, met=met, clo=clo, a_coefficient=a_coefficient, left=True, setpoint_table=setpoint_table)
+                decision = _control_decision(fcu_device_ids, mode=1, set_temperature=set_temperature)
+            decision.update(aPMV=current_aPMV, aPMV_zone=current_aPMV_zone, iaq_df=iaq_df, fcu_df=fcu_df)
+            return decision
 
         # 4. check PMV comfort
         if current_aPMV_zone == "PMV-A":
             # send fan mode
-            mqtt_messages = construct_control_message(fcu_device_ids, mode=3)
+            decision = _control_decision(fcu_device_ids, mode=3)
         elif current_aPMV_zone in ["PMV-B", "PMV-C"]:
             # send cool mode at aPMVtarget temperature
-            set_temperature = get_target_temperature(aPMV_target=aPMV_target, rh=current_humidity, vr=vr, met=met, clo=clo, a_coefficient=a_coefficient, left=False)
-            mqtt_messages = construct_control_message(fcu_device_ids, mode=1, set_temperature=set_temperature)
+            set_temperature = get_target_temperature(aPMV_target=aPMV_target, rh=current_humidity, vr=vr, met=met, clo=clo, a_coefficient=a_coefficient, left=False, setpoint_table=setpoint_table)
+            decision = _control_decision(fcu_device_ids, mode=1, set_temperature=set_temperature)
         elif current_aPMV_zone == "PMV-D":
             # send cool mode at aPMVtarget temperature
-            set_temperature = get_target_temperature(aPMV_target=aPMV_target, rh=current_humidity, vr=vr, met=met, clo=clo, a_coefficient=a_coefficient, left=True)
-            mqtt_messages = construct_control_message(fcu_device_ids, mode=1, set_temperature=set_temperature)
+            set_temperature = get_target_temperature(aPMV_target=aPMV_target, rh=current_humidity, vr=vr, met=met, clo=clo, a_coefficient=a_coefficient, left=True, setpoint_table=setpoint_table)
+            decision = _control_decision(fcu_device_ids, mode=1, set_temperature=set_temperature)
 
-        return mqtt_messages, iaq_df, fcu_df
\ No newline at end of file
+        decision.update(aPMV=current_aPMV, aPMV_zone=current_aPMV_zone, iaq_df=iaq_df, fcu_df=fcu_df)
+        return decision
\ No newline at end of file
@@ -0,0 +1,168 @@
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from .data_handler import _convert_columns_to_float
+
+# same aggregations as `resample_iaq_data` / `resample_fcu_data`
+IAQ_AGGREGATIONS = {
+    'humidity': 'mean',
+    'temperature': 'mean'
+}
+FCU_AGGREGATIONS = {
+    # DEDE data schema (mode, set_temperature, room_temperature)
+    'mode': 'last',
+    'set_temperature': 'last',
+    'room_temperature': 'mean'
+}
+
+
+def _to_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+class BucketAggregator:
+    """
+    Incremental per-device time-bucket aggregation, equivalent to `groupby('device_id').resample('5T', label='right')`
+
+    Every sample updates the running state of its bucket in O(1): sum and count for `mean` datapoints and the latest
+    value for `last` datapoints. Buckets are closed on the left and labelled with their right edge, like the pandas
+    resample used before. Buckets older than `retention_minutes` are dropped on `expire`.
+
+    Args:
+        aggregations (dict): {<datapoint>: 'mean' | 'last'}
+        bucket_minutes (int): Bucket length
+        retention_minutes (float): How long buckets are kept
+
+    """
+
+    def __init__(self, aggregations: dict, bucket_minutes: int=5, retention_minutes: float=30):
+        self.aggregations = aggregations
+        self.bucket_seconds = bucket_minutes * 60
+        self.retention_minutes = retention_minutes
+        # {<device_id>: {<bucket_end_unix>: {<datapoint>: [sum, count] (mean) or [unix_timestamp, value] (last)}}}
+        self._buckets = dict()
+        self._last_seen = dict()  # {<device_id>: <unix_timestamp>}
+
+    def add_sample(self, device_id: str, unix_timestamp: float, values: dict):
+        """Add one sample of a device ({<datapoint>: <value>}) to its bucket"""
+        bucket_end = (math.floor(unix_timestamp / self.bucket_seconds) + 1) * self.bucket_seconds
+        device_buckets = self._buckets.setdefault(device_id, dict())
+        bucket = device_buckets.get(bucket_end)
+        if bucket is None:
+            bucket = dict()
+            device_buckets[bucket_end] = bucket
+
+        for datapoint, aggregation in self.aggregations.items():
+            value = values.get(datapoint)
+            if value is None:
+                continue
+            state = bucket.get(datapoint)
+            if aggregation == 'mean':
+                value = _to_float(value)
+                if value is None:
+                    continue
+                if state is None:
+                    bucket[datapoint] = [value, 1]
+                else:
+                    state[0] += value
+                    state[1] += 1
+            elif (state is None) or (unix_timestamp >= state[0]):
+                bucket[datapoint] = [unix_timestamp, value]
+
+        self._last_seen[device_id] = max(unix_timestamp, self._last_seen.get(device_id, unix_timestamp))
+
+    def add_records(self, df: pd.DataFrame):
+        """Backfill samples from a dataframe returned by `get_data`, keeping only rows newer than each device's last sample"""
+        if (len(df) <= 0) or ('device_id' not in df.columns):
+            return
+        datapoints = [datapoint for datapoint in self.aggregations.keys() if datapoint in df.columns]
+        unix_timestamps = df.index.tz_localize("Asia/Bangkok").asi8 / 1e9
+        last_seen = dict(self._last_seen)
+        for unix_timestamp, device_id, row in zip(unix_timestamps, df['device_id'].values, df[datapoints].values):
+            if unix_timestamp <= last_seen.get(device_id, -math.inf):
+                continue
+            self.add_sample(device_id, float(unix_timestamp), {k: v for k, v in zip(datapoints, row) if not pd.isna(v)})
+
+    def expire(self, now: float=None):
+        """Drop buckets which ended more than `retention_minutes` ago"""
+        now = time.time() if now is None else now
+        cutoff = now - self.retention_minutes * 60
+        for device_id in list(self._buckets.keys()):
+            device_buckets = self._buckets[device_id]
+            for bucket_end in [bucket_end for bucket_end in device_buckets.keys() if bucket_end <= cutoff]:
+                del device_buckets[bucket_end]
+            if not device_buckets:
+                del self._buckets[device_id]
+                self._last_seen.pop(device_id, None)
+
+    def remove_devices(self, device_ids: list):
+        for device_id in device_ids:
+            self._buckets.pop(device_id, None)
+            self._last_seen.pop(device_id, None)
+
+    def to_state(self):
+        """
+        Buckets and last sample times as plain data,
+        {"buckets": {<device_id>: [[<bucket_end_unix>, {<datapoint>: [..]}], ...]}, "last_seen": {<device_id>: <unix_timestamp>}}
+        """
+        return {"buckets": {device_id: [[bucket_end, {datapoint: list(state) for datapoint, state in bucket.items()}]
+                                        for bucket_end, bucket in device_buckets.items()]
+                            for device_id, device_buckets in self._buckets.items()},
+                "last_seen": dict(self._last_seen)}
+
+    def restore_state(self, state: dict):
+        """Restore `to_state` buckets of the datapoints still aggregated, buckets already filled are kept"""
+        state = state or dict()
+        for device_id, device_buckets in state.get("buckets", dict()).items():
+            for bucket_end, bucket in device_buckets:
+                bucket = {datapoint: list(datapoint_state) for datapoint, datapoint_state in bucket.items()
+                          if datapoint in self.aggregations}
+                self._buckets.setdefault(device_id, dict()).setdefault(int(bucket_end), bucket)
+        for device_id, unix_timestamp in state.get("last_seen", dict()).items():
+            if device_id in self._buckets:
+                self._last_seen[device_id] = max(unix_timestamp, self._last_seen.get(device_id, unix_timestamp))
+
+    def to_frame(self, device_ids: list, lookback: float, now: float=None):
+        """
+        Build the aggregated dataframe of buckets overlapping the last `lookback` minutes, with the same layout as the
+        pandas resample (`device_id`, `datetime` and one column per datapoint, empty buckets in between as NaN)
+        """
+        now = time.time() if now is None else now
+        start = now - lookback * 60
+        device_col, bucket_col = list(), list()
+        columns = {datapoint: list() for datapoint in self.aggregations.keys()}
+        for device_id in sorted(set(device_ids)):
+            device_buckets = self._buckets.get(device_id)
+            if not device_buckets:
+                continue
+            bucket_ends = [bucket_end for bucket_end in device_buckets.keys() if start < bucket_end <= now + self.bucket_seconds]
+            if len(bucket_ends) <= 0:
+                continue
+            for bucket_end in range(int(min(bucket_ends)), int(max(bucket_ends)) + 1, self.bucket_seconds):
+                bucket = device_buckets.get(bucket_end, dict())
+                device_col.append(device_id)
+                bucket_col.append(bucket_end)
+                for datapoint, aggregation in self.aggregations.items():
+                    state = bucket.get(datapoint)
+                    if state is None:
+                        columns[datapoint].append(np.nan)
+                    elif aggregation == 'mean':
+                        columns[datapoint].append(state[0] / state[1])
+                    else:
+                        columns[datapoint].append(state[1])
+        if len(device_col) <= 0:
+            return pd.DataFrame([])
+
+        df = pd.DataFrame({
+            'device_id': device_col,
+            'datetime': pd.to_datetime(bucket_col, unit='s', utc=True).tz_convert("Asia/Bangkok").tz_localize(None),
+            **columns
+        })
+        return _convert_columns_to_float(df, skip_columns=('device_id', 'datetime'))
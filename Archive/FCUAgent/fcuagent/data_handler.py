@@ -1,18 +1,255 @@
+import collections
+import functools
 import logging
+import threading
+import time
+import numpy as np
 import pandas as pd
 from crate import client
+from crate.client.exceptions import ConnectionError as CrateConnectionError
 
+from .metrics import STAGE_METRICS
 
-def _execute_query_string(cratedb_config: dict(), query_string: str):
+
+class CrateConnectionPool:
+    """
+    Pool of reusable CrateDB connections shared by every `query_data_from_database` caller
+
+    Args:
+        cratedb_config (dict): CrateDB config (host, port, username, password)
+        size (int): Maximum number of open connections
+        idle_timeout (float): Seconds after which an idle connection is closed instead of reused
+        health_check_interval (float): Seconds of idleness after which a connection is checked with `SELECT 1` before reuse
+        checkout_timeout (float): Seconds to wait for a free connection when the pool is exhausted
+
+    Counters in `stats`:
+        - checkouts: number of connections handed out
+        - waits: number of checkouts that had to wait for a connection to be released
+        - reconnects: number of connections replaced after a failed health check or query
+        - created / closed: number of connections opened / closed by the pool
+
+    """
+
+    def __init__(self, cratedb_config: dict, size: int=4, idle_timeout: float=300, health_check_interval: float=60, checkout_timeout: float=30):
+        self.url = str(cratedb_config.get('host', None)) + ':' + str(cratedb_config.get('port', None))
+        self.username = cratedb_config.get('username', None)
+        self.password = cratedb_config.get('password', None)
+        self.size = max(1, int(size))
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+
+        self._idle = collections.deque()  # (connection, last_used_monotonic), most recently used at the right
+        self._open_count = 0
+        self._cond = threading.Condition()
+        self.stats = {"checkouts": 0, "waits": 0, "reconnects": 0, "created": 0, "closed": 0}
+
+    def _connect(self):
+        connection = client.connect(self.url, username=self.username, password=self.password)
+        self.stats["created"] += 1
+        return connection
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception as e:
+            logging.debug(f"CrateDB connection could not be closed: {e}")
+        self.stats["closed"] += 1
+
+    def _is_healthy(self, connection):
+        cursor = None
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            return True
+        except Exception as e:
+            logging.debug(f"CrateDB connection failed health check: {e}")
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+
+    def checkout(self):
+        """
+        Get a connection from the pool, open a new one or wait until one is released
+
+        The lock is only held to pick an idle connection or reserve a slot, the health check and the connect run
+        outside of it so a slow or dead connection doesn't block the other checkouts
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._cond:
+            self.stats["checkouts"] += 1
+        connection, check_health = self._reserve(deadline)
+        if (connection is not None) and ((not check_health) or self._is_healthy(connection)):
+            return connection
+        if connection is not None:
+            self._close(connection)
+            with self._cond:
+                self.stats["reconnects"] += 1
+        try:
+            return self._connect()
+        except BaseException:
+            # give the reserved slot back
+            self._free_slot()
+            raise
+
+    def _reserve(self, deadline: float):
+        """
+        Pop the most recently used idle connection, or reserve a slot for a new one, waiting until `deadline`
+
+        Returns:
+            (connection, check_health): the idle connection (None when a slot was reserved) and whether it has been idle
+                                        long enough to need a health check
+
+        """
+        expired = list()
+        try:
+            with self._cond:
+                waited = False
+                while True:
+                    # reuse the most recently used idle connection, close the ones idle for too long
+                    while self._idle:
+                        connection, last_used = self._idle.pop()
+                        idle_seconds = time.monotonic() - last_used
+                        if idle_seconds > self.idle_timeout:
+                            self._open_count -= 1
+                            expired.append(connection)
+                            continue
+                        return connection, idle_seconds > self.health_check_interval
+
+                    if self._open_count < self.size:
+                        self._open_count += 1
+                        return None, False
+
+                    if not waited:
+                        self.stats["waits"] += 1
+                        waited = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No CrateDB connection available after {self.checkout_timeout} seconds (pool size = {self.size})")
+                    self._cond.wait(remaining)
+        finally:
+            for connection in expired:
+                self._close(connection)
+
+    def _free_slot(self):
+        with self._cond:
+            self._open_count -= 1
+            self._cond.notify()
+
+    def release(self, connection, broken: bool=False):
+        """Return a connection to the pool, or close it when it is `broken`"""
+        with self._cond:
+            if broken:
+                self._open_count -= 1
+                self._close(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def execute(self, query_string: str, args: list=None):
+        """
+        Execute a query (with optional bind arguments) on a pooled connection, reconnecting once if the connection
+        turns out to be broken
+
+        Returns:
+            (rows, description): rows from `fetchall()` and the cursor description
+
+        """
+        for attempt in range(2):
+            connection = self.checkout()
+            cursor = None
+            # the connection goes back to the pool in every case: closed when its state is unknown (connection error,
+            # or interrupted by a BaseException such as a killed greenlet), reused after a completed query or query error
+            broken = True
+            try:
+                cursor = connection.cursor()
+                cursor.execute(query_string, args)
+                rows = cursor.fetchall()
+                description = cursor.description
+                broken = False
+            except CrateConnectionError:
+                if attempt > 0:
+                    raise
+                with self._cond:
+                    self.stats["reconnects"] += 1
+                continue
+            except Exception:
+                broken = False
+                raise
+            finally:
+                if cursor:
+                    try:
+                        cursor.close()
+                    except Exception as e:
+                        logging.debug(f"CrateDB cursor could not be closed: {e}")
+                self.release(connection, broken=broken)
+            return rows, description
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._cond:
+            while self._idle:
+                connection, _ = self._idle.pop()
+                self._open_count -= 1
+                self._close(connection)
+
+
+# connection pools shared by every caller, keyed by CrateDB url and credentials
+_connection_pools = dict()
+_connection_pools_lock = threading.Lock()
+
+
+def get_connection_pool(cratedb_config: dict()):
+    """
+    Get the shared connection pool of a CrateDB config, creating it on first use
+
+    Pool settings are read from the CrateDB config: `pool_size` (default 4), `pool_idle_timeout` (default 300 sec),
+    `pool_health_check_interval` (default 60 sec), `pool_checkout_timeout` (default 30 sec)
+
+    """
+    key = (str(cratedb_config.get('host', None)), str(cratedb_config.get('port', None)),
+           cratedb_config.get('username', None), cratedb_config.get('password', None))
+    with _connection_pools_lock:
+        pool = _connection_pools.get(key)
+        if pool is None:
+            pool = CrateConnectionPool(cratedb_config,
+                                       size=cratedb_config.get('pool_size', 4),
+                                       idle_timeout=cratedb_config.get('pool_idle_timeout', 300),
+                                       health_check_interval=cratedb_config.get('pool_health_check_interval', 60),
+                                       checkout_timeout=cratedb_config.get('pool_checkout_timeout', 30))
+            _connection_pools[key] = pool
+        return pool
+
+
+def get_connection_pool_stats():
+    """Get counters of every connection pool, keyed by CrateDB url"""
+    with _connection_pools_lock:
+        return {pool.url: dict(pool.stats) for pool in _connection_pools.values()}
+
+
+def close_connection_pools():
+    """Close and forget every connection pool (ex. when the CrateDB config changes)"""
+    with _connection_pools_lock:
+        for pool in _connection_pools.values():
+            pool.close_all()
+        _connection_pools.clear()
+
+
+def _execute_query_string(cratedb_config: dict(), query_string: str, args: list=None, columnar: bool=False):
     """
     Query data from specified datasource with specified query string.
 
     Args:
-        query_string (str): SQL Query string to be executed
-        datasource (str): Datasource to query data from. Default is 'cratedb'
+        cratedb_config (dict): CrateDB config, used to select the shared connection pool
+        query_string (str): SQL Query string to be executed, with `?` placeholders for `args`
+        args (list): Bind arguments of the query string
+        columnar (bool): If True, return one NumPy array per column instead of a list of dicts
 
     Returns:
         data (list): List of data from CrateDB. Each element is a dictionary with column name as keys.
+        (or data (dict): {<column_name>: np.ndarray} when `columnar` is True, empty dict when no rows)
 
         data = [{'timestamp': 1675245600000,
                'location': 'chiller_plant/iot_devices',
@@ -24,29 +261,45 @@ def _execute_query_string(cratedb_config: dict(), query_string: str):
                'value': '1289.8812590049934'}, ....]
 
     """
-    cursor = None
     res = list()
     try:
-        cratedb_url = str(cratedb_config.get('host', None)) + ':' + str(cratedb_config.get('port', None))
-        connection = client.connect(cratedb_url, username=cratedb_config.get('username', None), password=cratedb_config.get('password', None))
-        cursor = connection.cursor()
-        cursor.execute(query_string)
-        datas = cursor.fetchall()
-        connection.close()
-
-        column_names = [desc[0] for desc in cursor.description]
-
-        # Preprocess list-of-lists into list-of-dicts with correct keys and values
-        for row in datas:
-            res.append({k: v for k, v in zip(column_names, row)})
+        pool = get_connection_pool(cratedb_config)
+        _start = time.perf_counter()
+        datas, description = pool.execute(query_string, args)
+        STAGE_METRICS.observe("query", time.perf_counter() - _start)
+
+        column_names = [desc[0] for desc in description]
+
+        _start = time.perf_counter()
+        if columnar:
+            res = _rows_to_columns(column_names, datas)
+        else:
+            # Preprocess list-of-lists into list-of-dicts with correct keys and values
+            for row in datas:
+                res.append({k: v for k, v in zip(column_names, row)})
+        STAGE_METRICS.observe("decode", time.perf_counter() - _start)
 
         return res
 
+    except TimeoutError as e:
+        # pool exhausted: every query fails until connections are released, not a per-query condition
+        logging.error(f"Data could not be queried: {e} host: {cratedb_config.get('host', None)}:{cratedb_config.get('port', None)}")
     except Exception as e:
-        logging.debug(f"Data could not be queried: {e} host: {cratedb_url} username: {cratedb_config.get('username', None)} password: {cratedb_config.get('password', None)}")
-    finally:
-        if cursor:
-            cursor.close()
+        logging.debug(f"Data could not be queried: {e} host: {cratedb_config.get('host', None)}:{cratedb_config.get('port', None)} username: {cratedb_config.get('username', None)}")
+
+
+def _rows_to_columns(column_names: list, rows: list):
+    """Transpose cursor rows into {<column_name>: np.ndarray} without building a dict per row"""
+    if len(rows) <= 0:
+        return dict()
+    columns = dict()
+    for column_name, values in zip(column_names, zip(*rows)):
+        # keep strings (device_id, datapoint, value) as object arrays, let NumPy infer numeric ones (timestamp)
+        array = np.array(values, dtype=object)
+        if column_name == 'timestamp':
+            array = array.astype('int64')
+        columns[column_name] = array
+    return columns
 
 
 def _convert_timestamp_column_to_datetime_index(df: pd.DataFrame, timestamp_column: str = 'timestamp', timestamp_unit: str = 'ms'):
@@ -72,6 +325,45 @@ def _convert_timestamp_column_to_datetime_index(df: pd.DataFrame, timestamp_colu
     return df
 
 
+# Asia/Bangkok has a fixed UTC+07:00 offset (no DST)
+_BANGKOK_UTC_OFFSET_MS = 7 * 60 * 60 * 1000
+
+
+def _epoch_ms_to_bangkok_datetime(timestamps: np.ndarray):
+    """Convert epoch milliseconds into naive Asia/Bangkok datetime64 in one vectorized step"""
+    return (np.asarray(timestamps, dtype='int64') + _BANGKOK_UTC_OFFSET_MS).astype('datetime64[ms]').astype('datetime64[ns]')
+
+
+def _pivot_columnar_data(data: dict):
+    """
+    Pivot columnar (timestamp, device_id, datapoint, value) arrays into the same layout as `_pre_process_timeseries_data`
+    (datetime index, `device_id` column, one column per datapoint keeping the first value) through a pre-sized array
+    """
+    datetimes = _epoch_ms_to_bangkok_datetime(data['timestamp'])
+    values = data['value']
+    valid = ~pd.isna(values)
+
+    datetime_codes, datetime_uniques = pd.factorize(datetimes, sort=True)
+    device_codes, device_uniques = pd.factorize(data['device_id'], sort=True)
+    datapoint_codes, datapoint_uniques = pd.factorize(data['datapoint'], sort=True)
+
+    # one output row per (datetime, device_id) pair with a value, ordered by datetime then device_id
+    row_keys = datetime_codes.astype('int64') * len(device_uniques) + device_codes
+    row_codes, row_uniques = pd.factorize(row_keys[valid], sort=True)
+
+    # keep the first value of each (row, datapoint) cell, same as `aggfunc='first'`
+    cells = row_codes.astype('int64') * len(datapoint_uniques) + datapoint_codes[valid]
+    cells, first_idx = np.unique(cells, return_index=True)
+    table = np.full((len(row_uniques), len(datapoint_uniques)), np.nan, dtype=object)
+    table.ravel()[cells] = values[valid][first_idx]
+
+    df = pd.DataFrame(table, columns=list(datapoint_uniques),
+                      index=pd.DatetimeIndex(datetime_uniques[row_uniques // len(device_uniques)], name='datetime'))
+    df.insert(0, 'device_id', device_uniques[row_uniques % len(device_uniques)])
+    return _convert_columns_to_float(df, skip_columns=('device_id',))
+
+
+@STAGE_METRICS.timed("pivot")
 def _pre_process_timeseries_data(data: list, **kwargs):
     """
     Post-process the raw data into a dataframe with datetime as index
@@ -80,26 +372,165 @@ def _pre_process_timeseries_data(data: list, **kwargs):
         data (list): List of data from database. Each element is a dictionary with column name as keys.
         kwargs (dict): Dictionary of arguments to specify how to post-process the data. Avaiable arguments are as below
         - pivot_datapoint_column (bool): If True, pivot datapoint column to be columns of the dataframe
+        - aggregation (dict): If given, rows are already aggregated per device per bucket (see `query_data_from_database`)
+
+    `data` can also be columnar ({<column_name>: np.ndarray}), which is pivoted without the pandas pivot_table
 
     """
+    if isinstance(data, dict) and (len(data) > 0) and kwargs.get('pivot_datapoint_column', True) and (not kwargs.get('aggregation')):
+        return _pivot_columnar_data(data)
+
     df = pd.DataFrame(data)
 
     if 'timestamp' in df.columns:
         df = _convert_timestamp_column_to_datetime_index(df, timestamp_column='timestamp', timestamp_unit='ms')
+    # Server-side aggregated rows are already one row per device per bucket
+    if kwargs.get('aggregation'):
+        df = df.reset_index().sort_values(['device_id', 'datetime'], kind='stable').reset_index(drop=True)
+        df = df[['device_id', 'datetime'] + [col for col in df.columns if col not in ('device_id', 'datetime')]]
+        df = _convert_columns_to_float(df, skip_columns=('device_id', 'datetime'))
     # Pivot the datapoint column if specified
-    if kwargs.get('pivot_datapoint_column', True):
+    elif kwargs.get('pivot_datapoint_column', True):
         df = df.pivot_table(index='datetime', columns=['device_id', 'datapoint'], values='value', aggfunc='first')
         df = df.stack('device_id').reset_index('device_id')
-        for col in df.columns:
-            try:
-                df[col] = df[col].astype(float)
-            except:
-                pass
-                # logging.debug(f"Column [{col}] cannot be converted to float")
+        df = _convert_columns_to_float(df)
+
+    return df
+
+
+def _convert_columns_to_float(df: pd.DataFrame, skip_columns: tuple=()):
+    """
+    Convert every column that holds numeric values into float, leaving the others untouched
+
+    Args:
+        df (pd.DataFrame): Dataframe to be converted
+        skip_columns (tuple): Columns to keep as they are (ex. `device_id`)
+
+    Returns:
+        df (pd.DataFrame): Dataframe with numeric columns as float
+
+    """
+    for col in df.columns:
+        if col in skip_columns:
+            continue
+        try:
+            df[col] = df[col].astype(float)
+        except:
+            pass
+            # logging.debug(f"Column [{col}] cannot be converted to float")
 
     return df
 
 
+# filter operators and their parameterized SQL condition (`IN` lists are bound as a single array argument)
+_FILTER_OPERATORS = {
+    ">": "{col} > ?",
+    "<": "{col} < ?",
+    ">=": "{col} >= ?",
+    "<=": "{col} <= ?",
+    "=": "{col} = ?",
+    "!=": "{col} != ?",
+    "LIKE": "{col} LIKE ?",
+    "NOT LIKE": "{col} NOT LIKE ?",
+    "IN": "{col} = ANY(?)",
+    "NOT IN": "NOT ({col} = ANY(?))",
+}
+
+
+def _quote_identifier(name: str):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+@functools.lru_cache(maxsize=128)
+def _build_query_template(table_name: str, columns: tuple, filter_shape: tuple, aggregation_shape: tuple):
+    """
+    Generate a parameterized SQL statement for a filter shape, cached so that the same statement text is reused
+
+    Args:
+        table_name (str): Name of the table to query from CrateDB
+        columns (tuple): Columns to select, or empty tuple for all columns
+        filter_shape (tuple): ((<column_name>, <operator>), ...) in the order of the bind arguments
+        aggregation_shape (tuple): (<bucket_minutes>, ((<datapoint>, "mean" | "last"), ...)), or empty tuple
+
+    Returns:
+        query_string (str): SQL statement with `?` placeholders; aggregation placeholders come before filter ones
+
+    """
+    if aggregation_shape:
+        bucket_minutes, datapoints = aggregation_shape
+        bucket_interval = f"'{int(bucket_minutes)} minutes'::INTERVAL"
+        # buckets are labelled with their right edge, same as pandas `resample(..., label='right')`
+        bucket_string = f'DATE_BIN({bucket_interval}, "timestamp", 0)'
+        select_columns = [f'{bucket_string} + {bucket_interval} AS "timestamp"', "device_id"]
+        for datapoint, aggfunc in datapoints:
+            if aggfunc == 'mean':
+                select_columns.append(f'AVG(TRY_CAST(value AS DOUBLE)) FILTER (WHERE datapoint = ?) AS {_quote_identifier(datapoint)}')
+            else:
+                select_columns.append(f'MAX_BY(value, "timestamp") FILTER (WHERE datapoint = ?) AS {_quote_identifier(datapoint)}')
+        select_string = ", ".join(select_columns)
+    elif columns:
+        select_string = ", ".join(_quote_identifier(col) for col in columns)
+    else:
+        select_string = "*"
+
+    conditions = [_FILTER_OPERATORS[oper].format(col=col_name) for col_name, oper in filter_shape]
+    query_string = f"SELECT {select_string} FROM {table_name}"
+    if conditions:
+        query_string += " WHERE " + "\nAND ".join(conditions)
+    if aggregation_shape:
+        query_string += f"\nGROUP BY {bucket_string}, device_id"
+    return query_string
+
+
+def _build_query(table_name: str, filters: dict, columns: list=None, datapoints: list=None, aggregation: dict=None):
+    """
+    Generate parameterized SQL statement and its bind arguments from the filters dictionary
+
+    Returns:
+        (query_string, args)
+
+    Raises:
+        ValueError: when an `aggregation` datapoint asks for another aggregation than "mean" or "last"
+
+    """
+    filter_shape = list()
+    args = list()
+
+    aggregation_shape = tuple()
+    if aggregation:
+        aggregation_datapoints = list()
+        for datapoint, aggfunc in aggregation.get('datapoints', dict()).items():
+            if aggfunc not in ('mean', 'last'):
+                raise ValueError(f"Invalid aggregation specified for querying data from CrateDB -- {datapoint}: {aggfunc}")
+            aggregation_datapoints.append((datapoint, aggfunc))
+            args.append(datapoint)
+        aggregation_shape = (int(aggregation.get('bucket_minutes', 5)), tuple(aggregation_datapoints))
+        # only fetch the aggregated datapoints
+        if datapoints is None:
+            datapoints = [datapoint for datapoint, _ in aggregation_datapoints]
+
+    if datapoints is not None:
+        filters = {**filters, 'datapoint': {**filters.get('datapoint', dict()), 'IN': list(datapoints)}}
+
+    for col_name, f in filters.items():
+
+        for oper, value in f.items():
+
+            if value is None:
+                logging.debug(f"Invalid value for column [{col_name}] -- value = {value}")
+                continue
+
+            if (oper.upper() in ["IN", "NOT IN"] and isinstance(value, (list, tuple))) or \
+                    (oper in [">", "<", ">=", "<=", "=", "!=", "LIKE", "NOT LIKE"]):
+                filter_shape.append((col_name, oper.upper()))
+                args.append(list(value) if isinstance(value, tuple) else value)
+            else:
+                print(f"Invalid filter specified for querying data from CrateDB -- {col_name}: {f}")
+
+    query_string = _build_query_template(table_name, tuple(columns or ()), tuple(filter_shape), aggregation_shape)
+    return query_string, args
+
+
 def query_data_from_database(cratedb_config: dict(), filters: dict, **kwargs):
     """
     Query data from datasource in config
@@ -116,11 +547,18 @@ def query_data_from_database(cratedb_config: dict(), filters: dict, **kwargs):
         }                                       |               }
                                                 |           }
     Supported operators: "=", "!=", ">", "<", ">=", "<=", "IN", "NOT IN", "LIKE", "NOT LIKE"
+    Values are sent as bind arguments; statements are cached by filter shape so the same SQL text is reused
 
         **kwargs: Additional arguments to be passed to the query function
         - table_name (str): Name of the table to query from CrateDB
         - location (str): Location of the data to query from CosmosDB
         - pivot_datapoint_column (bool): Whether to pivot the datapoint column or not
+        - columns (list): Columns to select instead of `*`, ex. ["timestamp", "device_id", "datapoint", "value"]
+        - datapoints (list): Only query these datapoints
+        - columnar (bool): Decode rows into NumPy arrays per column and pivot them without building a dict per row
+        - aggregation (dict): Push time bucketing and per-datapoint aggregation (mean/last) into CrateDB, returning one
+                              row per device per bucket with one column per datapoint (same layout as the pandas resample)
+                              ex. {"bucket_minutes": 5, "datapoints": {"humidity": "mean", "mode": "last"}}
 
     Returns:
         df (pd.DataFrame): Dataframe of queried and preprocessed data
@@ -129,40 +567,16 @@ def query_data_from_database(cratedb_config: dict(), filters: dict, **kwargs):
 
     # Step 1: Parse kwargs to get relevant variables
     table_name = kwargs.get('table_name', 'raw_data')
-    query_string = "SELECT * FROM {} WHERE ".format(table_name)
-    prefix = ""
-    col_prefix = ""
 
-    # Step 2: Generate query string from the given filters dictionary
-    for col_name, f in filters.items():
-
-        for oper, value in f.items():
-
-            if value is None:
-                logging.debug(f"Invalid value for column [{col_name}] -- value = {value}")
-                continue
-
-            # Preprocess value to be compatible with CrateDB query string
-            if isinstance(value, str):
-                value_string = f"'{value}'"
-            elif isinstance(value, list):
-                value_string = str(tuple(value)) if len(value) > 1 else str(tuple(value)).replace(",", "")
-            else:
-                value_string = str(value)
-
-            # Add filter to query string
-            if oper in [">", "<", ">=", "<=", "=", "!=", "LIKE", "NOT LIKE"]:
-                query_string += f"{prefix} {col_prefix+col_name} {oper} {value_string}"
-                prefix = "\nAND"
-            elif oper.upper() in ["IN", "NOT IN"] and isinstance(value, list):
-                query_string += f"{prefix} {col_prefix+col_name} {oper.upper()} {value_string}"
-                prefix = "\nAND"
-            else:
-                print(f"Invalid filter specified for querying data from CrateDB -- {col_name}: {f}")
+    # Step 2: Generate parameterized query string from the given filters dictionary
+    query_string, args = _build_query(table_name, filters,
+                                      columns=kwargs.get('columns'),
+                                      datapoints=kwargs.get('datapoints'),
+                                      aggregation=kwargs.get('aggregation'))
 
     # Step 3: Query raw data from specific datasource
-    logging.debug(f"Querying data from Database: {query_string}")
-    data: list = _execute_query_string(cratedb_config, query_string)
+    logging.debug(f"Querying data from Database: {query_string} args: {args}")
+    data = _execute_query_string(cratedb_config, query_string, args, columnar=kwargs.get('columnar', False))
     logging.debug(f"Finished querying data from Database")
     if not data:
         logging.debug(f"No data found for query in Database: {query_string}")
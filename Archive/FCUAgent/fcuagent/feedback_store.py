@@ -0,0 +1,103 @@
+import collections
+import time
+
+FEEDBACK_TYPES = ("Too Hot", "Too Cold")
+
+
+class FeedbackStore:
+    """
+    Recent tenant feedbacks of every thermal zone
+
+    Each zone keeps its feedbacks as (unix_timestamp, feedback_type, line_id) in a deque ordered by time, plus the set of
+    `line_id`s per feedback type. Insert and duplicate check are O(1), expired feedbacks are popped from the head of the
+    deque and the hot/cold counts are the sizes of the `line_id` sets.
+
+    A feedback is expired once it is at least `expired_minutes + 1` whole minutes old, same as
+    `pendulum.diff(...).in_minutes() > expired_minutes` used before.
+
+    """
+
+    def __init__(self, zone_names: list=()):
+        self._feedbacks = dict()  # {<zone_name>: deque([(unix_timestamp, feedback_type, line_id), ...])}
+        self._line_ids = dict()  # {<zone_name>: {<feedback_type>: {<line_id>, ...}}}
+        for zone_name in zone_names:
+            self.add_zone(zone_name)
+
+    def add_zone(self, zone_name: str):
+        zone_name = str(zone_name)
+        if zone_name not in self._feedbacks:
+            self._feedbacks[zone_name] = collections.deque()
+            self._line_ids[zone_name] = {feedback_type: set() for feedback_type in FEEDBACK_TYPES}
+
+    def remove_zone(self, zone_name: str):
+        self._feedbacks.pop(str(zone_name), None)
+        self._line_ids.pop(str(zone_name), None)
+
+    def __contains__(self, zone_name):
+        return str(zone_name) in self._feedbacks
+
+    def zone_names(self):
+        return list(self._feedbacks.keys())
+
+    def add(self, zone_name: str, feedback_type: str, line_id: str, unix_timestamp: float=None):
+        """Add a feedback unless the same `line_id` already gave this feedback type, return True when added"""
+        if feedback_type not in FEEDBACK_TYPES:
+            raise ValueError(f"invalid feedback type: {feedback_type}")
+        self.add_zone(zone_name)
+        line_ids = self._line_ids[str(zone_name)][feedback_type]
+        if line_id in line_ids:
+            return False
+
+        unix_timestamp = time.time() if unix_timestamp is None else unix_timestamp
+        feedbacks = self._feedbacks[str(zone_name)]
+        feedbacks.append((unix_timestamp, feedback_type, line_id))
+        # keep the deque ordered if the clock went backwards
+        if (len(feedbacks) > 1) and (feedbacks[-2][0] > unix_timestamp):
+            self._feedbacks[str(zone_name)] = collections.deque(sorted(feedbacks, key=lambda feedback: feedback[0]))
+        line_ids.add(line_id)
+        return True
+
+    def expire(self, zone_name: str, expired_minutes: float=30, now: float=None):
+        """Remove expired feedbacks of a zone, return the number of removed feedbacks"""
+        feedbacks = self._feedbacks.get(str(zone_name))
+        if not feedbacks:
+            return 0
+        now = time.time() if now is None else now
+        line_ids = self._line_ids[str(zone_name)]
+        removed = 0
+        while feedbacks and self.expiry_time(feedbacks[0][0], expired_minutes) <= now:
+            _, feedback_type, line_id = feedbacks.popleft()
+            line_ids[feedback_type].discard(line_id)
+            removed += 1
+        return removed
+
+    @staticmethod
+    def expiry_time(unix_timestamp: float, expired_minutes: float=30):
+        """Get unix timestamp when a feedback given at `unix_timestamp` expires"""
+        return unix_timestamp + (expired_minutes + 1) * 60
+
+    def next_expiry(self, zone_name: str, expired_minutes: float=30):
+        """Get unix timestamp when the oldest feedback of a zone expires, or None"""
+        feedbacks = self._feedbacks.get(str(zone_name))
+        if not feedbacks:
+            return None
+        return self.expiry_time(feedbacks[0][0], expired_minutes)
+
+    def counts(self, zone_name: str):
+        """Get number of ("Too Hot", "Too Cold") feedbacks of a zone"""
+        line_ids = self._line_ids.get(str(zone_name))
+        if line_ids is None:
+            return 0, 0
+        return len(line_ids["Too Hot"]), len(line_ids["Too Cold"])
+
+    def to_dict(self):
+        """{<zone_name>: {<feedback_type>: [{"unix_timestamp": <float>, "line_id": <str>}, ...]}}"""
+        states = dict()
+        for zone_name, feedbacks in self._feedbacks.items():
+            states[zone_name] = {feedback_type: list() for feedback_type in FEEDBACK_TYPES}
+            for unix_timestamp, feedback_type, line_id in feedbacks:
+                states[zone_name][feedback_type].append({"unix_timestamp": unix_timestamp, "line_id": line_id})
+        return states
+
+    def __repr__(self):
+        return repr(self.to_dict())
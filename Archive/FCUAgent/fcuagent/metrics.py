@@ -0,0 +1,5 @@
+from agentcommon.metrics import StageMetrics
+
+# process-wide stage metrics of the agent, shared by the data handler, the control logic and the agent (like the
+# connection pools), one instance per agent so that agents running in one process (ex. benchmarks) don't mix stages
+STAGE_METRICS = StageMetrics()
@@ -0,0 +1,135 @@
+import collections
+import time
+
+import pandas as pd
+
+from .data_handler import _convert_columns_to_float
+
+
+def _message_timestamp(message: dict):
+    """Get unix timestamp [sec] of a telemetry message, or None when it has no usable timestamp"""
+    _timestamp = message.get("unix_timestamp", message.get("timestamp"))
+    if isinstance(_timestamp, (int, float)) and not isinstance(_timestamp, bool):
+        # CrateDB / Tuya timestamps are in milliseconds
+        return _timestamp / 1000 if _timestamp > 1e11 else float(_timestamp)
+    return None
+
+
+class SensorWindow:
+    """
+    Bounded in-memory time window of telemetry per device, fed from the message bus
+
+    Each device keeps its samples as (unix_timestamp, {<datapoint>: <value>}) in arrival order. Samples older than
+    `window_minutes` are dropped on `expire`, and at most `max_samples` are kept per device so memory stays bounded
+    whatever the message rate.
+
+    Args:
+        window_minutes (float): Length of the kept time window
+        max_samples (int): Maximum number of samples kept per device
+
+    """
+
+    def __init__(self, window_minutes: float=30, max_samples: int=1000):
+        self.window_minutes = window_minutes
+        self.max_samples = max_samples
+        self._samples = dict()  # {<device_id>: deque([(unix_timestamp, {<datapoint>: <value>}), ...])}
+
+    def _device_samples(self, device_id: str):
+        samples = self._samples.get(device_id)
+        if samples is None:
+            samples = collections.deque(maxlen=self.max_samples)
+            self._samples[device_id] = samples
+        return samples
+
+    def add_message(self, device_id: str, message: dict):
+        """Add a telemetry message (flat JSON dict of datapoints) received from the message bus"""
+        unix_timestamp = _message_timestamp(message)
+        if unix_timestamp is None:
+            unix_timestamp = time.time()
+        values = {k: v for k, v in message.items()
+                  if (k not in ("timestamp", "unix_timestamp")) and isinstance(v, (int, float, str)) and not isinstance(v, bool)}
+        if len(values) > 0:
+            self._device_samples(device_id).append((unix_timestamp, values))
+
+    def add_records(self, df: pd.DataFrame):
+        """Backfill samples from a dataframe returned by `get_data`, keeping only rows newer than each device's last sample"""
+        if (len(df) <= 0) or ('device_id' not in df.columns):
+            return
+        unix_timestamps = df.index.tz_localize("Asia/Bangkok").asi8 / 1e9
+        datapoints = [col for col in df.columns if col != 'device_id']
+        order = unix_timestamps.argsort(kind="stable")
+        for unix_timestamp, device_id, row in zip(unix_timestamps[order], df['device_id'].values[order], df[datapoints].values[order]):
+            last_seen = self.last_seen(device_id)
+            if (last_seen is not None) and (unix_timestamp <= last_seen):
+                continue
+            values = {k: v for k, v in zip(datapoints, row) if not pd.isna(v)}
+            if len(values) > 0:
+                self._device_samples(device_id).append((float(unix_timestamp), values))
+
+    def last_seen(self, device_id: str):
+        """Get unix timestamp of the most recent sample of a device, or None"""
+        samples = self._samples.get(device_id)
+        if not samples:
+            return None
+        return samples[-1][0]
+
+    def gap_devices(self, device_ids: list, max_gap_minutes: float, now: float=None):
+        """Get devices without any sample in the last `max_gap_minutes`, which need a backfill from CrateDB"""
+        now = time.time() if now is None else now
+        gap_devices = list()
+        for device_id in device_ids:
+            last_seen = self.last_seen(device_id)
+            if (last_seen is None) or (now - last_seen > max_gap_minutes * 60):
+                gap_devices.append(device_id)
+        return gap_devices
+
+    def expire(self, now: float=None):
+        """Drop samples older than the window"""
+        now = time.time() if now is None else now
+        cutoff = now - self.window_minutes * 60
+        for device_id in list(self._samples.keys()):
+            samples = self._samples[device_id]
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+            if not samples:
+                del self._samples[device_id]
+
+    def remove_devices(self, device_ids: list):
+        for device_id in device_ids:
+            self._samples.pop(device_id, None)
+
+    def to_state(self):
+        """Samples of every device as plain data, {<device_id>: [[unix_timestamp, {<datapoint>: <value>}], ...]}"""
+        return {device_id: [[unix_timestamp, dict(values)] for unix_timestamp, values in samples]
+                for device_id, samples in self._samples.items()}
+
+    def restore_state(self, state: dict):
+        """Add `to_state` samples newer than each device's last sample (the last `max_samples` are kept)"""
+        for device_id, samples in (state or dict()).items():
+            last_seen = self.last_seen(device_id)
+            for unix_timestamp, values in samples:
+                if (last_seen is None) or (unix_timestamp > last_seen):
+                    self._device_samples(device_id).append((float(unix_timestamp), dict(values)))
+
+    def to_frame(self, device_ids: list, lookback: float, now: float=None):
+        """
+        Build a dataframe of the last `lookback` minutes of `device_ids` with the same layout as `get_data`
+        (naive Asia/Bangkok datetime index, `device_id` column and one column per datapoint)
+        """
+        now = time.time() if now is None else now
+        start = now - lookback * 60
+        unix_timestamps = list()
+        records = list()
+        for device_id in dict.fromkeys(device_ids):
+            for unix_timestamp, values in self._samples.get(device_id, ()):
+                if start <= unix_timestamp < now:
+                    unix_timestamps.append(unix_timestamp)
+                    records.append({'device_id': device_id, **values})
+        if len(records) <= 0:
+            return pd.DataFrame([])
+
+        df = pd.DataFrame(records)
+        df.index = pd.to_datetime(unix_timestamps, unit='s', utc=True).tz_convert("Asia/Bangkok").tz_localize(None)
+        df.index.name = 'datetime'
+        df = df.sort_index(kind="stable")
+        return _convert_columns_to_float(df, skip_columns=('device_id', 'datetime'))
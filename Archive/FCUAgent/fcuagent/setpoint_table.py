@@ -0,0 +1,114 @@
+import numpy as np
+
+from pythermalcomfort.models import a_pmv
+
+# candidate FCU setpoints, same as the scan in `get_target_temperature`
+SETPOINTS = np.arange(18, 31)
+
+# interpolated aPMV closer than this to the target is recomputed exactly
+INTERPOLATION_TOLERANCE = 0.02
+
+
+class SetpointTable:
+    """
+    Precomputed aPMV of every candidate setpoint over a relative humidity (and optional MRT) grid
+
+    The aPMV inputs (vr, met, clo, a_coefficient) only change on `configure`, so the aPMV of each candidate setpoint is
+    computed once for the whole grid with a single array call. A lookup linearly interpolates the aPMV row at the
+    requested humidity (and MRT) and applies the same first-crossing rule as `get_target_temperature`, so the target
+    aPMV does not need to be part of the grid.
+
+    Args:
+        vr, met, clo, a_coefficient (float): aPMV model inputs from the `apmv` config
+        rh_step (float): Relative humidity grid resolution [%] over 0-100%
+        mrt_range (list): Optional [min, max, step] of mean radiant temperature grid [C]. Without it, the table is built
+                          for `tr` equal to the setpoint (same as `get_target_temperature` with `mrt=None`)
+
+    """
+
+    def __init__(self, vr: float=0.1, met: float=1.1, clo: float=0.7, a_coefficient: float=0.2, rh_step: float=1.0, mrt_range: list=None):
+        self.vr = vr
+        self.met = met
+        self.clo = clo
+        self.a_coefficient = a_coefficient
+        self.rh_step = float(rh_step)
+        self.rh_grid = np.arange(0, 100 + self.rh_step, self.rh_step)
+
+        if mrt_range:
+            mrt_min, mrt_max, mrt_step = mrt_range
+            self.mrt_step = float(mrt_step)
+            self.mrt_grid = np.arange(mrt_min, mrt_max + self.mrt_step, self.mrt_step)
+            tr = self.mrt_grid[:, None, None]
+        else:
+            self.mrt_step = None
+            self.mrt_grid = None
+            tr = SETPOINTS[None, None, :]
+
+        # table[mrt_idx, rh_idx, setpoint_idx]
+        tdb, tr, rh = np.broadcast_arrays(SETPOINTS[None, None, :], tr, self.rh_grid[None, :, None])
+        self.table = self._a_pmv(tdb=tdb.ravel(), tr=tr.ravel(), rh=rh.ravel()).reshape(tdb.shape)
+
+    def _a_pmv(self, tdb, tr, rh):
+        return np.asarray(a_pmv(tdb=tdb, tr=tr, vr=self.vr, rh=rh, met=self.met, clo=self.clo, a_coefficient=self.a_coefficient, wme=0), dtype=float)
+
+    @staticmethod
+    def _grid_position(grid: np.ndarray, step: float, value: float):
+        """Get the two surrounding grid indices and the interpolation weight of `value`, or None when outside the grid"""
+        if (value < grid[0]) or (value > grid[-1]):
+            return None
+        lower = min(int((value - grid[0]) // step), len(grid) - 1)
+        upper = min(lower + 1, len(grid) - 1)
+        weight = (value - grid[lower]) / step if upper > lower else 0.0
+        return lower, upper, weight
+
+    def _interpolate_row(self, rh: float, mrt: float=None):
+        """Interpolate aPMV of each candidate setpoint, return None when the exact row has to be computed instead"""
+        # the table is built either for `tr` equal to setpoint or for a MRT grid
+        if (mrt is None) != (self.mrt_grid is None):
+            return None
+        rh_position = self._grid_position(self.rh_grid, self.rh_step, rh)
+        mrt_position = (0, 0, 0.0) if mrt is None else self._grid_position(self.mrt_grid, self.mrt_step, mrt)
+        if (rh_position is None) or (mrt_position is None):
+            return None
+
+        rh_lower, rh_upper, rh_weight = rh_position
+        mrt_lower, mrt_upper, mrt_weight = mrt_position
+        rows = self.table[[mrt_lower, mrt_upper]][:, [rh_lower, rh_upper]].reshape(4, len(SETPOINTS))
+        weights = np.outer([1 - mrt_weight, mrt_weight], [1 - rh_weight, rh_weight]).ravel()
+
+        # grid points on the edge of the model validity (NaN) can't be interpolated
+        nan_mask = np.isnan(rows)
+        if (nan_mask != nan_mask[0]).any():
+            return None
+        row = np.around(weights @ np.where(nan_mask, 0, rows), 2)
+        row[nan_mask[0]] = np.nan
+        return row
+
+    def _exact_row(self, rh: float, mrt: float=None):
+        tr = SETPOINTS if mrt is None else np.full(len(SETPOINTS), mrt, dtype=float)
+        return self._a_pmv(tdb=SETPOINTS, tr=tr, rh=np.full(len(SETPOINTS), rh, dtype=float))
+
+    def apmv_row(self, rh: float, mrt: float=None):
+        """Get aPMV of each candidate setpoint at relative humidity `rh` (and MRT `mrt`)"""
+        row = self._interpolate_row(rh, mrt)
+        if row is None:
+            row = self._exact_row(rh, mrt)
+        return row
+
+    def lookup(self, aPMV_target: float, rh: float, mrt: float=None, left=False):
+        """Same result as `get_target_temperature` with the table's aPMV inputs"""
+        # missing humidity / MRT / target (NaN): the scan finds no crossing and falls back to 25 C
+        if (not np.isfinite(rh)) or (not np.isfinite(aPMV_target)) or ((mrt is not None) and (not np.isfinite(mrt))):
+            return 25
+        row = self._interpolate_row(rh, mrt)
+        # aPMV is rounded to 2 decimals, so an interpolated value next to the target may fall on either side of it
+        if (row is None) or (np.abs(row - aPMV_target) <= INTERPOLATION_TOLERANCE).any():
+            row = self._exact_row(rh, mrt)
+
+        crossings = np.flatnonzero(row >= aPMV_target)
+        if len(crossings) <= 0:
+            return 25
+        idx = crossings[0]
+        if left:
+            return int(SETPOINTS[max(0, idx-1)])
+        return int(SETPOINTS[idx])
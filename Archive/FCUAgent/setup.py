@@ -17,7 +17,7 @@ setup(
     version=__version__,
     author="Pamekitti",
     author_email="pamekitti.p@gmail.com",
-    install_requires=['volttron'],
+    install_requires=['volttron', 'agentcommon', 'gevent'],
     packages=packages,
     entry_points={
         'setuptools.installation': [
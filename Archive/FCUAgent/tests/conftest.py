@@ -0,0 +1,11 @@
+import os
+import sys
+
+# import `fcuagent` and the shared `agentcommon` package from this checkout, agent-level tests run on the fake VOLTTRON
+# platform of the benchmarks (`fakes.make_agent`)
+AGENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+AGENT_COMMON_DIR = os.path.join(AGENT_DIR, "..", "AgentCommon")
+BENCHMARKS_DIR = os.path.join(AGENT_DIR, "..", "benchmarks")
+for _path in (AGENT_DIR, AGENT_COMMON_DIR, BENCHMARKS_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
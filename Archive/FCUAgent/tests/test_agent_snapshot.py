@@ -0,0 +1,68 @@
+import json
+import os
+import time
+
+import pandas as pd
+from fakes import make_agent
+from synthetic_building import fcu_mapping
+
+from fcuagent import data_handler
+from fcuagent.agent import Fcuagent
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config")
+
+
+def make_fcu_agent(data_dir):
+    with open(CONFIG_PATH) as config_file:
+        config = json.load(config_file)
+    config["thermal_zone_mapping"] = fcu_mapping(2)
+    config["automation"] = {**config["automation"], "streaming": True, "data_dir": data_dir}
+    return make_agent(Fcuagent, config, identity="test.fcuagent")
+
+
+def test_restart_restores_the_runtime_state(tmp_path):
+    data_handler.close_connection_pools()
+    agent = make_fcu_agent(str(tmp_path))
+    zone_name = next(iter(agent.thermal_zone_mapping))
+    device_infos = agent.thermal_zone_mapping[zone_name]
+    iaq_device_id, fcu_device_id = device_infos["iaq_device_ids"][0], device_infos["fcu_device_ids"][0]
+
+    _now = time.time()
+    for minute in range(5):
+        unix_timestamp = _now - 300 + minute * 60
+        agent.sensor_window.add_message(iaq_device_id, {"unix_timestamp": unix_timestamp, "temperature": 25, "humidity": 55})
+        agent.iaq_aggregator.add_sample(iaq_device_id, unix_timestamp, {"temperature": 25, "humidity": 55})
+        agent.fcu_aggregator.add_sample(fcu_device_id, unix_timestamp, {"mode": "cool", "set_temperature": 25, "room_temperature": 26})
+    agent.tenant_feedback_states.add(zone_name, "Too Hot", "line-1", unix_timestamp=_now)
+    agent._update_fcu_setpoint_offset(zone_name)
+    agent._save_snapshot()
+    assert os.listdir(tmp_path) == ["runtime_state.json"]
+
+    restarted = make_fcu_agent(str(tmp_path))
+    assert restarted.tenant_feedback_states.to_dict() == agent.tenant_feedback_states.to_dict()
+    assert restarted.setpoint_offset == agent.setpoint_offset
+    pd.testing.assert_frame_equal(restarted.sensor_window.to_frame([iaq_device_id], 15, now=_now),
+                                  agent.sensor_window.to_frame([iaq_device_id], 15, now=_now))
+    for name, device_id in (("iaq_aggregator", iaq_device_id), ("fcu_aggregator", fcu_device_id)):
+        pd.testing.assert_frame_equal(getattr(restarted, name).to_frame([device_id], 15, now=_now),
+                                      getattr(agent, name).to_frame([device_id], 15, now=_now))
+
+
+def test_restart_drops_expired_feedbacks_and_unmapped_zones(tmp_path):
+    data_handler.close_connection_pools()
+    agent = make_fcu_agent(str(tmp_path))
+    zone_names = list(agent.thermal_zone_mapping)
+    _now = time.time()
+    agent.tenant_feedback_states.add(zone_names[0], "Too Hot", "line-1", unix_timestamp=_now - (agent.feedback_expired_minutes + 1) * 60 - 1)
+    agent.tenant_feedback_states.add(zone_names[0], "Too Cold", "line-2", unix_timestamp=_now)
+    agent.tenant_feedback_states.add(zone_names[1], "Too Hot", "line-3", unix_timestamp=_now)
+    agent._save_snapshot()
+
+    with open(CONFIG_PATH) as config_file:
+        config = json.load(config_file)
+    config["thermal_zone_mapping"] = {zone_names[0]: agent.thermal_zone_mapping[zone_names[0]]}
+    config["automation"] = {**config["automation"], "streaming": True, "data_dir": str(tmp_path)}
+    restarted = make_agent(Fcuagent, config, identity="test.fcuagent")
+    feedbacks = restarted.tenant_feedback_states.to_dict()
+    assert list(feedbacks) == [zone_names[0]]
+    assert feedbacks[zone_names[0]] == {"Too Hot": [], "Too Cold": [{"unix_timestamp": _now, "line_id": "line-2"}]}
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from pythermalcomfort.models import a_pmv
+
+from fcuagent.automation_logic import compute_apmv
+
+APMV_PARAMS = {"vr": 0.1, "met": 1.1, "clo": 0.7, "a_coefficient": 0.2}
+
+
+def row_wise_apmv(iaq_df, vr, met, clo, a_coefficient):
+    """aPMV with the per-row `a_pmv` apply `compute_apmv` replaced (MRT is the air temperature)"""
+    return iaq_df.apply(lambda x: a_pmv(tdb=x.temperature, tr=x.temperature, vr=vr, rh=x.humidity, met=met, clo=clo,
+                                        a_coefficient=a_coefficient, wme=0), axis=1).values.astype(float)
+
+
+def test_compute_apmv_matches_the_row_wise_apply():
+    rng = np.random.default_rng(7)
+    iaq_df = pd.DataFrame({"temperature": rng.uniform(20, 30, 200), "humidity": rng.uniform(30, 80, 200)})
+    # missing humidity, missing temperature (also the MRT), both missing, out of the model's range
+    iaq_df.loc[[3, 50], "humidity"] = np.nan
+    iaq_df.loc[[7, 51], "temperature"] = np.nan
+    iaq_df.loc[[11], ["temperature", "humidity"]] = np.nan
+    iaq_df.loc[[13], "temperature"] = 45
+
+    apmv = compute_apmv(iaq_df["temperature"].values, iaq_df["humidity"].values, **APMV_PARAMS)
+    expected = row_wise_apmv(iaq_df, **APMV_PARAMS)
+    np.testing.assert_allclose(apmv, expected, equal_nan=True)
+    assert np.isnan(apmv[[3, 7, 11, 50, 51]]).all()
+    assert np.isfinite(np.delete(apmv, [3, 7, 11, 13, 50, 51])).all()
+
+
+def test_compute_apmv_of_an_empty_frame():
+    assert compute_apmv(pd.Series([], dtype=float), pd.Series([], dtype=float), **APMV_PARAMS).shape == (0,)
@@ -0,0 +1,73 @@
+import pandas as pd
+
+from fcuagent.automation_logic import resample_fcu_data
+from fcuagent.bucket_aggregator import BucketAggregator, FCU_AGGREGATIONS, IAQ_AGGREGATIONS
+
+# 5-minute bucket edge
+EDGE = 1700000100.0
+assert EDGE % 300 == 0
+
+
+def bucket_of(unix_timestamp):
+    aggregator = BucketAggregator(FCU_AGGREGATIONS)
+    aggregator.add_sample("fcu-1", unix_timestamp, {"mode": 1})
+    [(bucket_end, _)] = aggregator.to_state()["buckets"]["fcu-1"]
+    return bucket_end
+
+
+def test_buckets_are_closed_on_the_left_and_labelled_with_their_right_edge():
+    assert bucket_of(EDGE - 300) == EDGE
+    assert bucket_of(EDGE - 0.001) == EDGE
+    assert bucket_of(EDGE) == EDGE + 300
+    assert bucket_of(EDGE + 299.999) == EDGE + 300
+
+
+def test_to_frame_matches_the_pandas_resample():
+    samples = [("fcu-1", EDGE - 600, {"mode": 1, "set_temperature": 25, "room_temperature": 26}),
+               ("fcu-1", EDGE - 300, {"mode": 2, "set_temperature": 24, "room_temperature": 27}),
+               ("fcu-1", EDGE - 1, {"mode": 1, "set_temperature": 23, "room_temperature": 28}),
+               ("fcu-1", EDGE, {"mode": 3, "set_temperature": 22, "room_temperature": 25}),
+               # empty bucket in between
+               ("fcu-1", EDGE + 600, {"mode": 1, "set_temperature": 26, "room_temperature": 24}),
+               ("fcu-2", EDGE + 300, {"mode": 1, "set_temperature": 25, "room_temperature": 26})]
+    aggregator = BucketAggregator(FCU_AGGREGATIONS)
+    for device_id, unix_timestamp, values in samples:
+        aggregator.add_sample(device_id, unix_timestamp, values)
+
+    index = pd.to_datetime([unix_timestamp for _, unix_timestamp, _ in samples], unit="s", utc=True)
+    fcu_df = pd.DataFrame([{"device_id": device_id, **values} for device_id, _, values in samples],
+                          index=index.tz_convert("Asia/Bangkok").tz_localize(None).rename("datetime"))
+    expected = resample_fcu_data(fcu_df)
+    result = aggregator.to_frame(["fcu-1", "fcu-2"], 30, now=EDGE + 601)
+    pd.testing.assert_frame_equal(result, expected[result.columns], check_dtype=False)
+    assert result["room_temperature"].tolist()[:2] == [26, 27.5]
+
+
+def test_lookback_keeps_buckets_overlapping_the_window():
+    aggregator = BucketAggregator(IAQ_AGGREGATIONS)
+    for unix_timestamp in (EDGE - 900, EDGE - 600, EDGE - 300, EDGE):
+        aggregator.add_sample("iaq-1", unix_timestamp, {"temperature": 24, "humidity": 55})
+    # buckets ending after now - lookback, up to the bucket still filling
+    df = aggregator.to_frame(["iaq-1"], 10, now=EDGE + 1)
+    assert [ts.timestamp() for ts in df["datetime"].dt.tz_localize("Asia/Bangkok")] == [EDGE - 300, EDGE, EDGE + 300]
+
+
+def test_expire_drops_buckets_past_the_retention():
+    aggregator = BucketAggregator(IAQ_AGGREGATIONS, retention_minutes=10)
+    aggregator.add_sample("iaq-1", EDGE - 601, {"temperature": 24})
+    aggregator.add_sample("iaq-1", EDGE - 1, {"temperature": 25})
+    aggregator.add_sample("iaq-2", EDGE - 700, {"temperature": 25})
+    aggregator.expire(now=EDGE + 599)
+    assert [bucket_end for bucket_end, _ in aggregator.to_state()["buckets"]["iaq-1"]] == [EDGE]
+    assert "iaq-2" not in aggregator.to_state()["last_seen"]
+
+    # bucket ending exactly at the cutoff is dropped, with the device once it has no bucket left
+    aggregator.expire(now=EDGE + 600)
+    assert aggregator.to_state() == {"buckets": {}, "last_seen": {}}
+
+
+def test_last_keeps_the_latest_sample_whatever_the_arrival_order():
+    aggregator = BucketAggregator(FCU_AGGREGATIONS)
+    aggregator.add_sample("fcu-1", EDGE + 10, {"mode": 2})
+    aggregator.add_sample("fcu-1", EDGE + 5, {"mode": 1})
+    assert aggregator.to_frame(["fcu-1"], 15, now=EDGE + 20)["mode"].tolist() == [2]
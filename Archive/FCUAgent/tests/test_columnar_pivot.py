@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fcuagent.data_handler import _pre_process_timeseries_data, _rows_to_columns
+
+COLUMNS = ['timestamp', 'device_id', 'datapoint', 'value']
+START = 1700000000000
+
+
+def pivot_both_ways(rows):
+    expected = _pre_process_timeseries_data([dict(zip(COLUMNS, row)) for row in rows])
+    # the order of datapoint columns after `stack` depends on the pandas version, columns are read by name
+    expected = expected[['device_id'] + sorted(column for column in expected.columns if column != 'device_id')]
+    expected.columns.name = None
+    return expected, _pre_process_timeseries_data(_rows_to_columns(COLUMNS, rows))
+
+
+def test_rows_to_columns():
+    columns = _rows_to_columns(COLUMNS, [(START, "iaq-1", "temperature", "24.5"), (START + 1, "fcu-1", "mode", '"cool"')])
+    assert list(columns) == COLUMNS
+    assert columns['timestamp'].dtype == 'int64'
+    assert list(columns['value']) == ["24.5", '"cool"']
+    assert _rows_to_columns(COLUMNS, []) == dict()
+
+
+def test_columnar_pivot_matches_the_pivot_table():
+    rows = list()
+    for minute in range(5):
+        timestamp = START + minute * 60000
+        rows += [(timestamp, "iaq-1", "temperature", str(24 + minute / 10)), (timestamp, "iaq-1", "humidity", "55"),
+                 (timestamp + 7, "fcu-1", "mode", '"cool"'), (timestamp + 7, "fcu-1", "set_temperature", "25"),
+                 (timestamp + 7, "fcu-1", "room_temperature", str(26 + minute / 10))]
+    expected, result = pivot_both_ways(rows)
+    pd.testing.assert_frame_equal(expected, result)
+    assert list(result.columns) == ['device_id', 'humidity', 'mode', 'room_temperature', 'set_temperature', 'temperature']
+
+
+def test_duplicate_timestamps_keep_the_first_value():
+    rows = [(START, "iaq-1", "temperature", "24"), (START, "iaq-1", "humidity", "55"),
+            (START, "iaq-1", "temperature", "30"),  # same device, datapoint and timestamp
+            (START, "iaq-2", "temperature", "25"),  # other device at the same timestamp
+            (START + 60000, "iaq-1", "temperature", "24.5")]
+    expected, result = pivot_both_ways(rows)
+    pd.testing.assert_frame_equal(expected, result)
+    assert result.loc[result['device_id'] == "iaq-1", 'temperature'].tolist() == [24, 24.5]
+    assert len(result.loc[pd.Timestamp(START, unit='ms') + pd.Timedelta(hours=7)]) == 2
+
+
+def test_missing_datapoints_are_nan():
+    rows = [(START, "iaq-1", "temperature", "24"), (START, "iaq-1", "humidity", "55"),
+            (START + 60000, "iaq-1", "temperature", "24.5"),  # no humidity
+            (START + 60000, "iaq-2", "humidity", None),  # no value at all: no row
+            (START + 120000, "iaq-2", "humidity", "60")]
+    expected, result = pivot_both_ways(rows)
+    pd.testing.assert_frame_equal(expected, result)
+    assert result['device_id'].tolist() == ["iaq-1", "iaq-1", "iaq-2"]
+    assert result['humidity'].isna().tolist() == [False, True, False]
+    assert result['temperature'].isna().tolist() == [False, False, True]
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_columnar_pivot_matches_the_pivot_table_on_shuffled_rows(seed):
+    rng = np.random.default_rng(seed)
+    rows = [(START + int(rng.integers(0, 10)) * 60000, f"device-{int(rng.integers(0, 4))}",
+             str(rng.choice(["temperature", "humidity", "mode"])), str(round(float(rng.uniform(18, 35)), 2)))
+            for _ in range(300)]
+    expected, result = pivot_both_ways(rows)
+    pd.testing.assert_frame_equal(expected, result)
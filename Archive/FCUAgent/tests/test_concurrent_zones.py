@@ -0,0 +1,78 @@
+import json
+import os
+
+import gevent
+import gevent.event
+from fakes import make_agent
+
+from fcuagent.agent import Fcuagent
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config")
+
+
+def make_fcu_agent(zone_concurrency=8, tick_deadline_seconds=0.05):
+    with open(CONFIG_PATH) as config_file:
+        config = json.load(config_file)
+    config["automation"] = {**config["automation"], "concurrent_zones": True, "zone_concurrency": zone_concurrency,
+                            "tick_deadline_seconds": tick_deadline_seconds}
+    agent = make_agent(Fcuagent, config, identity="test.fcuagent")
+    agent.calls = list()
+    agent.release = {zone_name: gevent.event.Event() for zone_name in ("zone-slow", "zone-fast", "zone-other")}
+    agent.release["zone-fast"].set()
+    agent.release["zone-other"].set()
+
+    def evaluate_zone(zone_name, *args):
+        agent.calls.append(zone_name)
+        agent.release[zone_name].wait()
+        return [f"command of {zone_name}"]
+
+    agent._evaluate_zone = evaluate_zone
+    return agent
+
+
+def zone_jobs(*zone_names):
+    return [(zone_name, dict(), None, None, 0.1, None) for zone_name in zone_names]
+
+
+def test_late_zone_is_left_running_and_not_respawned():
+    agent = make_fcu_agent()
+    zones_messages = agent._evaluate_zones_concurrently(zone_jobs("zone-slow", "zone-fast"))
+    assert zones_messages == {"zone-fast": ["command of zone-fast"]}
+    assert agent.late_zones == ["zone-slow"]
+    late_greenlet = agent._late_greenlets["zone-slow"]
+    assert not late_greenlet.dead
+
+    # still running at the next tick: reported late again, not evaluated a second time
+    zones_messages = agent._evaluate_zones_concurrently(zone_jobs("zone-slow", "zone-fast"))
+    assert zones_messages == {"zone-fast": ["command of zone-fast"]}
+    assert agent.late_zones == ["zone-slow"]
+    assert agent._late_greenlets["zone-slow"] is late_greenlet
+    assert agent.calls.count("zone-slow") == 1
+
+
+def test_result_of_a_late_zone_is_dropped():
+    agent = make_fcu_agent()
+    agent._evaluate_zones_concurrently(zone_jobs("zone-slow"))
+
+    # finishing during the next tick: its result belongs to the earlier tick
+    agent.release["zone-other"].clear()
+    gevent.spawn_later(0.01, agent.release["zone-slow"].set)
+    gevent.spawn_later(0.02, agent.release["zone-other"].set)
+    assert agent._evaluate_zones_concurrently(zone_jobs("zone-slow", "zone-other")) == {"zone-other": ["command of zone-other"]}
+    assert agent.late_zones == ["zone-slow"]
+    assert agent._late_greenlets["zone-slow"].successful()
+
+    # finished: evaluated again on fresh data
+    assert agent._evaluate_zones_concurrently(zone_jobs("zone-slow")) == {"zone-slow": ["command of zone-slow"]}
+    assert agent.late_zones == []
+    assert agent._late_greenlets == dict()
+    assert agent.calls.count("zone-slow") == 2
+
+
+def test_late_zone_does_not_hold_a_pool_slot():
+    agent = make_fcu_agent(zone_concurrency=1)
+    agent._evaluate_zones_concurrently(zone_jobs("zone-slow"))
+    assert agent._evaluate_zones_concurrently(zone_jobs("zone-slow", "zone-other")) == {"zone-other": ["command of zone-other"]}
+    assert agent.late_zones == ["zone-slow"]
+    agent.release["zone-slow"].set()
+    gevent.sleep(0)
@@ -0,0 +1,186 @@
+import threading
+
+import pytest
+
+from fcuagent import data_handler
+from fcuagent.data_handler import CrateConnectionPool
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = [("1",)]
+
+    def execute(self, query_string, args=None):
+        if query_string == "SELECT 1":
+            self.connection.client.on_health_check(self.connection)
+            if not self.connection.healthy:
+                raise data_handler.CrateConnectionError("connection lost")
+            return
+        self.connection.client.on_query(self.connection)
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, client):
+        self.client = client
+        self.healthy = True
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    """Stand-in for `crate.client`, `fail_connect` makes the next `connect` calls raise"""
+
+    def __init__(self):
+        self.connections = []
+        self.fail_connect = False
+        self.on_health_check = lambda connection: None
+        self.on_query = lambda connection: None
+
+    def connect(self, *args, **kwargs):
+        if self.fail_connect:
+            raise data_handler.CrateConnectionError("no route to host")
+        connection = FakeConnection(self)
+        self.connections.append(connection)
+        return connection
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(data_handler, "client", fake)
+    return fake
+
+
+def make_pool(**kwargs):
+    return CrateConnectionPool({"host": "localhost", "port": 4200}, **{"checkout_timeout": 0.1, **kwargs})
+
+
+def test_released_connection_is_reused(fake_client):
+    pool = make_pool(size=2)
+    connection = pool.checkout()
+    pool.release(connection)
+    assert pool.checkout() is connection
+    assert pool.stats["created"] == 1
+
+
+def test_exhausted_pool_times_out(fake_client):
+    pool = make_pool(size=1)
+    pool.checkout()
+    with pytest.raises(TimeoutError):
+        pool.checkout()
+
+
+def test_health_check_runs_outside_the_lock(fake_client):
+    pool = make_pool(size=1, health_check_interval=0)
+    pool.release(pool.checkout())
+
+    lock_free = []
+
+    def try_lock(connection):
+        # another thread must be able to take the pool lock during the health check
+        def acquire():
+            acquired = pool._cond.acquire(blocking=False)
+            if acquired:
+                pool._cond.release()
+            lock_free.append(acquired)
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        thread.join()
+
+    fake_client.on_health_check = try_lock
+    pool.checkout()
+    assert lock_free == [True]
+
+
+def test_failed_health_check_reconnects(fake_client):
+    pool = make_pool(size=1, health_check_interval=0)
+    connection = pool.checkout()
+    pool.release(connection)
+    connection.healthy = False
+
+    new_connection = pool.checkout()
+    assert new_connection is not connection
+    assert connection.closed
+    assert pool.stats["reconnects"] == 1
+    assert pool._open_count == 1
+
+
+def test_failed_reconnect_gives_the_slot_back(fake_client):
+    pool = make_pool(size=1, health_check_interval=0)
+    connection = pool.checkout()
+    pool.release(connection)
+    connection.healthy = False
+    fake_client.fail_connect = True
+
+    with pytest.raises(data_handler.CrateConnectionError):
+        pool.checkout()
+    assert pool._open_count == 0
+
+    fake_client.fail_connect = False
+    assert pool.checkout() is not None
+
+
+def test_failed_connect_gives_the_slot_back(fake_client):
+    pool = make_pool(size=1)
+    fake_client.fail_connect = True
+    for _ in range(3):
+        with pytest.raises(data_handler.CrateConnectionError):
+            pool.checkout()
+    assert pool._open_count == 0
+
+
+def test_killed_query_gives_the_connection_back(fake_client):
+    gevent = pytest.importorskip("gevent")
+    pool = make_pool(size=1)
+    fake_client.on_query = lambda connection: gevent.sleep(10)
+
+    greenlet = gevent.spawn(pool.execute, "SELECT * FROM raw_data")
+    gevent.sleep(0)
+    greenlet.kill()
+
+    # the interrupted connection is closed, its slot is free again
+    assert pool._open_count == 0
+    assert fake_client.connections[0].closed
+    fake_client.on_query = lambda connection: None
+    assert pool.execute("SELECT * FROM raw_data")[0] == [(1,)]
+
+
+def test_query_error_keeps_the_connection(fake_client):
+    pool = make_pool(size=1)
+
+    def fail(connection):
+        raise ValueError("invalid statement")
+
+    fake_client.on_query = fail
+    with pytest.raises(ValueError):
+        pool.execute("SELECT * FROM raw_data")
+    assert pool._open_count == 1
+    assert len(pool._idle) == 1
+
+
+def test_connection_error_retries_on_a_new_connection(fake_client):
+    pool = make_pool(size=1)
+    calls = []
+
+    def fail_once(connection):
+        calls.append(connection)
+        if len(calls) == 1:
+            raise data_handler.CrateConnectionError("connection reset")
+
+    fake_client.on_query = fail_once
+    assert pool.execute("SELECT * FROM raw_data")[0] == [(1,)]
+    assert calls[0].closed and (calls[1] is not calls[0])
+    assert pool._open_count == 1
@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+from fakes import make_agent
+from synthetic_building import StubCrateClient, fcu_mapping, generate_series
+
+from fcuagent import data_handler
+from fcuagent.agent import Fcuagent
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config")
+
+
+@pytest.fixture
+def stub_client(monkeypatch):
+    thermal_zone_mapping = fcu_mapping(3)
+    stub = StubCrateClient(generate_series(thermal_zone_mapping, minutes=60))
+    data_handler.close_connection_pools()
+    monkeypatch.setattr(data_handler, "client", stub)
+    yield stub
+    data_handler.close_connection_pools()
+
+
+def make_fcu_agent(ttl_seconds):
+    with open(CONFIG_PATH) as config_file:
+        config = json.load(config_file)
+    config["thermal_zone_mapping"] = fcu_mapping(3)
+    config["automation"] = {**config["automation"], "decision_cache_ttl_seconds": ttl_seconds}
+    config["cratedb_config"] = {**config["cratedb_config"], "host": "synthetic-building"}
+    return make_agent(Fcuagent, config, identity="test.fcuagent")
+
+
+def test_cron_ticks_bypass_the_cache(tmp_path, monkeypatch, stub_client):
+    monkeypatch.chdir(tmp_path)
+    agent = make_fcu_agent(ttl_seconds=600)
+    agent.fcu_automation()
+    stub_client.reset_counters()
+    agent.fcu_automation()
+    assert stub_client.queries > 0
+
+
+def test_feedback_evaluation_reuses_the_cached_decision(tmp_path, monkeypatch, stub_client):
+    monkeypatch.chdir(tmp_path)
+    agent = make_fcu_agent(ttl_seconds=600)
+    agent.fcu_automation()
+    stub_client.reset_counters()
+    agent.fcu_automation(next(iter(agent.thermal_zone_mapping)))
+    assert stub_client.queries == 0
+
+
+def test_decision_expiring_mid_tick_is_still_used(tmp_path, monkeypatch, stub_client):
+    monkeypatch.chdir(tmp_path)
+    agent = make_fcu_agent(ttl_seconds=600)
+    agent.fcu_automation()
+    zone_name = next(iter(agent.thermal_zone_mapping))
+    evaluate_zone = agent._evaluate_zone
+
+    def expire_then_evaluate(*zone_job):
+        # the cached decision expires after the zone was selected, before it is evaluated
+        agent.decision_cache_ttl_seconds = 0
+        return evaluate_zone(*zone_job)
+
+    agent._evaluate_zone = expire_then_evaluate
+    n_published = len(agent.vip.pubsub.published)
+    agent.fcu_automation(zone_name)
+    assert len(agent.vip.pubsub.published) > n_published
+
+
+def test_expired_decision_is_recomputed(tmp_path, monkeypatch, stub_client):
+    monkeypatch.chdir(tmp_path)
+    agent = make_fcu_agent(ttl_seconds=600)
+    agent.fcu_automation()
+    zone_name = next(iter(agent.thermal_zone_mapping))
+    agent.zone_decisions[zone_name]["unix_timestamp"] -= 600
+    stub_client.reset_counters()
+    agent.fcu_automation(zone_name)
+    assert stub_client.queries > 0
+
+
+def test_zero_ttl_disables_the_cache(tmp_path, monkeypatch, stub_client):
+    monkeypatch.chdir(tmp_path)
+    agent = make_fcu_agent(ttl_seconds=0)
+    agent.fcu_automation()
+    assert agent.zone_decisions == dict()
+
+
+def test_reconfigure_invalidates_the_cache(tmp_path, monkeypatch, stub_client):
+    monkeypatch.chdir(tmp_path)
+    agent = make_fcu_agent(ttl_seconds=600)
+    agent.fcu_automation()
+    zone_names = list(agent.thermal_zone_mapping)
+
+    # other devices in 1 zone: only its decision is dropped
+    config = {"automation": dict(agent.automation), "apmv": dict(agent.apmv), "cratedb_config": dict(agent.cratedb_config),
+              "thermal_zone_mapping": {**agent.thermal_zone_mapping,
+                                       zone_names[0]: {**agent.thermal_zone_mapping[zone_names[0]], "fcu_device_ids": ["fcu-new"]}}}
+    agent.configure("config", "UPDATE", config)
+    assert sorted(agent.zone_decisions) == sorted(zone_names[1:])
+
+    # other thresholds: every decision is dropped
+    config["automation"] = {**config["automation"], "aPMV_target": 0.1}
+    agent.configure("config", "UPDATE", config)
+    assert agent.zone_decisions == dict()
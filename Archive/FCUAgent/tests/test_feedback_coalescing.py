@@ -0,0 +1,64 @@
+import json
+import os
+
+from fakes import make_agent
+from synthetic_building import fcu_mapping
+
+from fcuagent.agent import Fcuagent
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config")
+
+
+def make_fcu_agent(coalesce_seconds=5):
+    with open(CONFIG_PATH) as config_file:
+        config = json.load(config_file)
+    config["thermal_zone_mapping"] = fcu_mapping(2)
+    config["automation"] = {**config["automation"], "feedback_coalesce_seconds": coalesce_seconds}
+    agent = make_agent(Fcuagent, config, identity="test.fcuagent")
+    agent.evaluations = list()
+    agent.fcu_automation = lambda selected_zone_name=None: agent.evaluations.append(selected_zone_name)
+    return agent
+
+
+def send_feedback(agent, zone_name, feedback, line_id):
+    agent.vip.pubsub.deliver(agent.feedback_mqtt_topic, {"feedback": feedback, "zone": zone_name, "lineId": line_id})
+
+
+def test_feedback_burst_is_coalesced_into_one_evaluation():
+    agent = make_fcu_agent()
+    zone_1, zone_2 = agent.thermal_zone_mapping
+    for line in range(5):
+        send_feedback(agent, zone_1, "Too Hot", f"line-{line}")
+    send_feedback(agent, zone_2, "Too Cold", "line-0")
+    assert agent.evaluations == []
+
+    pending = agent.core.pending(agent._run_zone_evaluation)
+    assert [event.args for event in pending] == [(zone_1,), (zone_2,)]
+    for event in pending:
+        event.run()
+    assert agent.evaluations == [zone_1, zone_2]
+    assert agent.setpoint_offset == {zone_1: -1, zone_2: 1}
+    assert agent.get_feedback_metrics() == {"events_received": 6, "events_coalesced": 4, "evaluations_run": 2, "pending_zones": []}
+
+    # a later feedback opens a new window
+    send_feedback(agent, zone_1, "Too Cold", "line-9")
+    assert [event.args for event in agent.core.pending(agent._run_zone_evaluation)] == [(zone_1,)]
+
+
+def test_zero_coalesce_seconds_evaluates_every_feedback():
+    agent = make_fcu_agent(coalesce_seconds=0)
+    zone_1, _ = agent.thermal_zone_mapping
+    for line in range(3):
+        send_feedback(agent, zone_1, "Too Hot", f"line-{line}")
+    assert agent.evaluations == [zone_1] * 3
+    assert agent.core.pending(agent._run_zone_evaluation) == []
+
+
+def test_reset_cancels_pending_evaluations():
+    agent = make_fcu_agent()
+    zone_1, _ = agent.thermal_zone_mapping
+    send_feedback(agent, zone_1, "Too Hot", "line-1")
+    [event] = agent.core.pending(agent._run_zone_evaluation)
+    agent._reset_pending_zone_evaluations()
+    assert event.cancelled
+    assert agent.get_feedback_metrics()["pending_zones"] == []
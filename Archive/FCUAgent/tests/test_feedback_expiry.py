@@ -0,0 +1,106 @@
+import json
+import os
+
+from fakes import make_agent
+from synthetic_building import fcu_mapping
+
+from fcuagent import agent as agent_module
+from fcuagent.agent import Fcuagent
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config")
+NOW = 1700000000.0
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def make_fcu_agent(monkeypatch, expired_minutes=15):
+    clock = Clock(NOW)
+    monkeypatch.setattr(agent_module.time, "time", clock.time)
+    with open(CONFIG_PATH) as config_file:
+        config = json.load(config_file)
+    config["thermal_zone_mapping"] = fcu_mapping(2)
+    config["automation"] = {**config["automation"], "feedback_expired_minutes": expired_minutes}
+    agent = make_agent(Fcuagent, config, identity="test.fcuagent")
+    return agent, clock, list(agent.thermal_zone_mapping)
+
+
+def expiry_events(agent):
+    return agent.core.pending(agent._handle_feedback_expiry)
+
+
+def test_single_expiry_event_at_the_earliest_deadline(monkeypatch):
+    agent, clock, (zone_1, zone_2) = make_fcu_agent(monkeypatch)
+    agent._append_new_feedback(zone_1, "Too Hot", "line-1")
+    clock.now += 30
+    agent._append_new_feedback(zone_2, "Too Hot", "line-2")
+    clock.now += 30
+    agent._append_new_feedback(zone_1, "Too Cold", "line-3")
+    # duplicate: no new deadline
+    agent._append_new_feedback(zone_1, "Too Cold", "line-3")
+
+    assert len(agent._feedback_expiry_heap) == 3
+    [event] = expiry_events(agent)
+    assert event.deadline.timestamp() == NOW + 16 * 60
+
+
+def test_expiry_pops_due_deadlines_in_order(monkeypatch):
+    agent, clock, (zone_1, zone_2) = make_fcu_agent(monkeypatch)
+    agent._append_new_feedback(zone_1, "Too Hot", "line-1")
+    clock.now += 30
+    agent._append_new_feedback(zone_2, "Too Hot", "line-2")
+    clock.now += 30
+    agent._append_new_feedback(zone_1, "Too Cold", "line-3")
+    for zone_name in (zone_1, zone_2):
+        agent._update_fcu_setpoint_offset(zone_name)
+    assert agent.setpoint_offset == {zone_1: 0, zone_2: -1}
+
+    clock.now = NOW + 16 * 60
+    expiry_events(agent)[0].run()
+    assert agent.tenant_feedback_states.counts(zone_1) == (0, 1)
+    assert agent.tenant_feedback_states.counts(zone_2) == (1, 0)
+    [event] = expiry_events(agent)
+    assert event.deadline.timestamp() == NOW + 30 + 16 * 60
+    # offset of zone 1 changed: it is re-evaluated
+    assert agent.setpoint_offset[zone_1] == 1
+    assert [event.args for event in agent.core.pending(agent._run_zone_evaluation)] == [(zone_1,)]
+
+    # late timer: every due deadline is handled in one run
+    clock.now = NOW + 60 + 16 * 60
+    event.run()
+    assert agent.tenant_feedback_states.counts(zone_1) == (0, 0)
+    assert agent.tenant_feedback_states.counts(zone_2) == (0, 0)
+    assert agent._feedback_expiry_heap == []
+    assert expiry_events(agent) == []
+
+
+def test_unchanged_offset_is_not_re_evaluated(monkeypatch):
+    agent, clock, (zone_1, _) = make_fcu_agent(monkeypatch)
+    agent._append_new_feedback(zone_1, "Too Hot", "line-1")
+    clock.now += 60
+    agent._append_new_feedback(zone_1, "Too Hot", "line-2")
+    agent._update_fcu_setpoint_offset(zone_1)
+
+    clock.now = NOW + 16 * 60
+    expiry_events(agent)[0].run()
+    assert agent.tenant_feedback_states.counts(zone_1) == (1, 0)
+    assert agent.setpoint_offset[zone_1] == -1
+    assert agent.core.pending(agent._run_zone_evaluation) == []
+
+
+def test_expired_minutes_change_reschedules_every_feedback(monkeypatch):
+    agent, clock, (zone_1, zone_2) = make_fcu_agent(monkeypatch)
+    agent._append_new_feedback(zone_1, "Too Hot", "line-1")
+    clock.now += 60
+    agent._append_new_feedback(zone_2, "Too Cold", "line-2")
+
+    agent.feedback_expired_minutes = 5
+    agent._rebuild_feedback_expiry()
+    assert sorted(agent._feedback_expiry_heap) == [(NOW + 6 * 60, zone_1), (NOW + 60 + 6 * 60, zone_2)]
+    [event] = expiry_events(agent)
+    assert event.deadline.timestamp() == NOW + 6 * 60
@@ -0,0 +1,51 @@
+import pytest
+
+from fcuagent.feedback_store import FeedbackStore
+
+NOW = 1700000000.0
+
+
+def test_feedbacks_expire_oldest_first():
+    store = FeedbackStore(["zone-1"])
+    store.add("zone-1", "Too Hot", "line-1", unix_timestamp=NOW - 120)
+    store.add("zone-1", "Too Cold", "line-2", unix_timestamp=NOW - 60)
+    # arrives late, with an older timestamp
+    store.add("zone-1", "Too Hot", "line-3", unix_timestamp=NOW - 90)
+    assert store.next_expiry("zone-1", expired_minutes=15) == NOW - 120 + 16 * 60
+
+    assert store.expire("zone-1", expired_minutes=15, now=NOW - 120 + 16 * 60 - 1) == 0
+    # expired once `expired_minutes + 1` whole minutes old
+    assert store.expire("zone-1", expired_minutes=15, now=NOW - 120 + 16 * 60) == 1
+    assert store.counts("zone-1") == (1, 1)
+    assert store.next_expiry("zone-1", expired_minutes=15) == NOW - 90 + 16 * 60
+
+    assert store.expire("zone-1", expired_minutes=15, now=NOW - 60 + 16 * 60) == 2
+    assert store.counts("zone-1") == (0, 0)
+    assert store.next_expiry("zone-1", expired_minutes=15) is None
+
+
+def test_duplicate_feedbacks_are_ignored_until_expired():
+    store = FeedbackStore()
+    assert store.add("zone-1", "Too Hot", "line-1", unix_timestamp=NOW)
+    assert not store.add("zone-1", "Too Hot", "line-1", unix_timestamp=NOW + 60)
+    # the same line can give the other feedback type
+    assert store.add("zone-1", "Too Cold", "line-1", unix_timestamp=NOW + 60)
+    assert store.counts("zone-1") == (1, 1)
+
+    store.expire("zone-1", expired_minutes=15, now=NOW + 16 * 60)
+    assert store.add("zone-1", "Too Hot", "line-1", unix_timestamp=NOW + 16 * 60)
+    assert store.counts("zone-1") == (1, 1)
+
+
+def test_zones_expire_independently():
+    store = FeedbackStore(["zone-1", "zone-2"])
+    store.add("zone-1", "Too Hot", "line-1", unix_timestamp=NOW)
+    store.add("zone-2", "Too Hot", "line-1", unix_timestamp=NOW)
+    assert store.expire("zone-1", expired_minutes=0, now=NOW + 60) == 1
+    assert store.counts("zone-2") == (1, 0)
+    assert store.expire("zone-unknown", expired_minutes=0, now=NOW + 60) == 0
+
+
+def test_invalid_feedback_type_raises():
+    with pytest.raises(ValueError):
+        FeedbackStore().add("zone-1", "Too Humid", "line-1")
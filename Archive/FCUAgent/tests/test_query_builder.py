@@ -0,0 +1,66 @@
+import json
+import os
+
+import pytest
+from fakes import make_agent
+from synthetic_building import StubCrateClient, fcu_mapping, generate_series
+
+from fcuagent import data_handler
+from fcuagent.agent import Fcuagent
+from fcuagent.data_handler import _build_query
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config")
+
+
+def test_aggregation_query_binds_datapoints_first():
+    query_string, args = _build_query("raw_data", {"device_id": {"IN": ["fcu-1"]}},
+                                      aggregation={"bucket_minutes": 5, "datapoints": {"humidity": "mean", "mode": "last"}})
+    assert "DATE_BIN('5 minutes'" in query_string
+    assert "GROUP BY" in query_string
+    assert args == ["humidity", "mode", ["fcu-1"], ["humidity", "mode"]]
+
+
+def test_invalid_aggregation_raises():
+    with pytest.raises(ValueError, match="humidity: median"):
+        _build_query("raw_data", {}, aggregation={"datapoints": {"humidity": "median"}})
+    with pytest.raises(ValueError, match="mode: first"):
+        _build_query("raw_data", {}, aggregation={"datapoints": {"temperature": "mean", "mode": "first"}})
+
+
+def test_aggregation_query_shape():
+    query_string, _ = _build_query("raw_data", {"device_id": {"IN": ["iaq-1"]}},
+                                   aggregation={"bucket_minutes": 5, "datapoints": {"temperature": "mean", "mode": "last"}})
+    bucket_string = "DATE_BIN('5 minutes'::INTERVAL, \"timestamp\", 0)"
+    assert query_string.startswith(f'SELECT {bucket_string} + \'5 minutes\'::INTERVAL AS "timestamp", device_id, ')
+    assert 'AVG(TRY_CAST(value AS DOUBLE)) FILTER (WHERE datapoint = ?) AS "temperature"' in query_string
+    assert 'MAX_BY(value, "timestamp") FILTER (WHERE datapoint = ?) AS "mode"' in query_string
+    assert query_string.endswith(f"\nGROUP BY {bucket_string}, device_id")
+    # only the aggregated datapoints are fetched
+    assert " WHERE device_id = ANY(?)\nAND datapoint = ANY(?)\n" in query_string
+
+
+def test_server_side_aggregation_gives_the_same_decisions(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    thermal_zone_mapping = fcu_mapping(6)
+    stub = StubCrateClient(generate_series(thermal_zone_mapping, minutes=60))
+    monkeypatch.setattr(data_handler, "client", stub)
+    with open(CONFIG_PATH) as config_file:
+        config = json.load(config_file)
+    config["thermal_zone_mapping"] = thermal_zone_mapping
+    config["cratedb_config"] = {**config["cratedb_config"], "host": "synthetic-building"}
+
+    published = dict()
+    for server_side_aggregation in (False, True):
+        data_handler.close_connection_pools()
+        config["automation"] = {**config["automation"], "batch_query": True, "server_side_aggregation": server_side_aggregation}
+        agent = make_agent(Fcuagent, config, identity="test.fcuagent")
+        stub.reset_counters()
+        agent.fcu_automation()
+        published[server_side_aggregation] = [(topic, message["mode"], message["set_temperature"])
+                                              for topic, _, message in agent.vip.pubsub.published]
+        if server_side_aggregation:
+            # 1 aggregated query for IAQ and 1 for FCU devices
+            assert stub.queries == 2
+    data_handler.close_connection_pools()
+    assert len(published[False]) > 0
+    assert published[True] == published[False]
@@ -0,0 +1,58 @@
+from fcuagent.sensor_window import SensorWindow
+
+NOW = 1700000000.0
+
+
+def timestamps(window, device_id):
+    return [unix_timestamp for unix_timestamp, _ in window.to_state().get(device_id, [])]
+
+
+def test_expire_drops_samples_older_than_the_window():
+    window = SensorWindow(window_minutes=10)
+    for seconds_ago in (900, 601, 600, 300, 0):
+        window.add_message("iaq-1", {"unix_timestamp": NOW - seconds_ago, "temperature": 24})
+    window.add_message("iaq-2", {"unix_timestamp": NOW - 700, "temperature": 25})
+
+    window.expire(now=NOW)
+    # the sample exactly at the window edge is kept
+    assert timestamps(window, "iaq-1") == [NOW - 600, NOW - 300, NOW]
+    # devices without samples left are dropped
+    assert "iaq-2" not in window.to_state()
+    assert window.last_seen("iaq-2") is None
+
+
+def test_max_samples_evicts_the_oldest():
+    window = SensorWindow(window_minutes=30, max_samples=3)
+    for second in range(5):
+        window.add_message("iaq-1", {"unix_timestamp": NOW + second, "temperature": 24 + second})
+    assert timestamps(window, "iaq-1") == [NOW + 2, NOW + 3, NOW + 4]
+
+    restored = SensorWindow(window_minutes=30, max_samples=2)
+    restored.restore_state(window.to_state())
+    assert timestamps(restored, "iaq-1") == [NOW + 3, NOW + 4]
+
+
+def test_messages_without_values_are_ignored():
+    window = SensorWindow()
+    window.add_message("iaq-1", {"unix_timestamp": NOW, "online": True, "extra": {"nested": 1}})
+    assert window.last_seen("iaq-1") is None
+    # millisecond timestamps
+    window.add_message("iaq-1", {"timestamp": NOW * 1000, "temperature": 24})
+    assert window.last_seen("iaq-1") == NOW
+
+
+def test_to_frame_keeps_the_lookback_only():
+    window = SensorWindow(window_minutes=30)
+    for seconds_ago in (1200, 900, 899, 60, 0):
+        window.add_message("iaq-1", {"unix_timestamp": NOW - seconds_ago, "temperature": 24})
+    df = window.to_frame(["iaq-1"], 15, now=NOW)
+    # [now - lookback, now)
+    assert len(df) == 3
+    assert window.to_frame(["iaq-unknown"], 15, now=NOW).empty
+
+
+def test_gap_devices():
+    window = SensorWindow()
+    window.add_message("iaq-1", {"unix_timestamp": NOW - 60, "temperature": 24})
+    window.add_message("iaq-2", {"unix_timestamp": NOW - 600, "temperature": 24})
+    assert window.gap_devices(["iaq-1", "iaq-2", "iaq-3"], max_gap_minutes=5, now=NOW) == ["iaq-2", "iaq-3"]
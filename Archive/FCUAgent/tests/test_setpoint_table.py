@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from fcuagent.automation_logic import get_target_temperature
+from fcuagent.setpoint_table import SetpointTable
+
+APMV_PARAMS = {"vr": 0.1, "met": 1.1, "clo": 0.65, "a_coefficient": 0.2}
+
+
+@pytest.fixture(scope="module")
+def table():
+    return SetpointTable(**APMV_PARAMS)
+
+
+def test_lookup_matches_the_setpoint_scan(table):
+    rng = np.random.default_rng(0)
+    for rh, aPMV_target, left in zip(rng.uniform(20, 95, 100), rng.uniform(-0.5, 1.0, 100), rng.random(100) < 0.5):
+        expected = get_target_temperature(aPMV_target=aPMV_target, rh=rh, left=bool(left), **APMV_PARAMS)
+        assert table.lookup(aPMV_target=aPMV_target, rh=rh, left=bool(left)) == expected, (rh, aPMV_target, left)
+
+
+def test_lookup_on_grid_points_and_outside_the_grid(table):
+    for rh in (0.0, 50.0, 100.0, 120.0):
+        expected = get_target_temperature(aPMV_target=0.25, rh=rh, **APMV_PARAMS)
+        assert table.lookup(aPMV_target=0.25, rh=rh) == expected
+
+
+@pytest.mark.parametrize("rh, aPMV_target, mrt", [
+    (np.nan, 0.25, None),
+    (np.inf, 0.25, None),
+    (50.0, np.nan, None),
+    (50.0, 0.25, np.nan),
+])
+def test_non_finite_inputs_fall_back_to_the_scan_default(table, rh, aPMV_target, mrt):
+    assert table.lookup(aPMV_target=aPMV_target, rh=rh, mrt=mrt) == 25
+    assert get_target_temperature(aPMV_target=aPMV_target, rh=rh, mrt=mrt, **APMV_PARAMS) == 25
@@ -0,0 +1,48 @@
+import pandas as pd
+
+from agentcommon.snapshot import load_snapshot, save_snapshot
+from fcuagent.bucket_aggregator import BucketAggregator, FCU_AGGREGATIONS, IAQ_AGGREGATIONS
+from fcuagent.sensor_window import SensorWindow
+
+NOW = 1700000000.0
+
+
+def round_trip(tmp_path, state):
+    path = str(tmp_path / "runtime_state.json")
+    save_snapshot(path, state, unix_timestamp=NOW)
+    loaded, unix_timestamp = load_snapshot(path, now=NOW)
+    assert unix_timestamp == NOW
+    return loaded
+
+
+def test_sensor_window_round_trip(tmp_path):
+    window = SensorWindow(window_minutes=30)
+    for minute in range(10):
+        window.add_message("iaq-1", {"unix_timestamp": NOW - 600 + minute * 60, "temperature": 24 + minute / 10, "humidity": 55})
+    window.add_message("fcu-1", {"unix_timestamp": NOW - 60, "mode": "cool", "set_temperature": 25})
+
+    restored = SensorWindow(window_minutes=30)
+    restored.restore_state(round_trip(tmp_path, window.to_state()))
+    pd.testing.assert_frame_equal(restored.to_frame(["iaq-1", "fcu-1"], 15, now=NOW),
+                                  window.to_frame(["iaq-1", "fcu-1"], 15, now=NOW))
+    assert restored.last_seen("fcu-1") == NOW - 60
+
+
+def test_bucket_aggregator_round_trip(tmp_path):
+    iaq_aggregator = BucketAggregator(IAQ_AGGREGATIONS)
+    fcu_aggregator = BucketAggregator(FCU_AGGREGATIONS)
+    for minute in range(20):
+        unix_timestamp = NOW - 1200 + minute * 60
+        iaq_aggregator.add_sample("iaq-1", unix_timestamp, {"temperature": 24 + minute / 10, "humidity": 55})
+        fcu_aggregator.add_sample("fcu-1", unix_timestamp, {"mode": "cool", "set_temperature": 25, "room_temperature": 26})
+
+    state = round_trip(tmp_path, {"iaq_aggregator": iaq_aggregator.to_state(), "fcu_aggregator": fcu_aggregator.to_state()})
+    for aggregator, name, device_id in ((iaq_aggregator, "iaq_aggregator", "iaq-1"), (fcu_aggregator, "fcu_aggregator", "fcu-1")):
+        restored = BucketAggregator(aggregator.aggregations)
+        restored.restore_state(state[name])
+        pd.testing.assert_frame_equal(restored.to_frame([device_id], 15, now=NOW), aggregator.to_frame([device_id], 15, now=NOW))
+
+        # later samples keep aggregating into the restored buckets
+        for _aggregator in (aggregator, restored):
+            _aggregator.add_sample(device_id, NOW - 30, {"temperature": 30, "room_temperature": 30, "mode": "fan"})
+        pd.testing.assert_frame_equal(restored.to_frame([device_id], 15, now=NOW), aggregator.to_frame([device_id], 15, now=NOW))
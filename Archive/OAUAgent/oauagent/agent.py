@@ -9,6 +9,7 @@ Other agent integration:
 To start the agent, run the following commands:
 ```
 vctl remove --tag oau_control
+pip install ~/alto_os/Agents/Services/AgentCommon
 python ~/volttron/scripts/install-agent.py -s ~/alto_os/Agents/Services/OAUAgent -t oau_control -i oau_control
 vctl config store oau_control config ~/alto_os/Agents/Services/OAUAgent/config
 vctl enable --tag oau_control
@@ -19,19 +20,28 @@ vctl start --tag oau_control
 __docformat__ = 'reStructuredText'
 
 import logging
+import os
 import sys
 import json
+import time
 import pendulum
 from volttron.platform.agent import utils
 from volttron.platform.vip.agent import Agent, Core, RPC
 from volttron.platform.scheduling import periodic, cron
+from agentcommon.config_diff import DeviceZoneIndex, diff_zone_mapping
+from agentcommon.command_publisher import CommandTracker, COMMAND_BATCH_MESSAGE_TYPE, pack_command_batch
+from agentcommon.profiling import TickProfiler, agent_data_dir
+from agentcommon.snapshot import SNAPSHOT_FILE_NAME, save_snapshot, load_snapshot
 
-from .datastore import DeviceStore, ZoneStore, OAUState
+from .datastore import IAQArrayStore, ZoneStore, OAUState
+from .metrics import STAGE_METRICS
 
 _log = logging.getLogger(__name__)
 utils.setup_logging()
 __version__ = "0.1"
 
+IAQ_TOPIC_PREFIX = "sensor/tuya_air_quality/"
+
 
 def oauagent(config_path, **kwargs):
     """
@@ -80,6 +90,23 @@ class Oauagent(Agent):
         self.CO2_off = self.automation.get("CO2_off", 800)
         self.trigger_interval = self.automation.get('trigger_interval', 5)
         self.feedback_mqtt_topic = self.automation.get('feedback_mqtt_topic', "rl_correct/subiot/example/command")
+        self.change_only_commands = self.automation.get('change_only_commands', False)
+        self.command_keepalive_seconds = self.automation.get('command_keepalive_seconds', 900)
+        self.command_ack_topic = self.automation.get('command_ack_topic', None)
+        self.command_ack_timeout_seconds = self.automation.get('command_ack_timeout_seconds', 120)
+        self.batch_commands = self.automation.get('batch_commands', False)
+        self.command_batch_topic = self.automation.get('command_batch_topic', "hvac/bac0hvac/batch/command")
+        self.event_driven = self.automation.get('event_driven', False)
+        self.min_reevaluation_seconds = self.automation.get('min_reevaluation_seconds', 10)
+        self.metrics_topic = self.automation.get('metrics_topic', "metrics/oau_automation/stages")
+        self.metrics_publish_interval = self.automation.get('metrics_publish_interval', 60)
+        self.metrics_prometheus_path = self.automation.get('metrics_prometheus_path', None)
+        self.snapshot_interval = self.automation.get('snapshot_interval', 60)
+        self.snapshot_max_age_seconds = self.automation.get('snapshot_max_age_seconds', 3600)
+        self.data_dir = self.automation.get('data_dir', None)
+        self.co2_window = self.automation.get('co2_window', 5)
+        self.co2_smoothing = self.automation.get('co2_smoothing', "last")
+        self.co2_stale_seconds = self.automation.get('co2_stale_seconds', 0)
 
         self.default_config = {
             "cratedb_config": self.cratedb_config,
@@ -89,9 +116,52 @@ class Oauagent(Agent):
             "CO2_off": self.CO2_off,
             "trigger_interval": self.trigger_interval,
             "feedback_mqtt_topic": self.feedback_mqtt_topic,
+            "change_only_commands": self.change_only_commands,
+            "command_keepalive_seconds": self.command_keepalive_seconds,
+            "command_ack_topic": self.command_ack_topic,
+            "command_ack_timeout_seconds": self.command_ack_timeout_seconds,
+            "batch_commands": self.batch_commands,
+            "command_batch_topic": self.command_batch_topic,
+            "event_driven": self.event_driven,
+            "min_reevaluation_seconds": self.min_reevaluation_seconds,
+            "co2_window": self.co2_window,
+            "co2_smoothing": self.co2_smoothing,
+            "co2_stale_seconds": self.co2_stale_seconds,
+            "metrics_topic": self.metrics_topic,
+            "metrics_publish_interval": self.metrics_publish_interval,
+            "metrics_prometheus_path": self.metrics_prometheus_path,
+            "snapshot_interval": self.snapshot_interval,
+            "snapshot_max_age_seconds": self.snapshot_max_age_seconds,
+            "data_dir": self.data_dir,
         }
-        self.iaq_devices = {}
+        # last CO2 readings (ring buffer of `co2_window` readings) of every IAQ device, zones as slot segments
+        self.iaq_store = IAQArrayStore(window=self.co2_window)
         self.zones = {}
+        # IAQ device -> zones using it, to re-evaluate only affected zones on a new reading (`event_driven`)
+        # (the OAU index gives the commands to forget when OAUs are unmapped)
+        self.iaq_device_index = DeviceZoneIndex("iaq_device_ids")
+        self.oau_device_index = DeviceZoneIndex("oau_device_ids")
+        self.device_zones = self.iaq_device_index.device_zones
+        # precompiled IAQ topic router, {<topic>: (<device slot in `iaq_store`>, [<zone_name>, ...])}
+        self._topic_routes = {}
+        self._last_zone_evaluation = {}  # {<zone_name>: <unix_timestamp>}
+        self._pending_zone_evaluations = {}  # {<zone_name>: <scheduled event>}
+        # last command per OAU, to publish only changed commands (`change_only_commands`) plus keepalive resends
+        self.command_tracker = CommandTracker(compare_keys=("mode",))
+        # scheduled publication of the per-stage timings (`STAGE_METRICS`) on `metrics_topic`
+        self._metrics_event = None
+        # `oau_automation` cron job, replaced when `trigger_interval` changes
+        self._automation_event = None
+        self._automation_interval = None
+
+        # on-demand cProfile / tracemalloc session (`start_profiling` RPC), no restart nor config change needed
+        self.profiler = TickProfiler(name="oauagent")
+        self._profiling_stop_event = None
+
+        # warm start: runtime state saved every `snapshot_interval` seconds to the agent data directory (`data_dir`, else the
+        # one VOLTTRON created for the agent), reloaded on start
+        self._snapshot_event = None
+        self._configured = False
 
         # Set a default configuration to ensure that self.configure is called immediately to setup
         # the agent.
@@ -119,6 +189,11 @@ class Oauagent(Agent):
             _log.error("ERROR PROCESSING CONFIGURATION: {}".format(e))
             return
 
+        # settings of the running config, to rebuild only what the new one changes
+        _previous_mapping = self.thermal_zone_mapping
+        _previous_zone_defaults = (self.co2_smoothing, self.co2_stale_seconds)
+        _previous_ack_topic = self.command_ack_topic
+
         self.cratedb_config = cratedb_config
         self.automation = automation
         self.thermal_zone_mapping = thermal_zone_mapping
@@ -127,72 +202,252 @@ class Oauagent(Agent):
         self.CO2_off = self.automation.get("CO2_off", 800)
         self.trigger_interval = self.automation.get('trigger_interval', 5)
         self.feedback_mqtt_topic = self.automation.get('feedback_mqtt_topic', "rl_correct/subiot/example/command")
+        self.change_only_commands = self.automation.get('change_only_commands', False)
+        self.command_keepalive_seconds = self.automation.get('command_keepalive_seconds', 900)
+        self.command_ack_topic = self.automation.get('command_ack_topic', None)
+        self.command_ack_timeout_seconds = self.automation.get('command_ack_timeout_seconds', 120)
+        self.batch_commands = self.automation.get('batch_commands', False)
+        self.command_batch_topic = self.automation.get('command_batch_topic', "hvac/bac0hvac/batch/command")
+        self.event_driven = self.automation.get('event_driven', False)
+        self.min_reevaluation_seconds = self.automation.get('min_reevaluation_seconds', 10)
+        self.metrics_topic = self.automation.get('metrics_topic', "metrics/oau_automation/stages")
+        self.metrics_publish_interval = self.automation.get('metrics_publish_interval', 60)
+        self.metrics_prometheus_path = self.automation.get('metrics_prometheus_path', None)
+        self.snapshot_interval = self.automation.get('snapshot_interval', 60)
+        self.snapshot_max_age_seconds = self.automation.get('snapshot_max_age_seconds', 3600)
+        self.data_dir = self.automation.get('data_dir', None)
+        self.co2_window = self.automation.get('co2_window', 5)
+        self.co2_smoothing = self.automation.get('co2_smoothing', "last")
+        self.co2_stale_seconds = self.automation.get('co2_stale_seconds', 0)
+
+        # tracker settings apply in place, the last commands are kept
+        self.command_tracker.keepalive_seconds = self.command_keepalive_seconds
+        self.command_tracker.track_acks = bool(self.command_ack_topic)
+        self.command_tracker.ack_timeout_seconds = self.command_ack_timeout_seconds
+
+        _resubscribe = self._configured and (self.command_ack_topic != _previous_ack_topic)
+        if not self._configured:
+            # start: build every zone, then warm start from the last snapshot
+            self._update_zones(None)
+            self._create_subscriptions()
+            self._restore_runtime_state(self._load_snapshot())
+            self._configured = True
+        elif (self.iaq_store.window != max(1, int(self.co2_window))) or \
+                ((self.co2_smoothing, self.co2_stale_seconds) != _previous_zone_defaults):
+            # the ring buffers are sized once: a new window gets a new store, filled back with the current readings
+            # (new zone defaults apply to every zone, which are all rebuilt too)
+            _readings = None
+            if self.iaq_store.window != max(1, int(self.co2_window)):
+                _readings = self.iaq_store.to_state()
+                self.iaq_store = IAQArrayStore(window=self.co2_window)
+            self._update_zones(None)
+            self.iaq_store.restore_state(_readings)
+        else:
+            self._update_zones(_previous_mapping)
+
+        if _resubscribe:
+            self._create_subscriptions()
+        self._schedule_metrics_publish()
+        self._schedule_snapshot()
+        self._schedule_automation()
+
+    def _schedule_automation(self):
+        """
+        Schedule the `oau_automation` cron job, replacing the previous one only when `trigger_interval` changed
+        (`event_driven`: safety net, zones are re-evaluated on new CO2 readings)
+        """
+        if (self._automation_event is not None) and (self._automation_interval == int(self.trigger_interval)):
+            return
+        if self._automation_event is not None:
+            self._automation_event.cancel()
+        self._automation_interval = int(self.trigger_interval)
+        self._automation_event = self.core.schedule(cron(f"*/{self._automation_interval} * * * *"), self.oau_automation)
 
-        self._create_subscriptions()
-        
-        # trigger OAU automation function
-        self.core.schedule(cron(f"*/{int(self.trigger_interval)} * * * *"), self.oau_automation)
-    
     def _create_subscriptions(self):
         """
         Unsubscribe from all pub/sub topics and create a subscription to a topic in the configuration which triggers
         the _handle_publish callback
         """
         self.vip.pubsub.unsubscribe("pubsub", None, None)
-        
-        for zone_name, info in self.thermal_zone_mapping.items():
-            zone_instance = ZoneStore(zone_name)
+
+        # acknowledgements of sent commands, {"topic": <command topic>}
+        if self.command_ack_topic:
+            self.vip.pubsub.subscribe(
+                peer='pubsub',
+                prefix=self.command_ack_topic,
+                callback=self._handle_command_ack
+                )
+
+        # 1 prefix subscription for every IAQ device, messages of other devices are dropped in `_handle_publish`
+        _log.info(f"Subscribing to topic prefix: {IAQ_TOPIC_PREFIX} ({len(self._topic_routes)} IAQ devices)")
+        self.vip.pubsub.subscribe(
+            peer='pubsub',
+            prefix=IAQ_TOPIC_PREFIX,
+            callback=self._handle_publish
+            )
+
+    def _update_zones(self, previous_mapping: dict=None):
+        """
+        Apply the `thermal_zone_mapping` changes since `previous_mapping` (None: rebuild every zone)
+
+        Only added, removed and changed zones are touched: their `ZoneStore`, IAQ slot segment, topic routes and pending
+        evaluations. Unchanged zones keep their OAU status and readings. Zones and devices no longer mapped are dropped,
+        with the last command of their OAUs.
+        """
+        if previous_mapping is None:
+            updated_zone_names = list(self.thermal_zone_mapping.keys())
+            removed_zone_names = [zone_name for zone_name in self.zones if zone_name not in self.thermal_zone_mapping]
+        else:
+            added_zone_names, removed_zone_names, changed_zone_names = diff_zone_mapping(previous_mapping, self.thermal_zone_mapping)
+            updated_zone_names = added_zone_names + changed_zone_names
+        if (previous_mapping is not None) and (len(updated_zone_names) + len(removed_zone_names) <= 0):
+            return
+
+        for zone_name in removed_zone_names:
+            self.zones.pop(zone_name, None)
+            self._last_zone_evaluation.pop(zone_name, None)
+            _event = self._pending_zone_evaluations.pop(zone_name, None)
+            if _event is not None:
+                _event.cancel()
+
+        for zone_name in updated_zone_names:
+            info = self.thermal_zone_mapping[zone_name]
+            zone_instance = self.zones.get(zone_name)
+            if zone_instance is None:
+                zone_instance = self.zones[zone_name] = ZoneStore(zone_name)
             zone_instance.set_oau_device_ids(info.get("oau_device_ids", list()))
-            self.zones[zone_name] = zone_instance
-            
-            iaq_device_ids = info.get("iaq_device_ids", list())
-            for device_id in iaq_device_ids:
-                device_instance = DeviceStore(id=device_id)
-                
-                zone_instance.add_device(device_id, device_instance)
-                self.iaq_devices[device_id] = device_instance
-                
-                _log.info(f"Subscribing to topic: sensor/tuya_air_quality/{device_id}/event")
-                self.vip.pubsub.subscribe(
-                    peer='pubsub',
-                    prefix=f"sensor/tuya_air_quality/{device_id}/event",
-                    callback=self._handle_publish
-                    )
-                
+
+        # IAQ devices shared by several zones keep 1 slot, updated once per message
+        # `co2_smoothing` / `co2_stale_seconds` of a zone override the `automation` ones
+        updated_zones = {zone_name: self.thermal_zone_mapping[zone_name] for zone_name in updated_zone_names}
+        self.iaq_store.update_zones({zone_name: info.get("iaq_device_ids", list()) for zone_name, info in updated_zones.items()},
+                                    removed_zone_names=removed_zone_names,
+                                    zone_options={zone_name: {"co2_smoothing": info.get("co2_smoothing", self.co2_smoothing),
+                                                              "co2_stale_seconds": info.get("co2_stale_seconds", self.co2_stale_seconds)}
+                                                  for zone_name, info in updated_zones.items()})
+        added_iaq_ids, removed_iaq_ids = self.iaq_device_index.update(self.thermal_zone_mapping, updated_zone_names + removed_zone_names)
+        _, removed_oau_ids = self.oau_device_index.update(self.thermal_zone_mapping, updated_zone_names + removed_zone_names)
+        self.iaq_store.remove_devices(removed_iaq_ids)
+        self.command_tracker.forget([self._build_command(device_id, OAUState.OFF)[0] for device_id in removed_oau_ids])
+
+        # route `sensor/tuya_air_quality/{device_id}/event` to the device slot and its zones with 1 dict lookup
+        # (zone lists are the index ones, updated in place)
+        if previous_mapping is None:
+            self._topic_routes = {f"{IAQ_TOPIC_PREFIX}{device_id}/event": (self.iaq_store.add_device(device_id), zone_names)
+                                  for device_id, zone_names in self.device_zones.items()}
+        else:
+            for device_id in removed_iaq_ids:
+                self._topic_routes.pop(f"{IAQ_TOPIC_PREFIX}{device_id}/event", None)
+            for device_id in added_iaq_ids:
+                self._topic_routes[f"{IAQ_TOPIC_PREFIX}{device_id}/event"] = (self.iaq_store.add_device(device_id),
+                                                                             self.device_zones[device_id])
+        _log.info(f"{self.core.identity}: Zones updated: {len(updated_zone_names)} added / changed, "
+                  f"{len(removed_zone_names)} removed ({len(self._topic_routes)} IAQ devices)")
+
     def _handle_publish(self, peer, sender, bus, topic, headers, message):
         """
         Callback triggered by the subscription setup using the topic from the agent's config file
         """
-        if sender == self.core.identity:
+        route = self._topic_routes.get(topic)
+        if (route is None) or (sender == self.core.identity):
             return
-        
-        schema, agent_name, device, mtype = topic.split("/")
-        if schema == "sensor" and mtype == "event":
-            if device in self.iaq_devices:
-                self.iaq_devices[device].update_data(message)
 
-    def oau_automation(self):
+        slot, zone_names = route
+        if isinstance(message, str):
+            try:
+                message = json.loads(message)
+            except ValueError:
+                return
+        co2_changed = self.iaq_store.update_slot(slot, message, unix_timestamp=time.time())
+        if self.event_driven and co2_changed:
+            for zone_name in zone_names:
+                self._request_zone_evaluation(zone_name)
+
+    def _request_zone_evaluation(self, zone_name):
+        """Re-evaluate a zone now, or once `min_reevaluation_seconds` after its last evaluation"""
+        if zone_name in self._pending_zone_evaluations:
+            return
+        _due = self._last_zone_evaluation.get(zone_name, 0) + self.min_reevaluation_seconds
+        if time.time() >= _due:
+            self.oau_automation(selected_zone_name=zone_name)
+            return
+        self._pending_zone_evaluations[zone_name] = self.core.schedule(
+            pendulum.from_timestamp(_due), self._run_pending_zone_evaluation, zone_name)
+
+    def _run_pending_zone_evaluation(self, zone_name):
+        self._pending_zone_evaluations.pop(zone_name, None)
+        self.oau_automation(selected_zone_name=zone_name)
+
+    def _handle_command_ack(self, peer, sender, bus, topic, headers, message):
+        """Callback triggered when the BACnet agent confirms a command: {"topic": <command topic>}"""
+        if isinstance(message, str):
+            try:
+                message = json.loads(message)
+            except ValueError:
+                message = dict()
+        command_topic = message.get("topic") if isinstance(message, dict) else None
+        if command_topic is None:
+            _log.debug(f"{self.core.identity}: Invalid command acknowledgement on topic `{topic}`: {message}")
+            return
+        self.command_tracker.acknowledge(str(command_topic))
+
+    def oau_automation(self, selected_zone_name: str=None):
         """Apply automation OAU logic considering CO2 level 
         Parameters
         - selected_zone_name: str   : selected zone name to apply OAU automation controls
                                       if `selected_zone_name` is None, apply for all zones defined in config
         """
+        _tick_start = time.perf_counter()
+        self.profiler.tick_started()
         oau_on_zones = []
-        for zone_name, zone_instance in self.zones.items():
-            action, state = zone_instance.execute_automation(CO2_on=self.CO2_on, CO2_off=self.CO2_off)
+        commands = []  # `batch_commands`: commands of every zone, published in 1 envelope
+        _now = time.time()
+        # ON/OFF/DEFAULT of every (or the selected) zone in 1 vectorized pass
+        _start = time.perf_counter()
+        results = self.iaq_store.evaluate(CO2_on=self.CO2_on, CO2_off=self.CO2_off,
+                                          zone_names=None if selected_zone_name is None else [selected_zone_name],
+                                          now=_now)
+        STAGE_METRICS.observe("evaluate", time.perf_counter() - _start)
+        for zone_name, action, state in results:
+            zone_instance = self.zones[zone_name]
+            self._last_zone_evaluation[zone_name] = _now
+            zone_instance.set_status(state)
             
             if action:
                 _log.info(f"[ACTION] OAU status for zone `{zone_name}`: {state.value}")
                 for oau_id in zone_instance.oau_device_ids:
-                    self.publish(oau_id, state)
+                    if self.batch_commands:
+                        commands.append((oau_id, state))
+                    else:
+                        self.publish(oau_id, state)
 
             if zone_instance.OAU_status == OAUState.ON:
                 oau_on_zones.append(zone_name)
 
+        if self.batch_commands:
+            self.publish_batch(commands)
+        # full ticks and event-driven single zone runs are kept apart
+        STAGE_METRICS.observe("tick" if selected_zone_name is None else "zone_tick", time.perf_counter() - _tick_start)
+        _profiling_result = self.profiler.tick_finished(full_tick=selected_zone_name is None)
+        if _profiling_result is not None:
+            _log.info(f"{self.core.identity}: Profiling finished after {_profiling_result['ticks']} ticks: {_profiling_result['summary_file']}")
+
+        if selected_zone_name is not None:
+            return
+
         # Log on/all oaq count
         _log.info(f"Total OAU On Zones: {len(oau_on_zones)}/{len(self.zones)}")
         _log.info(f"OAU On Zones: {oau_on_zones}")
 
+    def _build_command(self, device_id, state):
+        message = {
+            "mode": state.value,
+            "subdevice_idx": 0
+        }
+        topic = f"hvac/bac0hvac/{device_id}/command"
+        return topic, message
+
+    @STAGE_METRICS.timed("publish")
     def publish(self, device_id, state):
         """Send control commands to MQTTAgent -> MQTTBroker -> Niagara"""
         header = {
@@ -200,11 +455,13 @@ class Oauagent(Agent):
             "message_type": "command"
             }
         
-        message = {
-            "mode": state.value,
-            "subdevice_idx": 0
-        }
-        topic = f"hvac/bac0hvac/{device_id}/command"
+        topic, message = self._build_command(device_id, state)
+
+        # skip commands equal to the last one sent to the OAU, until the keepalive resend is due
+        if self.change_only_commands:
+            if not self.command_tracker.should_send(topic, message):
+                return
+            self.command_tracker.mark_sent(topic, message)
         
         self.vip.pubsub.publish(
             peer='pubsub', 
@@ -214,6 +471,184 @@ class Oauagent(Agent):
         )
         _log.info(f"{self.core.identity}: Published message to BACnet Agent: topic=`{topic}`, message={message}")
 
+    @STAGE_METRICS.timed("publish")
+    def publish_batch(self, commands: list):
+        """Send [(device_id, state), ...] in 1 envelope on `command_batch_topic` (see `unpack_command_batch`)"""
+        header = {
+            "requesterID": self.core.identity,
+            "message_type": COMMAND_BATCH_MESSAGE_TYPE
+            }
+
+        batch = []
+        for device_id, state in commands:
+            topic, message = self._build_command(device_id, state)
+            if self.change_only_commands:
+                if not self.command_tracker.should_send(topic, message):
+                    continue
+                self.command_tracker.mark_sent(topic, message)
+            batch.append({"topic": topic, "message": message})
+        if len(batch) <= 0:
+            return
+
+        self.vip.pubsub.publish(
+            peer='pubsub',
+            topic=self.command_batch_topic,
+            message=pack_command_batch(batch),
+            headers=header
+        )
+        _log.info(f"{self.core.identity}: Published {len(batch)} commands to BACnet Agent: topic=`{self.command_batch_topic}`")
+        _log.debug(f"{self.core.identity}: Batched commands: {batch}")
+
+    def _snapshot_path(self):
+        """Snapshot file in the agent data directory, None when there is no data directory"""
+        data_dir = agent_data_dir(self.data_dir)
+        return None if data_dir is None else os.path.join(data_dir, SNAPSHOT_FILE_NAME)
+
+    def _snapshot_state(self):
+        """Runtime state which is not rebuilt from the config: IAQ readings, OAU status of zones, last commands"""
+        return {
+            "iaq_readings": self.iaq_store.to_state(),
+            "zone_status": {zone_name: zone_instance.OAU_status.value for zone_name, zone_instance in self.zones.items()},
+            "commands": self.command_tracker.to_state(),
+        }
+
+    def _restore_runtime_state(self, state: dict):
+        """Restore `_snapshot_state` after `_update_zones`, dropping zones / devices not in the mapping"""
+        if not state:
+            return
+        self.iaq_store.restore_state(state.get("iaq_readings"))
+        for zone_name, status in state.get("zone_status", dict()).items():
+            if zone_name in self.zones:
+                self.zones[zone_name].set_status(OAUState(status))
+        oau_command_topics = {self._build_command(device_id, OAUState.OFF)[0]
+                              for zone_instance in self.zones.values() for device_id in zone_instance.oau_device_ids}
+        self.command_tracker.restore_state(state.get("commands"), topics=oau_command_topics)
+
+    def _load_snapshot(self):
+        """Get the runtime state of the last snapshot, None when disabled, missing or older than `snapshot_max_age_seconds`"""
+        if self.snapshot_interval <= 0:
+            return None
+        _start = time.perf_counter()
+        try:
+            _path = self._snapshot_path()
+            if _path is None:
+                _log.warning(f"{self.core.identity}: No agent data directory, snapshots are disabled (set `data_dir` in the config)")
+                return None
+            state, unix_timestamp = load_snapshot(_path, max_age_seconds=self.snapshot_max_age_seconds)
+        except OSError as e:
+            _log.error(f"{self.core.identity}: Snapshot could not be loaded: {e}")
+            return None
+        if state is not None:
+            _log.info(f"{self.core.identity}: Loaded snapshot saved {time.time() - unix_timestamp:.0f} s ago in {(time.perf_counter() - _start) * 1000:.1f} ms")
+        return state
+
+    def _save_snapshot(self):
+        try:
+            _path = self._snapshot_path()
+            if _path is None:
+                # already reported by `_load_snapshot`
+                return
+            _size = save_snapshot(_path, self._snapshot_state())
+            _log.debug(f"{self.core.identity}: Saved snapshot ({_size} bytes)")
+        except Exception as e:
+            _log.error(f"{self.core.identity}: Snapshot could not be saved: {e}")
+
+    def _schedule_snapshot(self):
+        """(Re)schedule the next snapshot, `snapshot_interval` <= 0 disables it"""
+        if self._snapshot_event is not None:
+            self._snapshot_event.cancel()
+            self._snapshot_event = None
+        if self.snapshot_interval > 0:
+            self._snapshot_event = self.core.schedule(pendulum.from_timestamp(time.time() + self.snapshot_interval),
+                                                      self._handle_snapshot)
+
+    def _handle_snapshot(self):
+        self._snapshot_event = None
+        self._save_snapshot()
+        self._schedule_snapshot()
+
+    @Core.receiver("onstop")
+    def onstop(self, sender, **kwargs):
+        """Save a last snapshot so that a restart picks up the latest state"""
+        if self._configured and (self.snapshot_interval > 0):
+            self._save_snapshot()
+
+    def _schedule_metrics_publish(self):
+        """(Re)schedule the next publication of the stage metrics, `metrics_publish_interval` <= 0 disables it"""
+        if self._metrics_event is not None:
+            self._metrics_event.cancel()
+            self._metrics_event = None
+        if self.metrics_publish_interval > 0:
+            self._metrics_event = self.core.schedule(pendulum.from_timestamp(time.time() + self.metrics_publish_interval),
+                                                     self._publish_metrics)
+
+    def _publish_metrics(self):
+        """Publish the stage histograms on `metrics_topic` and write them to `metrics_prometheus_path` when set"""
+        self._metrics_event = None
+        try:
+            self.vip.pubsub.publish(
+                peer='pubsub',
+                topic=self.metrics_topic,
+                message={"unix_timestamp": time.time(), **STAGE_METRICS.snapshot()},
+                headers={"requesterID": self.core.identity, "message_type": "metrics"}
+            )
+            if self.metrics_prometheus_path:
+                STAGE_METRICS.write_prometheus(self.metrics_prometheus_path, namespace="oauagent",
+                                               labels={"identity": self.core.identity})
+        except Exception as e:
+            _log.error(f"{self.core.identity}: Stage metrics could not be published: {e}")
+        finally:
+            self._schedule_metrics_publish()
+
+    @RPC.export
+    def get_command_stats(self):
+        """Get command publisher counters (sent, suppressed as unchanged, acknowledged)"""
+        return dict(self.command_tracker.stats)
+
+    @RPC.export
+    def start_profiling(self, ticks: int=None, seconds: float=None, cpu: bool=True, memory: bool=False, top: int=20):
+        """
+        Profile the next `ticks` `oau_automation` ticks (default 1), or everything the agent does for the next `seconds`
+        - cpu: cProfile, written as a pstats file
+        - memory: tracemalloc, the top allocators are written as text
+        Result files go to the agent data directory, the summary is returned by `get_profiling_result` / `stop_profiling`
+        """
+        try:
+            data_dir = agent_data_dir(self.data_dir)
+            if data_dir is None:
+                return {"error": "no agent data directory, set `data_dir` in the config", **self.profiler.status()}
+            status = self.profiler.start(data_dir, ticks=ticks, seconds=seconds, cpu=cpu, memory=memory, top=top)
+        except (RuntimeError, ValueError, OSError) as e:
+            return {"error": str(e), **self.profiler.status()}
+        if seconds:
+            self._profiling_stop_event = self.core.schedule(pendulum.from_timestamp(time.time() + float(seconds)), self._stop_profiling)
+        _log.info(f"{self.core.identity}: Profiling started: {status}")
+        return status
+
+    def _stop_profiling(self):
+        self._profiling_stop_event = None
+        result = self.profiler.stop()
+        if result is not None:
+            _log.info(f"{self.core.identity}: Profiling finished after {result['profiled_seconds']:.1f} s: {result['summary_file']}")
+        return result
+
+    @RPC.export
+    def stop_profiling(self):
+        """Stop the running profiling session now and return its summary (None when no session is running)"""
+        if self._profiling_stop_event is not None:
+            self._profiling_stop_event.cancel()
+        return self._stop_profiling()
+
+    @RPC.export
+    def get_profiling_result(self):
+        """Get the state of the running profiling session and the summary of the last finished one"""
+        return {"session": self.profiler.status(), "last_result": self.profiler.last_result}
+
+    @RPC.export
+    def get_stage_metrics(self):
+        """Get per-stage duration histograms (evaluate, publish, tick, zone_tick)"""
+        return STAGE_METRICS.snapshot()
+
 
 def main():
     """Main method called to start the agent."""
@@ -1,5 +1,8 @@
 from enum import Enum, auto
 import logging
+import time
+
+import numpy as np
 
 _log = logging.getLogger(__name__)
 
@@ -10,47 +13,299 @@ class OAUState(Enum):
     DEFAULT = "off"
 
 
-class DeviceStore:
-    def __init__(self, id: str):
-        self.id = id
-        self._data = {}
-    
-    @property
-    def data(self):
-        return self._data
-        
-    def update_data(self, message):
-        self._data = message
-        
+SMOOTHING_METHODS = ("last", "mean", "median")
+
+
+def _grow(array: np.ndarray, capacity: int, fill):
+    grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class IAQArrayStore:
+    """
+    CO2 readings of every IAQ device, kept in a fixed slot of NumPy arrays (last co2, last-seen timestamp, validity)
+    plus a ring buffer of the last `window` valid readings with a running sum
+
+    Zones are segments of a device slot index array, so the OAU state of every zone is computed in one vectorized pass
+    with a segment max: all CO2 levels below `CO2_off` <=> max < `CO2_off`, and any CO2 level above `CO2_on` <=>
+    max > `CO2_on`. A device without a numeric CO2 reading counts as 0 ppm.
+
+    Each zone picks how a device's CO2 level is read (`co2_smoothing`: "last" reading, "mean" or "median" of the ring
+    buffer) and can drop devices not seen for `co2_stale_seconds` (0 disables). A zone whose devices are all stale
+    gets no command and DEFAULT (OFF) as its state, like a zone between `CO2_off` and `CO2_on`. Memory only depends
+    on the number of devices and `window`, not on the message rate.
+
+    Zones can be added, replaced or dropped one by one (`update_zones`), and slots of devices no longer mapped are
+    reused (`remove_devices`), so a mapping change doesn't reset the readings of the other devices.
+    """
+
+    def __init__(self, capacity: int=64, window: int=5):
+        self.window = max(1, int(window))
+        self._slots = {}  # {<device_id>: <slot>}
+        self._free_slots = []  # slots of removed devices, reused first
+        self.co2 = np.zeros(capacity, dtype=float)
+        self.timestamp = np.full(capacity, np.nan, dtype=float)
+        self.valid = np.zeros(capacity, dtype=bool)
+        # ring buffer of valid readings: ring[slot][position], plus next write position, running sum and number of
+        # readings per slot (lists, cheaper than NumPy scalar access on the per-message path)
+        self.ring = [[np.nan] * self.window for _ in range(capacity)]
+        self.ring_position = [0] * capacity
+        self.ring_sum = [0.0] * capacity
+        self.ring_count = [0] * capacity
+
+        self._zone_slots = {}  # {<zone_name>: [<slot>, ...]}
+        self._zone_settings = {}  # {<zone_name>: (<smoothing method code>, <co2_stale_seconds>)}
+        self.zone_names = []
+        self._zone_positions = {}  # {<zone_name>: <position in `zone_names`>}
+        self._zone_index = np.empty(0, dtype=np.int64)  # device slots of every zone, concatenated
+        self._zone_starts = np.empty(0, dtype=np.int64)
+        self._zone_ends = np.empty(0, dtype=np.int64)
+        # smoothing method code and staleness cutoff of each `_zone_index` entry (from its zone)
+        self._entry_methods = np.empty(0, dtype=np.int64)
+        self._entry_stale_seconds = np.empty(0, dtype=float)
+
+    def __contains__(self, device_id):
+        return device_id in self._slots
+
+    def add_device(self, device_id: str):
+        """Get the slot of a device, allocating one (and growing the arrays) for a new device"""
+        slot = self._slots.get(device_id)
+        if slot is not None:
+            return slot
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._slots[device_id] = slot
+            return slot
+        slot = len(self._slots)
+        if slot >= len(self.co2):
+            capacity = 2 * len(self.co2)
+            self.co2 = _grow(self.co2, capacity, 0)
+            self.timestamp = _grow(self.timestamp, capacity, np.nan)
+            self.valid = _grow(self.valid, capacity, False)
+            self.ring.extend([np.nan] * self.window for _ in range(capacity - len(self.ring)))
+            self.ring_position.extend([0] * (capacity - len(self.ring_position)))
+            self.ring_sum.extend([0.0] * (capacity - len(self.ring_sum)))
+            self.ring_count.extend([0] * (capacity - len(self.ring_count)))
+        self._slots[device_id] = slot
+        return slot
+
+    def remove_devices(self, device_ids: list):
+        """Clear and free the slots of devices, to be called once no zone uses them anymore"""
+        for device_id in device_ids:
+            slot = self._slots.pop(device_id, None)
+            if slot is None:
+                continue
+            self.co2[slot] = 0
+            self.timestamp[slot] = np.nan
+            self.valid[slot] = False
+            self.ring[slot] = [np.nan] * self.window
+            self.ring_position[slot] = 0
+            self.ring_sum[slot] = 0.0
+            self.ring_count[slot] = 0
+            self._free_slots.append(slot)
+
+    def update_data(self, device_id: str, message: dict, unix_timestamp: float=None):
+        """Keep the CO2 reading of a message, return True when it differs from the previous one"""
+        slot = self._slots.get(device_id)
+        if slot is None:
+            return False
+        return self.update_slot(slot, message, unix_timestamp)
+
+    def update_slot(self, slot: int, message: dict, unix_timestamp: float=None):
+        """Same as `update_data` with the device slot from `add_device`"""
+        try:
+            co2 = float(message.get('co2'))
+            valid = co2 == co2  # not NaN
+        except (AttributeError, TypeError, ValueError):
+            co2, valid = 0.0, False
+        if not valid:
+            co2 = 0.0
+
+        # `.item()` avoids creating NumPy scalars on this per-message path
+        co2_changed = (self.valid.item(slot) != valid) or (self.co2.item(slot) != co2)
+        self.co2[slot] = co2
+        self.valid[slot] = valid
+        self.timestamp[slot] = np.nan if unix_timestamp is None else unix_timestamp
+
+        if valid:
+            # overwrite the oldest reading of the ring buffer, O(1) update of the running sum
+            ring = self.ring[slot]
+            position = self.ring_position[slot]
+            if self.ring_count[slot] < self.window:
+                self.ring_count[slot] += 1
+                self.ring_sum[slot] += co2
+            else:
+                self.ring_sum[slot] += co2 - ring[position]
+            ring[position] = co2
+            self.ring_position[slot] = (position + 1) % self.window
+        return co2_changed
+
+    def _slot_readings(self, slot: int):
+        """Valid readings of the ring buffer of a slot, oldest first"""
+        ring, position = self.ring[slot], self.ring_position[slot]
+        return [value for value in ring[position:] + ring[:position] if value == value]
+
+    def data(self, device_id: str):
+        slot = self._slots[device_id]
+        return {"co2": float(self.co2[slot]) if self.valid[slot] else None,
+                "timestamp": float(self.timestamp[slot]),
+                "valid": bool(self.valid[slot]),
+                "readings": self._slot_readings(slot)}
+
+    def to_state(self):
+        """Readings of every device as plain data, {<device_id>: (co2, timestamp, valid, [<reading>, ...] oldest first)}"""
+        return {device_id: (self.co2.item(slot), self.timestamp.item(slot), bool(self.valid.item(slot)),
+                            self._slot_readings(slot))
+                for device_id, slot in self._slots.items()}
+
+    def restore_state(self, state: dict):
+        """Restore `to_state` readings of the devices already in the store (the last `window` readings are kept)"""
+        for device_id, (co2, timestamp, valid, readings) in (state or dict()).items():
+            slot = self._slots.get(device_id)
+            if slot is None:
+                continue
+            self.co2[slot] = co2
+            self.timestamp[slot] = timestamp
+            self.valid[slot] = valid
+            readings = list(readings)[-self.window:]
+            self.ring[slot] = readings + [np.nan] * (self.window - len(readings))
+            self.ring_position[slot] = len(readings) % self.window
+            self.ring_count[slot] = len(readings)
+            self.ring_sum[slot] = float(sum(readings))
+
+    def set_zones(self, zone_device_ids: dict, zone_options: dict=None):
+        """
+        Map zones to device slot segments, {<zone_name>: [<iaq_device_id>, ...]}, replacing every zone
+        `zone_options`: {<zone_name>: {"co2_smoothing": "last" | "mean" | "median", "co2_stale_seconds": <float>}}
+        """
+        self._zone_slots = {}
+        self._zone_settings = {}
+        self.update_zones(zone_device_ids, zone_options=zone_options)
+
+    def update_zones(self, zone_device_ids: dict, removed_zone_names: list=(), zone_options: dict=None):
+        """
+        Add or replace the zones of `zone_device_ids` and drop `removed_zone_names`, other zones keep their slots and
+        options (same arguments as `set_zones`). New zones are evaluated after the existing ones.
+        """
+        zone_options = zone_options or {}
+        for zone_name in removed_zone_names:
+            self._zone_slots.pop(zone_name, None)
+            self._zone_settings.pop(zone_name, None)
+        for zone_name, device_ids in zone_device_ids.items():
+            self._zone_slots[zone_name] = [self.add_device(device_id) for device_id in dict.fromkeys(device_ids)]
+            options = zone_options.get(zone_name, {})
+            method = options.get("co2_smoothing", "last")
+            if method not in SMOOTHING_METHODS:
+                _log.error(f"Invalid co2_smoothing `{method}` for zone `{zone_name}`, using `last`")
+                method = "last"
+            self._zone_settings[zone_name] = (SMOOTHING_METHODS.index(method), float(options.get("co2_stale_seconds", 0) or 0))
+        self._build_zone_index()
+
+    def _build_zone_index(self):
+        """Concatenate the zone slot segments and their per-entry settings, in `_zone_slots` order"""
+        self.zone_names = list(self._zone_slots.keys())
+        self._zone_positions = {zone_name: position for position, zone_name in enumerate(self.zone_names)}
+        lengths = np.array([len(zone_slots) for zone_slots in self._zone_slots.values()], dtype=np.int64)
+        self._zone_ends = np.cumsum(lengths)
+        self._zone_starts = self._zone_ends - lengths
+        self._zone_index = np.array([slot for zone_slots in self._zone_slots.values() for slot in zone_slots], dtype=np.int64)
+        self._entry_methods = np.repeat(np.array([self._zone_settings[zone_name][0] for zone_name in self.zone_names],
+                                                 dtype=np.int64), lengths)
+        self._entry_stale_seconds = np.repeat(np.array([self._zone_settings[zone_name][1] for zone_name in self.zone_names],
+                                                       dtype=float), lengths)
+
+    def _device_co2(self, method: str, slots: np.ndarray):
+        """CO2 level of devices read with a smoothing method, 0 for devices without reading"""
+        if method == "last":
+            return self.co2[slots]
+        counts = np.array([self.ring_count[slot] for slot in slots.tolist()], dtype=float)
+        values = np.zeros(len(slots), dtype=float)
+        has_readings = counts > 0
+        if method == "mean":
+            sums = np.array([self.ring_sum[slot] for slot in slots.tolist()], dtype=float)
+            values[has_readings] = sums[has_readings] / counts[has_readings]
+        elif has_readings.any():
+            values[has_readings] = np.nanmedian(np.array([self.ring[slot] for slot in slots[has_readings].tolist()]), axis=1)
+        return values
+
+    def _entry_co2(self, entries: np.ndarray, now: float):
+        """CO2 level of `_zone_index` entries with their zone's smoothing, and whether the device is fresh"""
+        slots = self._zone_index[entries]
+        methods = self._entry_methods[entries]
+        values = np.empty(len(entries), dtype=float)
+        for code, method in enumerate(SMOOTHING_METHODS):
+            mask = methods == code
+            if mask.any():
+                values[mask] = self._device_co2(method, slots[mask])
+        stale_seconds = self._entry_stale_seconds[entries]
+        # never seen devices (NaN timestamp) are stale too
+        fresh = (stale_seconds <= 0) | (now - self.timestamp[slots] <= stale_seconds)
+        values[~fresh] = -np.inf
+        return values, fresh
+
+    def zone_max_co2(self, now: float=None):
+        """
+        Get the max CO2 level of every zone in `zone_names` order (-inf for zones without IAQ device), and the number
+        of fresh devices of every zone
+        """
+        now = time.time() if now is None else now
+        max_co2 = np.full(len(self.zone_names), -np.inf)
+        fresh_count = np.zeros(len(self.zone_names), dtype=np.int64)
+        nonempty = self._zone_ends > self._zone_starts
+        if nonempty.any():
+            values, fresh = self._entry_co2(np.arange(len(self._zone_index)), now)
+            max_co2[nonempty] = np.maximum.reduceat(values, self._zone_starts[nonempty])
+            fresh_count[nonempty] = np.add.reduceat(fresh.astype(np.int64), self._zone_starts[nonempty])
+        return max_co2, fresh_count
+
+    def evaluate(self, CO2_on=1000, CO2_off=800, zone_names: list=None, now: float=None):
+        """
+        Get (zone_name, action, state) of zones, same rule as the per-zone loop:
+        OFF when all CO2 levels < `CO2_off`, else ON when any CO2 level > `CO2_on`, else DEFAULT without action
+        """
+        now = time.time() if now is None else now
+        if zone_names is None:
+            zone_names = self.zone_names
+            max_co2, fresh_count = self.zone_max_co2(now)
+            has_devices = self._zone_ends > self._zone_starts
+        else:
+            zone_names = [zone_name for zone_name in zone_names if zone_name in self._zone_positions]
+            max_co2 = np.full(len(zone_names), -np.inf)
+            fresh_count = np.zeros(len(zone_names), dtype=np.int64)
+            has_devices = np.zeros(len(zone_names), dtype=bool)
+            for i, zone_name in enumerate(zone_names):
+                position = self._zone_positions[zone_name]
+                entries = np.arange(self._zone_starts[position], self._zone_ends[position])
+                if len(entries) > 0:
+                    values, fresh = self._entry_co2(entries, now)
+                    max_co2[i] = values.max()
+                    fresh_count[i] = fresh.sum()
+                    has_devices[i] = True
+
+        # zones whose devices are all stale have no information to act on: no command, DEFAULT state
+        no_fresh = has_devices & (fresh_count <= 0)
+        turn_off = (~no_fresh) & (max_co2 < CO2_off)
+        turn_on = (~no_fresh) & (~turn_off) & (max_co2 > CO2_on)
+        results = []
+        for zone_name, _off, _on in zip(zone_names, turn_off.tolist(), turn_on.tolist()):
+            if _off:
+                results.append((zone_name, True, OAUState.OFF))
+            elif _on:
+                results.append((zone_name, True, OAUState.ON))
+            else:
+                results.append((zone_name, False, OAUState.DEFAULT))
+        return results
+
 
 class ZoneStore:
     def __init__(self, name: str):
         self.name = name
         self.oau_device_ids = []
-        self.device_instances = {}
         self.OAU_status = OAUState.DEFAULT  # Initialize OAU status as OFF
-        
-    def add_device(self, device_id: str, device_instance: object):
-        self.device_instances[device_id] = device_instance
-        
-    def execute_automation(self, CO2_on=1000, CO2_off=800):
 
-        # check if all device's CO2 levels are below the threshold to turn it OFF
-        if all(device.data.get('co2', 0) < CO2_off for device in self.device_instances.values()):
-            _log.info(f"All CO2 levels are below threshold. Turning OAU OFF for zone `{self.name}`")
-            self.OAU_status = OAUState.OFF
-            return True, OAUState.OFF
-        
-        # Check if any device's CO2 level exceeds the threshold to turn OAU ON
-        for device in self.device_instances.values():
-            if device.data.get('co2', 0) > CO2_on:
-                _log.info(f"CO2 level exceeds threshold. Turning OAU ON for zone `{self.name}`")
-                self.OAU_status = OAUState.ON
-                return True, OAUState.ON
-        
-        self.OAU_status = OAUState.DEFAULT
-        return False, OAUState.DEFAULT
+    def set_status(self, state: OAUState):
+        self.OAU_status = state
         
     def set_oau_device_ids(self, oau_device_ids: list):
         self.oau_device_ids = oau_device_ids
-            
\ No newline at end of file
@@ -0,0 +1,5 @@
+from agentcommon.metrics import StageMetrics
+
+# process-wide stage metrics of the agent, one instance per agent so that agents running in one process (ex.
+# benchmarks) don't mix stages
+STAGE_METRICS = StageMetrics()
@@ -16,7 +16,7 @@ setup(
     name=agent_package + 'agent',
     version=__version__,
     author="pamekitti.p@gmail.com",
-    install_requires=['volttron'],
+    install_requires=['volttron', 'agentcommon', 'numpy'],
     packages=packages,
     entry_points={
         'setuptools.installation': [
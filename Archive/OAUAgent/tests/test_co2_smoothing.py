@@ -0,0 +1,88 @@
+import numpy as np
+
+from oauagent.datastore import IAQArrayStore, OAUState
+
+NOW = 1700000000.0
+
+
+def make_store(window=3, **options):
+    store = IAQArrayStore(window=window)
+    store.set_zones({"zone": ["iaq-1"]}, zone_options={"zone": options})
+    return store
+
+
+def zone_co2(store, now=NOW):
+    max_co2, _ = store.zone_max_co2(now)
+    return float(max_co2[0])
+
+
+def test_ring_buffer_wraps_around():
+    store = make_store(window=3)
+    for co2 in (100, 200, 300, 400, 500):
+        store.update_data("iaq-1", {"co2": co2}, unix_timestamp=NOW)
+    data = store.data("iaq-1")
+    assert data["readings"] == [300, 400, 500]
+    assert data["co2"] == 500
+    slot = store.add_device("iaq-1")
+    # the running sum only holds the readings still in the window
+    assert store.ring_sum[slot] == 1200
+    assert store.ring_count[slot] == 3
+
+
+def test_invalid_readings_stay_out_of_the_window():
+    store = make_store(window=3, co2_smoothing="mean")
+    for message in ({"co2": 600}, {"co2": "n/a"}, {"co2": None}, {}, {"co2": float("nan")}, {"co2": 900}):
+        store.update_data("iaq-1", message, unix_timestamp=NOW)
+    assert store.data("iaq-1")["readings"] == [600, 900]
+    assert zone_co2(store) == 750
+
+
+def test_smoothing_methods():
+    readings = (700, 1300, 750, 760, 1500)
+    expected = {"last": 1500, "mean": np.mean(readings[-4:]), "median": np.median(readings[-4:])}
+    for method, co2 in expected.items():
+        store = make_store(window=4, co2_smoothing=method)
+        for reading in readings:
+            store.update_data("iaq-1", {"co2": reading}, unix_timestamp=NOW)
+        assert zone_co2(store) == co2
+
+
+def test_median_smoothing_ignores_a_spike():
+    store = make_store(window=5, co2_smoothing="median")
+    for co2 in (700, 710, 2500, 720, 715):
+        store.update_data("iaq-1", {"co2": co2}, unix_timestamp=NOW)
+    assert store.evaluate(now=NOW) == [("zone", True, OAUState.OFF)]
+
+
+def test_stale_devices_are_left_out():
+    store = IAQArrayStore(window=3)
+    store.set_zones({"zone": ["iaq-fresh", "iaq-stale"]}, zone_options={"zone": {"co2_stale_seconds": 300}})
+    store.update_data("iaq-fresh", {"co2": 700}, unix_timestamp=NOW - 300)
+    store.update_data("iaq-stale", {"co2": 1500}, unix_timestamp=NOW - 301)
+    max_co2, fresh_count = store.zone_max_co2(NOW)
+    assert (float(max_co2[0]), int(fresh_count[0])) == (700, 1)
+    assert store.evaluate(now=NOW) == [("zone", True, OAUState.OFF)]
+
+    # a new reading makes the device fresh again
+    store.update_data("iaq-stale", {"co2": 1500}, unix_timestamp=NOW)
+    assert store.evaluate(now=NOW) == [("zone", True, OAUState.ON)]
+
+
+def test_staleness_is_per_zone():
+    store = IAQArrayStore(window=3)
+    store.set_zones({"strict": ["iaq-1"], "lenient": ["iaq-1"]},
+                    zone_options={"strict": {"co2_stale_seconds": 60}, "lenient": {"co2_stale_seconds": 0}})
+    store.update_data("iaq-1", {"co2": 1500}, unix_timestamp=NOW - 120)
+    assert store.evaluate(now=NOW) == [("strict", False, OAUState.DEFAULT), ("lenient", True, OAUState.ON)]
+
+
+def test_restore_state_keeps_the_window():
+    store = make_store(window=3, co2_smoothing="mean")
+    for co2 in (600, 700, 800, 900):
+        store.update_data("iaq-1", {"co2": co2}, unix_timestamp=NOW)
+    restored = make_store(window=2, co2_smoothing="mean")
+    restored.restore_state(store.to_state())
+    assert restored.data("iaq-1")["readings"] == [800, 900]
+    assert zone_co2(restored) == 850
+    restored.update_data("iaq-1", {"co2": 1000}, unix_timestamp=NOW)
+    assert zone_co2(restored) == 950
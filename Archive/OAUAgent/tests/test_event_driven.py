@@ -0,0 +1,76 @@
+from fakes import make_agent
+
+from oauagent.agent import IAQ_TOPIC_PREFIX, Oauagent
+from oauagent.datastore import OAUState
+
+MAPPING = {
+    "zone-1": {"oau_device_ids": ["OAU-1"], "iaq_device_ids": ["iaq-1", "iaq-shared"]},
+    "zone-2": {"oau_device_ids": ["OAU-2"], "iaq_device_ids": ["iaq-2", "iaq-shared"]},
+}
+
+
+def make_oau_agent(min_reevaluation_seconds=10):
+    agent = make_agent(Oauagent, {"cratedb_config": {}, "thermal_zone_mapping": MAPPING,
+                                  "automation": {"CO2_on": 1000, "CO2_off": 800, "snapshot_interval": 0, "event_driven": True,
+                                                 "min_reevaluation_seconds": min_reevaluation_seconds}},
+                       identity="test.oauagent")
+    agent.evaluations = []
+    oau_automation = agent.oau_automation
+
+    def count_evaluations(selected_zone_name=None):
+        agent.evaluations.append(selected_zone_name)
+        return oau_automation(selected_zone_name=selected_zone_name)
+
+    agent.oau_automation = count_evaluations
+    return agent
+
+
+def deliver_burst(agent, device_id, co2_levels):
+    for co2 in co2_levels:
+        agent.vip.pubsub.deliver(f"{IAQ_TOPIC_PREFIX}{device_id}/event", {"co2": co2})
+
+
+def test_burst_within_the_window_is_evaluated_once():
+    agent = make_oau_agent()
+    agent.oau_automation()
+    agent.evaluations.clear()
+
+    deliver_burst(agent, "iaq-1", range(900, 1100, 10))
+    assert agent.evaluations == []
+    pending = agent.core.pending(agent._run_pending_zone_evaluation)
+    assert [event.args for event in pending] == [("zone-1",)]
+
+    pending[0].run()
+    assert agent.evaluations == ["zone-1"]
+    assert agent.zones["zone-1"].OAU_status == OAUState.ON
+    assert agent._pending_zone_evaluations == dict()
+
+
+def test_first_reading_is_evaluated_at_once_then_coalesced():
+    agent = make_oau_agent()
+    deliver_burst(agent, "iaq-1", range(900, 1100, 10))
+    assert agent.evaluations == ["zone-1"]
+    assert len(agent.core.pending(agent._run_pending_zone_evaluation)) == 1
+
+
+def test_unchanged_readings_do_not_request_an_evaluation():
+    agent = make_oau_agent()
+    deliver_burst(agent, "iaq-1", [900] * 5)
+    assert agent.evaluations == ["zone-1"]
+    assert agent.core.pending(agent._run_pending_zone_evaluation) == []
+
+
+def test_shared_device_requests_each_of_its_zones():
+    agent = make_oau_agent()
+    agent.oau_automation()
+    agent.evaluations.clear()
+    deliver_burst(agent, "iaq-shared", [1200, 1250])
+    pending = agent.core.pending(agent._run_pending_zone_evaluation)
+    assert sorted(event.args for event in pending) == [("zone-1",), ("zone-2",)]
+
+
+def test_zero_window_evaluates_every_change():
+    agent = make_oau_agent(min_reevaluation_seconds=0)
+    deliver_burst(agent, "iaq-1", [900, 950, 1000])
+    assert agent.evaluations == ["zone-1"] * 3
+    assert agent.core.pending(agent._run_pending_zone_evaluation) == []
@@ -0,0 +1,67 @@
+import numpy as np
+
+from oauagent.datastore import IAQArrayStore, OAUState
+
+NOW = 1700000000.0
+
+
+def baseline_decision(co2_levels: list, CO2_on=1000, CO2_off=800):
+    """(action, state) of the per-zone loop `IAQArrayStore.evaluate` replaced (`ZoneStore.execute_automation`)"""
+    if all(co2 < CO2_off for co2 in co2_levels):
+        return True, OAUState.OFF
+    for co2 in co2_levels:
+        if co2 > CO2_on:
+            return True, OAUState.ON
+    return False, OAUState.DEFAULT
+
+
+def test_evaluate_matches_the_per_zone_loop():
+    rng = np.random.default_rng(0)
+    device_ids = [f"iaq-{i}" for i in range(60)]
+    for _ in range(20):
+        # zones of 0 to 5 devices, some devices shared between zones
+        zones = {f"zone-{i}": list(rng.choice(device_ids, size=rng.integers(0, 6), replace=False)) for i in range(30)}
+        store = IAQArrayStore(capacity=4)
+        store.set_zones(zones)
+        readings = dict()
+        for device_id in device_ids:
+            kind = rng.integers(0, 4)
+            if kind == 0:
+                continue  # never seen: counts as 0 ppm
+            message = {"co2": "n/a"} if kind == 1 else {"co2": float(rng.choice([600, 799, 800, 900, 1000, 1001, 1500]))}
+            store.update_data(device_id, message, unix_timestamp=NOW)
+            readings[device_id] = message["co2"] if kind != 1 else 0
+
+        CO2_on, CO2_off = (1000, 800) if rng.random() < 0.5 else (900, 799)
+        expected = [(zone_name, *baseline_decision([readings.get(device_id, 0) for device_id in zone_device_ids], CO2_on, CO2_off))
+                    for zone_name, zone_device_ids in zones.items()]
+        assert store.evaluate(CO2_on=CO2_on, CO2_off=CO2_off, now=NOW) == expected
+        selected = list(zones)[5:8]
+        assert store.evaluate(CO2_on=CO2_on, CO2_off=CO2_off, zone_names=selected, now=NOW) == \
+               [result for result in expected if result[0] in selected]
+
+
+def test_empty_zone_turns_off_like_the_per_zone_loop():
+    store = IAQArrayStore()
+    store.set_zones({"empty": [], "zone": ["iaq-1"]})
+    store.update_data("iaq-1", {"co2": 1200}, unix_timestamp=NOW)
+    assert store.evaluate(now=NOW) == [("empty", True, OAUState.OFF), ("zone", True, OAUState.ON)]
+    assert store.evaluate(zone_names=["empty"], now=NOW) == [("empty", True, OAUState.OFF)]
+
+
+def test_all_stale_zone_gets_no_action():
+    store = IAQArrayStore()
+    store.set_zones({"stale": ["iaq-1", "iaq-2"], "never seen": ["iaq-3"]}, zone_options={
+        "stale": {"co2_stale_seconds": 300}, "never seen": {"co2_stale_seconds": 300}})
+    store.update_data("iaq-1", {"co2": 1500}, unix_timestamp=NOW - 600)
+    store.update_data("iaq-2", {"co2": 500}, unix_timestamp=NOW - 301)
+    assert store.evaluate(now=NOW) == [("stale", False, OAUState.DEFAULT), ("never seen", False, OAUState.DEFAULT)]
+
+
+def test_single_sensor_thresholds():
+    store = IAQArrayStore()
+    store.set_zones({"zone": ["iaq-1"]})
+    for co2, expected in ((799, (True, OAUState.OFF)), (800, (False, OAUState.DEFAULT)), (1000, (False, OAUState.DEFAULT)),
+                          (1001, (True, OAUState.ON))):
+        store.update_data("iaq-1", {"co2": co2}, unix_timestamp=NOW)
+        assert store.evaluate(CO2_on=1000, CO2_off=800, now=NOW) == [("zone", *expected)]
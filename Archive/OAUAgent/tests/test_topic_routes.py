@@ -0,0 +1,60 @@
+from fakes import make_agent
+
+from oauagent.agent import IAQ_TOPIC_PREFIX, Oauagent
+
+MAPPING = {
+    "zone-1": {"oau_device_ids": ["OAU-1"], "iaq_device_ids": ["iaq-1", "iaq-shared"]},
+    "zone-2": {"oau_device_ids": ["OAU-2"], "iaq_device_ids": ["iaq-2", "iaq-shared"]},
+}
+
+
+def make_oau_agent(thermal_zone_mapping=MAPPING):
+    return make_agent(Oauagent, {"cratedb_config": {}, "thermal_zone_mapping": thermal_zone_mapping,
+                                 "automation": {"CO2_on": 1000, "CO2_off": 800, "snapshot_interval": 0}},
+                      identity="test.oauagent")
+
+
+def topic(device_id):
+    return f"{IAQ_TOPIC_PREFIX}{device_id}/event"
+
+
+def test_one_prefix_subscription_for_every_device():
+    agent = make_oau_agent()
+    assert [prefix for prefix, _ in agent.vip.pubsub.subscriptions] == [IAQ_TOPIC_PREFIX]
+
+
+def test_known_devices_route_to_their_slot_and_zones():
+    agent = make_oau_agent()
+    agent.vip.pubsub.deliver(topic("iaq-2"), {"co2": 950})
+    agent.vip.pubsub.deliver(topic("iaq-shared"), '{"co2": 1200}')
+
+    assert agent.iaq_store.data("iaq-2")["co2"] == 950
+    assert agent.iaq_store.data("iaq-shared")["co2"] == 1200
+    assert agent.iaq_store.data("iaq-1")["co2"] is None
+    slot, zone_names = agent._topic_routes[topic("iaq-shared")]
+    assert slot == agent.iaq_store.add_device("iaq-shared")
+    assert zone_names == ["zone-1", "zone-2"]
+
+
+def test_unknown_topics_under_the_prefix_are_ignored():
+    agent = make_oau_agent()
+    for unknown_topic in (topic("unknown"), f"{IAQ_TOPIC_PREFIX}iaq-1/status", f"{IAQ_TOPIC_PREFIX}iaq-1"):
+        agent.vip.pubsub.deliver(unknown_topic, {"co2": 1500})
+    # the agent's own messages are ignored too
+    agent.vip.pubsub.deliver(topic("iaq-1"), {"co2": 1500}, sender=agent.core.identity)
+    assert not any(agent.iaq_store.data(device_id)["valid"] for device_id in ("iaq-1", "iaq-2", "iaq-shared"))
+    assert "unknown" not in agent.iaq_store
+
+
+def test_routes_follow_mapping_changes():
+    agent = make_oau_agent()
+    new_mapping = {"zone-1": {"oau_device_ids": ["OAU-1"], "iaq_device_ids": ["iaq-1", "iaq-3"]},
+                   "zone-2": MAPPING["zone-2"]}
+    agent.configure("config", "UPDATE", {"cratedb_config": {}, "thermal_zone_mapping": new_mapping,
+                                         "automation": dict(agent.automation)})
+
+    assert agent._topic_routes[topic("iaq-shared")][1] == ["zone-2"]
+    agent.vip.pubsub.deliver(topic("iaq-3"), {"co2": 700})
+    assert agent.iaq_store.data("iaq-3")["co2"] == 700
+    assert topic("iaq-1") in agent._topic_routes
+    assert set(agent._topic_routes) == {topic(device_id) for device_id in ("iaq-1", "iaq-3", "iaq-2", "iaq-shared")}
@@ -0,0 +1,279 @@
+"""
+Synthetic-building benchmark suite for both agents
+
+Builds a synthetic building (N zones, M devices per zone), serves generated time series from a CrateDB stand-in and
+runs the agents on the fake VOLTTRON platform of `fakes.py`. Scenarios:
+    fcu_automation   `Fcuagent.fcu_automation` ticks over every zone
+    tenant_feedback  a burst of `Fcuagent._handle_tenant_feedback` messages, then the zone evaluations they trigger
+    oau_flood        a flood of IAQ messages through `Oauagent._handle_publish`, then `Oauagent.oau_automation` ticks
+
+Results are printed (or written to `--output`) as JSON: tick latency percentiles (ms), queries per tick,
+messages per second, per-stage totals of the agents' stage metrics and peak memory (tracemalloc, measured in a second
+run so it doesn't skew the timings).
+
+Usage:
+    python Archive/benchmarks/building_benchmark.py [--zones 200] [--iaq-per-zone 1] [--fcu-per-zone 1] [--ticks 5]
+        [--scenarios fcu_automation,tenant_feedback,oau_flood] [--automation '{"batch_query": false}']
+        [--query-latency-ms 0] [--output results.json] [--skip-memory]
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import platform
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+
+from fakes import ARCHIVE_DIR, make_agent
+from synthetic_building import (IAQ_TOPIC_TEMPLATE, StubCrateClient, fcu_mapping, generate_series, mapping_device_ids,
+                                oau_mapping)
+
+from fcuagent import data_handler
+from fcuagent.agent import Fcuagent
+from fcuagent.metrics import STAGE_METRICS as FCU_STAGE_METRICS
+from oauagent.agent import Oauagent
+from oauagent.metrics import STAGE_METRICS as OAU_STAGE_METRICS
+
+SCENARIOS = ("fcu_automation", "tenant_feedback", "oau_flood")
+
+# every tick recomputes its decisions unless `--automation` says otherwise
+FCU_BENCHMARK_AUTOMATION = {"decision_cache_ttl_seconds": 0}
+
+
+def _load_config(file_name: str):
+    with open(os.path.join(ARCHIVE_DIR, "config", file_name)) as config_file:
+        return json.load(config_file)
+
+
+def _summary(values: list):
+    """Percentiles of a list of numbers, None when empty"""
+    if len(values) <= 0:
+        return None
+    values = np.asarray(values, dtype=float)
+    return {"p50": float(np.percentile(values, 50)), "p90": float(np.percentile(values, 90)),
+            "p99": float(np.percentile(values, 99)), "max": float(values.max()), "mean": float(values.mean())}
+
+
+def _stage_summary(stage_metrics):
+    """Count, total and max seconds of every instrumented stage"""
+    return {stage: {key: value for key, value in histogram.items() if key != "buckets"}
+            for stage, histogram in stage_metrics.snapshot()["stages"].items()}
+
+
+def _make_fcu_agent(args, stub_client: StubCrateClient):
+    config = _load_config("fcu_config")
+    config["thermal_zone_mapping"] = fcu_mapping(args.zones, args.iaq_per_zone, args.fcu_per_zone, args.fcu_only_ratio)
+    config["automation"] = {**config["automation"], **FCU_BENCHMARK_AUTOMATION, **args.automation}
+    config["cratedb_config"] = {**config["cratedb_config"], "host": "synthetic-building"}
+    data_handler.close_connection_pools()
+    data_handler.client = stub_client
+    return make_agent(Fcuagent, config, identity="benchmark.fcuagent")
+
+
+def _make_stub_client(args):
+    thermal_zone_mapping = fcu_mapping(args.zones, args.iaq_per_zone, args.fcu_per_zone, args.fcu_only_ratio)
+    return StubCrateClient(generate_series(thermal_zone_mapping, minutes=args.series_minutes),
+                           latency_seconds=args.query_latency_ms / 1000)
+
+
+def run_fcu_automation(args):
+    """Time `fcu_automation` ticks over every zone"""
+    stub_client = _make_stub_client(args)
+    agent = _make_fcu_agent(args, stub_client)
+    published = agent.vip.pubsub.published
+    agent.fcu_automation()  # warm up caches (statements, setpoint table, pools)
+    FCU_STAGE_METRICS.reset()
+
+    latencies, queries, rows, commands = [], [], [], []
+    for _ in range(args.ticks):
+        stub_client.reset_counters()
+        n_published = len(published)
+        start = time.perf_counter()
+        agent.fcu_automation()
+        latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(stub_client.queries)
+        rows.append(stub_client.rows_served)
+        commands.append(len(published) - n_published)
+    data_handler.close_connection_pools()
+
+    return {
+        "zones": len(agent.thermal_zone_mapping),
+        "devices": len(stub_client.rows),
+        "ticks": args.ticks,
+        "tick_latency_ms": _summary(latencies),
+        "queries_per_tick": _summary(queries),
+        "rows_per_tick": _summary(rows),
+        "published_per_tick": _summary(commands),
+        "late_zones": len(getattr(agent, "late_zones", [])),
+        "stages": _stage_summary(FCU_STAGE_METRICS),
+    }
+
+
+def run_tenant_feedback(args):
+    """Time a burst of tenant feedbacks, then the (coalesced) zone evaluations they scheduled"""
+    stub_client = _make_stub_client(args)
+    agent = _make_fcu_agent(args, stub_client)
+    rng = np.random.default_rng(0)
+    zone_names = list(agent.thermal_zone_mapping.keys())
+    burst_zones = [zone_names[i] for i in rng.choice(len(zone_names), size=min(args.feedback_zones, len(zone_names)), replace=False)]
+    messages = [{"feedback": ("Too Hot", "Too Cold")[int(rng.integers(2))],
+                 "building": "Synthetic",
+                 "zone": burst_zones[int(rng.integers(len(burst_zones)))],
+                 "lineId": f"U{int(rng.integers(args.feedback_burst)):032x}",
+                 "feedbackId": str(i),
+                 "topic": "human_feedback"} for i in range(args.feedback_burst)]
+
+    stub_client.reset_counters()
+    FCU_STAGE_METRICS.reset()
+    handler = agent._handle_tenant_feedback
+    start = time.perf_counter()
+    for message in messages:
+        handler("pubsub", "feedback.agent", None, agent.feedback_mqtt_topic, {}, message)
+    handler_seconds = time.perf_counter() - start
+    handler_queries = stub_client.queries
+
+    # coalesced evaluations fire `feedback_coalesce_seconds` later on the platform, run them now
+    evaluation_latencies = []
+    stub_client.reset_counters()
+    for event in agent.core.pending(agent._run_zone_evaluation):
+        start = time.perf_counter()
+        event.run()
+        evaluation_latencies.append((time.perf_counter() - start) * 1000)
+    data_handler.close_connection_pools()
+
+    return {
+        "zones": len(zone_names),
+        "burst_zones": len(burst_zones),
+        "messages": len(messages),
+        "messages_per_sec": len(messages) / handler_seconds if handler_seconds > 0 else None,
+        "handler_queries": handler_queries,
+        "evaluations": len(evaluation_latencies),
+        "evaluation_latency_ms": _summary(evaluation_latencies),
+        "evaluation_queries": stub_client.queries,
+        "feedback_metrics": dict(agent.feedback_metrics),
+        "stages": _stage_summary(FCU_STAGE_METRICS),
+    }
+
+
+def run_oau_flood(args):
+    """Time a flood of IAQ messages through `_handle_publish`, then `oau_automation` ticks"""
+    config = _load_config("oau_config")
+    config["thermal_zone_mapping"] = oau_mapping(args.oau_zones or args.zones, args.oau_iaq_per_zone)
+    config["automation"] = {**config["automation"], **args.automation}
+    agent = make_agent(Oauagent, config, identity="benchmark.oauagent")
+
+    rng = np.random.default_rng(0)
+    device_ids = mapping_device_ids(config["thermal_zone_mapping"], "iaq_device_ids")
+    unknown = rng.random(args.messages) < args.unknown_ratio
+    topics = [IAQ_TOPIC_TEMPLATE.format(device_id=f"unknown-{i % 100}" if is_unknown else device_ids[i % len(device_ids)])
+              for i, is_unknown in enumerate(unknown.tolist())]
+    messages = [{"co2": co2, "temperature": 25.0, "humidity": 55.0} for co2 in rng.integers(400, 1400, args.messages).tolist()]
+
+    published = agent.vip.pubsub.published
+    handler = agent._handle_publish
+    start = time.perf_counter()
+    for topic, message in zip(topics, messages):
+        handler("pubsub", "iaq.agent", None, topic, {}, message)
+    handler_seconds = time.perf_counter() - start
+    handler_published = len(published)
+
+    latencies, commands = [], []
+    OAU_STAGE_METRICS.reset()
+    for _ in range(args.ticks):
+        n_published = len(published)
+        start = time.perf_counter()
+        agent.oau_automation()
+        latencies.append((time.perf_counter() - start) * 1000)
+        commands.append(len(published) - n_published)
+
+    return {
+        "zones": len(config["thermal_zone_mapping"]),
+        "devices": len(device_ids),
+        "messages": args.messages,
+        "unknown_messages": int(unknown.sum()),
+        "messages_per_sec": args.messages / handler_seconds if handler_seconds > 0 else None,
+        "handler_published": handler_published,
+        "ticks": args.ticks,
+        "tick_latency_ms": _summary(latencies),
+        "queries_per_tick": 0,  # the OAU agent works from pub/sub readings only
+        "published_per_tick": _summary(commands),
+        "stages": _stage_summary(OAU_STAGE_METRICS),
+    }
+
+
+SCENARIO_FUNCTIONS = {
+    "fcu_automation": run_fcu_automation,
+    "tenant_feedback": run_tenant_feedback,
+    "oau_flood": run_oau_flood,
+}
+
+
+def _peak_memory(scenario_function, args):
+    """Peak traced memory (bytes) of a scenario run"""
+    tracemalloc.start()
+    try:
+        scenario_function(args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(args):
+    results = {
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output",)},
+        "platform": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine()},
+        "scenarios": dict(),
+    }
+    for scenario in args.scenarios:
+        scenario_function = SCENARIO_FUNCTIONS[scenario]
+        result = scenario_function(copy.copy(args))
+        result["peak_memory_bytes"] = None if args.skip_memory else _peak_memory(scenario_function, copy.copy(args))
+        results["scenarios"][scenario] = result
+    # kilobytes on Linux
+    results["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=lambda value: [scenario for scenario in value.split(",") if scenario],
+                        default=list(SCENARIOS), help=f"comma separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--zones", type=int, default=200)
+    parser.add_argument("--iaq-per-zone", type=int, default=1, help="IAQ sensors per FCU zone")
+    parser.add_argument("--fcu-per-zone", type=int, default=1)
+    parser.add_argument("--fcu-only-ratio", type=float, default=0.1, help="share of FCU zones without IAQ sensor")
+    parser.add_argument("--oau-zones", type=int, default=None, help="OAU zones (default: --zones)")
+    parser.add_argument("--oau-iaq-per-zone", type=int, default=4)
+    parser.add_argument("--series-minutes", type=int, default=40, help="minutes of generated telemetry per device")
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--query-latency-ms", type=float, default=0.0, help="emulated CrateDB round trip per query")
+    parser.add_argument("--feedback-burst", type=int, default=1000, help="tenant feedback messages in the burst")
+    parser.add_argument("--feedback-zones", type=int, default=50, help="zones receiving the feedback burst")
+    parser.add_argument("--messages", type=int, default=100000, help="IAQ messages in the OAU flood")
+    parser.add_argument("--unknown-ratio", type=float, default=0.2, help="share of IAQ messages from devices not in any zone")
+    parser.add_argument("--automation", type=json.loads, default=dict(), help="JSON overrides of both agents' `automation`")
+    parser.add_argument("--skip-memory", action="store_true", help="don't rerun scenarios under tracemalloc")
+    parser.add_argument("--output", default=None, help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    unknown_scenarios = set(args.scenarios) - set(SCENARIOS)
+    if unknown_scenarios:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown_scenarios))}")
+    logging.basicConfig(level=args.log_level)
+    logging.getLogger().setLevel(args.log_level)
+
+    results = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
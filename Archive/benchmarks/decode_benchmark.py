@@ -0,0 +1,78 @@
+"""
+Benchmark CrateDB result decoding: list-of-dicts + pandas pivot_table vs columnar NumPy arrays + pre-sized pivot
+
+Usage:
+    python Archive/benchmarks/decode_benchmark.py [--devices 200] [--minutes 30] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+for _package_dir in ("FCUAgent", "AgentCommon"):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", _package_dir))
+
+from fcuagent.data_handler import _pre_process_timeseries_data, _rows_to_columns  # noqa: E402
+
+COLUMNS = ['timestamp', 'device_id', 'datapoint', 'value']
+DATAPOINTS = ['humidity', 'temperature', 'mode', 'set_temperature', 'room_temperature']
+
+
+def generate_rows(n_devices: int, minutes: int, seed: int=0):
+    """Generate cursor rows (timestamp [ms], device_id, datapoint, value) with one sample per device per minute"""
+    rng = np.random.default_rng(seed)
+    start = int(time.time() * 1000) - minutes * 60 * 1000
+    rows = list()
+    for minute in range(minutes):
+        for device_idx in range(n_devices):
+            timestamp = start + minute * 60 * 1000 + device_idx
+            for datapoint in DATAPOINTS:
+                value = '"cool"' if datapoint == 'mode' else str(round(float(rng.uniform(18, 35)), 2))
+                rows.append((timestamp, "device_{:05d}".format(device_idx), datapoint, value))
+    return rows
+
+
+def decode_list_of_dicts(rows: list):
+    data = [dict(zip(COLUMNS, row)) for row in rows]
+    return _pre_process_timeseries_data(data)
+
+
+def decode_columnar(rows: list):
+    data = _rows_to_columns(COLUMNS, rows)
+    return _pre_process_timeseries_data(data)
+
+
+def best_time(fn, rows: list, repeat: int):
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(rows)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--minutes", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = generate_rows(args.devices, args.minutes)
+    before, expected = best_time(decode_list_of_dicts, rows, args.repeat)
+    after, result = best_time(decode_columnar, rows, args.repeat)
+
+    expected.columns.name = None
+    pd.testing.assert_frame_equal(expected, result)
+
+    print("rows: {}".format(len(rows)))
+    print("list-of-dicts: {:>12,.0f} rows/sec ({:.3f} s)".format(len(rows) / before, before))
+    print("columnar:      {:>12,.0f} rows/sec ({:.3f} s)".format(len(rows) / after, after))
+    print("speedup:       {:>12.1f}x".format(before / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+In-process stand-ins for the VOLTTRON platform used by the benchmarks
+
+Agents are built with their real `__init__` / `configure`, on top of a fake `core` (scheduled events are recorded, not
+run) and a fake `vip` (pub/sub records published messages and can deliver messages to subscribers). When VOLTTRON is
+not installed (ex. running the unit tests), minimal `volttron.platform` modules are registered so that the agents can
+be imported; with VOLTTRON installed the real modules are used and only the connection to a platform is skipped.
+"""
+import contextlib
+import importlib.util
+import json
+import os
+import sys
+import types
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for _agent_dir in ("FCUAgent", "OAUAgent", "AgentCommon"):
+    if os.path.join(ARCHIVE_DIR, _agent_dir) not in sys.path:
+        sys.path.insert(0, os.path.join(ARCHIVE_DIR, _agent_dir))
+
+
+def _install_volttron_stand_in():
+    """Register the `volttron.platform` names imported by the agents, the platform behaviour is in the fakes below"""
+    def _decorator_factory(*args, **kwargs):
+        if (len(args) == 1) and callable(args[0]) and (not kwargs):
+            return args[0]
+        return lambda func: func
+
+    class Agent:
+        def __init__(self, **kwargs):
+            pass
+
+    class Core:
+        receiver = staticmethod(_decorator_factory)
+        schedule = staticmethod(_decorator_factory)
+        periodic = staticmethod(_decorator_factory)
+
+    class RPC:
+        export = staticmethod(_decorator_factory)
+
+    class _Schedule:
+        def __init__(self, spec):
+            self.spec = spec
+
+        def __repr__(self):
+            return f"{type(self).__name__}({self.spec!r})"
+
+    def load_config(config_path):
+        with open(config_path) as config_file:
+            return json.load(config_file)
+
+    modules = {name: types.ModuleType(name) for name in ("volttron", "volttron.platform", "volttron.platform.agent",
+                                                         "volttron.platform.agent.utils", "volttron.platform.vip",
+                                                         "volttron.platform.vip.agent", "volttron.platform.scheduling")}
+    modules["volttron.platform.agent.utils"].__dict__.update(setup_logging=lambda *args, **kwargs: None,
+                                                             load_config=load_config,
+                                                             vip_main=lambda *args, **kwargs: None)
+    modules["volttron.platform.vip.agent"].__dict__.update(Agent=Agent, Core=Core, RPC=RPC)
+    modules["volttron.platform.scheduling"].__dict__.update(cron=type("cron", (_Schedule,), {}),
+                                                            periodic=type("periodic", (_Schedule,), {}))
+    for name, module in modules.items():
+        parent, _, child = name.rpartition(".")
+        if parent:
+            setattr(modules[parent], child, module)
+        sys.modules[name] = module
+
+
+if importlib.util.find_spec("volttron") is None:
+    _install_volttron_stand_in()
+
+
+class FakeScheduledEvent:
+    def __init__(self, deadline, func, args, kwargs):
+        self.deadline = deadline
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        self.cancelled = True
+        return self.func(*self.args, **self.kwargs)
+
+
+class FakeCore:
+    def __init__(self, identity: str="benchmark.agent"):
+        self.identity = identity
+        self.scheduled = []
+
+    def schedule(self, deadline, func, *args, **kwargs):
+        event = FakeScheduledEvent(deadline, func, args, kwargs)
+        self.scheduled.append(event)
+        return event
+
+    def periodic(self, period, func, *args, **kwargs):
+        return self.schedule(period, func, *args, **kwargs)
+
+    def pending(self, func=None):
+        """Get scheduled events not run nor cancelled yet (only events calling `func` if given)"""
+        return [event for event in self.scheduled if (not event.cancelled) and ((func is None) or (event.func == func))]
+
+
+class FakePubSub:
+    def __init__(self):
+        self.published = []
+        self.subscriptions = []  # [(prefix, callback), ...]
+
+    def publish(self, peer, topic, headers=None, message=None, **kwargs):
+        self.published.append((topic, headers, message))
+
+    def subscribe(self, peer, prefix, callback, **kwargs):
+        self.subscriptions.append((prefix, callback))
+
+    def unsubscribe(self, peer, prefix, callback, **kwargs):
+        self.subscriptions = [(_prefix, _callback) for _prefix, _callback in self.subscriptions
+                              if (prefix is not None) and (_prefix != prefix)]
+
+    def deliver(self, topic, message, headers=None, sender="benchmark.sender"):
+        """Call every subscriber whose prefix matches `topic`, like the VOLTTRON message bus"""
+        for prefix, callback in self.subscriptions:
+            if topic.startswith(prefix):
+                callback("pubsub", sender, None, topic, headers or {}, message)
+
+
+class FakeConfigStore:
+    def set_default(self, *args, **kwargs):
+        pass
+
+    def subscribe(self, *args, **kwargs):
+        pass
+
+
+class FakeVip:
+    def __init__(self):
+        self.pubsub = FakePubSub()
+        self.config = FakeConfigStore()
+
+
+@contextlib.contextmanager
+def _skip_platform_init(agent_class):
+    """Make the VOLTTRON `Agent.__init__` a no-op while building `agent_class`"""
+    base_class = agent_class.__mro__[1]
+    base_init = base_class.__init__
+    base_class.__init__ = lambda self, **kwargs: None
+    try:
+        yield
+    finally:
+        base_class.__init__ = base_init
+
+
+def make_agent(agent_class, config: dict, identity: str="benchmark.agent"):
+    """Build and configure an agent from a full config dict ({"automation": ..., "thermal_zone_mapping": ..., ...})"""
+    agent = agent_class.__new__(agent_class)
+    agent.core = FakeCore(identity)
+    agent.vip = FakeVip()
+    with _skip_platform_init(agent_class):
+        agent_class.__init__(agent, **{key: value for key, value in config.items()
+                                       if key in ("automation", "apmv", "thermal_zone_mapping", "cratedb_config")})
+    agent.configure("config", "NEW", config)
+    return agent
@@ -0,0 +1,59 @@
+"""
+Benchmark sustained IAQ messages/sec through `Oauagent._handle_publish`
+
+Usage:
+    python Archive/benchmarks/oau_message_rate.py [--zones 500] [--devices-per-zone 4] [--messages 200000] [--event-driven]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from fakes import make_agent
+from synthetic_building import oau_mapping
+
+from oauagent.agent import Oauagent, IAQ_TOPIC_PREFIX
+
+
+def oau_config(n_zones: int, devices_per_zone: int, event_driven: bool=False):
+    thermal_zone_mapping = oau_mapping(n_zones, iaq_per_zone=devices_per_zone)
+    return {
+        "cratedb_config": {},
+        "automation": {"CO2_on": 1000, "CO2_off": 800, "trigger_interval": 1, "event_driven": event_driven,
+                       "min_reevaluation_seconds": 10},
+        "thermal_zone_mapping": thermal_zone_mapping
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zones", type=int, default=500)
+    parser.add_argument("--devices-per-zone", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--unknown-ratio", type=float, default=0.2, help="share of messages from devices not in any zone")
+    parser.add_argument("--event-driven", action="store_true")
+    args = parser.parse_args()
+
+    config = oau_config(args.zones, args.devices_per_zone, args.event_driven)
+    agent = make_agent(Oauagent, config)
+
+    rng = np.random.default_rng(0)
+    device_ids = [device_id for info in config["thermal_zone_mapping"].values() for device_id in info["iaq_device_ids"]]
+    unknown = rng.random(args.messages) < args.unknown_ratio
+    topics = [f"{IAQ_TOPIC_PREFIX}unknown-{i % 100}/event" if is_unknown else f"{IAQ_TOPIC_PREFIX}{device_ids[i % len(device_ids)]}/event"
+              for i, is_unknown in enumerate(unknown)]
+    messages = [{"co2": int(co2), "temperature": 25.0, "humidity": 55.0} for co2 in rng.integers(400, 1400, args.messages)]
+
+    handler = agent._handle_publish
+    start = time.perf_counter()
+    for topic, message in zip(topics, messages):
+        handler("pubsub", "iaq.agent", None, topic, {}, message)
+    elapsed = time.perf_counter() - start
+
+    print(f"devices: {len(device_ids)}  messages: {args.messages}  unknown: {int(unknown.sum())}  event_driven: {args.event_driven}")
+    print(f"handler: {args.messages / elapsed:,.0f} messages/sec ({elapsed:.3f} s)")
+    print(f"published commands: {len(agent.vip.pubsub.published)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Synthetic building for the benchmarks: generated `thermal_zone_mapping`s and a CrateDB stand-in serving generated time
+series through the `crate.client` interface used by `fcuagent.data_handler`
+"""
+import re
+import threading
+import time
+
+import numpy as np
+
+IAQ_TOPIC_TEMPLATE = "sensor/tuya_air_quality/{device_id}/event"
+
+
+def fcu_mapping(n_zones: int, iaq_per_zone: int=1, fcu_per_zone: int=1, fcu_only_ratio: float=0.0, seed: int=0):
+    """
+    Generate a FCU agent `thermal_zone_mapping` with `n_zones` zones
+
+    Args:
+        iaq_per_zone (int): IAQ sensors per zone
+        fcu_per_zone (int): FCUs per zone
+        fcu_only_ratio (float): Share of zones without IAQ sensor (these use the 30-minute FCU-only lookback)
+
+    Returns:
+        thermal_zone_mapping (dict): {<zone_name>: {"fcu_device_ids": [...], "iaq_device_ids": [...]}}
+
+    """
+    rng = np.random.default_rng(seed)
+    fcu_only = rng.random(n_zones) < fcu_only_ratio
+    thermal_zone_mapping = dict()
+    for zone_idx in range(n_zones):
+        floor = zone_idx // 50 + 1
+        thermal_zone_mapping[f"Floor {floor}: {zone_idx + 1}"] = {
+            "fcu_device_ids": [f"SyntheticFCU-{zone_idx:05d}-{device_idx:02d}" for device_idx in range(fcu_per_zone)],
+            "iaq_device_ids": [] if fcu_only[zone_idx] else
+                              [f"synthetic-iaq-{zone_idx:05d}-{device_idx:02d}" for device_idx in range(iaq_per_zone)]
+        }
+    return thermal_zone_mapping
+
+
+def oau_mapping(n_zones: int, iaq_per_zone: int=4, oau_per_zone: int=1, shared_iaq_ratio: float=0.0, seed: int=0):
+    """
+    Generate a OAU agent `thermal_zone_mapping` with `n_zones` zones
+
+    Args:
+        iaq_per_zone (int): IAQ sensors per zone
+        oau_per_zone (int): OAUs per zone
+        shared_iaq_ratio (float): Share of zones which also use the first IAQ sensor of the previous zone
+
+    Returns:
+        thermal_zone_mapping (dict): {<zone_name>: {"oau_device_ids": [...], "iaq_device_ids": [...]}}
+
+    """
+    rng = np.random.default_rng(seed)
+    shared = rng.random(n_zones) < shared_iaq_ratio
+    thermal_zone_mapping = dict()
+    for zone_idx in range(n_zones):
+        iaq_device_ids = [f"synthetic-iaq-{zone_idx:05d}-{device_idx:02d}" for device_idx in range(iaq_per_zone)]
+        if shared[zone_idx] and (zone_idx > 0) and (iaq_per_zone > 0):
+            iaq_device_ids.append(f"synthetic-iaq-{zone_idx - 1:05d}-00")
+        thermal_zone_mapping[f"zone-{zone_idx:05d}"] = {
+            "oau_device_ids": [f"SyntheticOAU-{zone_idx:05d}-{device_idx:02d}" for device_idx in range(oau_per_zone)],
+            "iaq_device_ids": iaq_device_ids
+        }
+    return thermal_zone_mapping
+
+
+def mapping_device_ids(thermal_zone_mapping: dict, key: str):
+    """Unique device ids under `key` ("iaq_device_ids", "fcu_device_ids", "oau_device_ids") in mapping order"""
+    return list(dict.fromkeys(device_id for device_infos in thermal_zone_mapping.values() for device_id in device_infos.get(key, list())))
+
+
+def generate_series(thermal_zone_mapping: dict, minutes: int=40, interval_seconds: int=60, now_ms: int=None, seed: int=0):
+    """
+    Generate raw telemetry rows of every device in a FCU mapping, same layout as the CrateDB table
+
+    IAQ sensors report `temperature` / `humidity`, FCUs report `mode` / `set_temperature` / `room_temperature`, every
+    `interval_seconds` over the last `minutes`. Values are strings, like the `value` column.
+
+    Returns:
+        rows (dict): {<device_id>: [(timestamp_ms, device_id, datapoint, value), ...]}
+
+    """
+    rng = np.random.default_rng(seed)
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    timestamps = list(range(now_ms - minutes * 60 * 1000, now_ms, interval_seconds * 1000))
+    rows = dict()
+    for device_id in mapping_device_ids(thermal_zone_mapping, "iaq_device_ids"):
+        temperatures = np.round(24 + 3 * rng.random(len(timestamps)), 2)
+        humidities = np.round(45 + 20 * rng.random(len(timestamps)), 2)
+        device_rows = []
+        for timestamp, temperature, humidity in zip(timestamps, temperatures.tolist(), humidities.tolist()):
+            device_rows.append((timestamp, device_id, "temperature", str(temperature)))
+            device_rows.append((timestamp, device_id, "humidity", str(humidity)))
+        rows[device_id] = device_rows
+    for device_id in mapping_device_ids(thermal_zone_mapping, "fcu_device_ids"):
+        room_temperatures = np.round(24 + 3 * rng.random(len(timestamps)), 2)
+        set_temperature = str(int(rng.integers(24, 27)))
+        device_rows = []
+        for timestamp, room_temperature in zip(timestamps, room_temperatures.tolist()):
+            device_rows.append((timestamp, device_id, "mode", '"cool"'))
+            device_rows.append((timestamp, device_id, "set_temperature", set_temperature))
+            device_rows.append((timestamp, device_id, "room_temperature", str(room_temperature)))
+        rows[device_id] = device_rows
+    return rows
+
+
+_CONDITION_PATTERNS = (
+    (re.compile(r'^NOT \((?P<col>"?\w+"?) = ANY\(\?\)\)$'), "NOT IN"),
+    (re.compile(r'^(?P<col>"?\w+"?) = ANY\(\?\)$'), "IN"),
+    (re.compile(r'^(?P<col>"?\w+"?) (?P<oper>>=|<=|!=|=|>|<|NOT LIKE|LIKE) \?$'), None),
+)
+_AGGREGATION_PATTERN = re.compile(r'(AVG|MAX_BY)\(.*?\) FILTER \(WHERE datapoint = \?\) AS "(?P<name>[^"]+)"')
+_BUCKET_PATTERN = re.compile(r"DATE_BIN\('(?P<minutes>\d+) minutes'")
+
+
+def _parse_query(query_string: str, args: list):
+    """Get (select columns, aggregations, bucket minutes, [(column, operator, value), ...]) of a `data_handler` query"""
+    args = list(args or [])
+    select_string, _, rest = query_string.partition(" FROM ")
+    where_string = rest.partition(" WHERE ")[2].partition("\nGROUP BY")[0]
+
+    aggregations = []  # [(<datapoint>, "mean" | "last"), ...], their bind arguments come first
+    for match in _AGGREGATION_PATTERN.finditer(select_string):
+        aggregations.append((match.group("name"), "mean" if match.group(1) == "AVG" else "last"))
+    bucket_match = _BUCKET_PATTERN.search(select_string)
+    args = args[len(aggregations):]
+
+    if aggregations:
+        columns = ["timestamp", "device_id"] + [datapoint for datapoint, _ in aggregations]
+    elif select_string.strip() == "SELECT *":
+        columns = ["timestamp", "device_id", "datapoint", "value"]
+    else:
+        columns = [column.strip().strip('"') for column in select_string[len("SELECT "):].split(",")]
+
+    conditions = []
+    for condition, value in zip([c for c in where_string.split("\nAND ") if c], args):
+        for pattern, oper in _CONDITION_PATTERNS:
+            match = pattern.match(condition.strip())
+            if match:
+                conditions.append((match.group("col").strip('"'), oper or match.group("oper"), value))
+                break
+    return columns, aggregations, int(bucket_match.group("minutes")) if bucket_match else None, conditions
+
+
+class StubCrateClient:
+    """
+    Stand-in for `crate.client` serving rows from `generate_series`, to patch `fcuagent.data_handler.client`
+
+    Supports the statements built by `data_handler._build_query`: `device_id` / `datapoint` filters (`IN`, `NOT IN`,
+    `=`, `!=`), selected columns and the server-side aggregation (`DATE_BIN` buckets, AVG / MAX_BY per datapoint).
+    Timestamp filters are not applied, the generated series already covers the lookback window.
+
+    Args:
+        rows (dict): {<device_id>: [(timestamp_ms, device_id, datapoint, value), ...]} from `generate_series`
+        latency_seconds (float): Sleep per query, to emulate the network round trip to CrateDB
+
+    """
+
+    def __init__(self, rows: dict, latency_seconds: float=0.0):
+        self.rows = rows
+        self.latency_seconds = latency_seconds
+        self._lock = threading.Lock()
+        self.queries = 0  # data queries, health checks (`SELECT 1`) excluded
+        self.rows_served = 0
+        self.connections = 0
+
+    def reset_counters(self):
+        with self._lock:
+            self.queries = 0
+            self.rows_served = 0
+
+    def connect(self, *args, **kwargs):
+        with self._lock:
+            self.connections += 1
+        return _StubConnection(self)
+
+    def _select(self, query_string: str, args: list):
+        columns, aggregations, bucket_minutes, conditions = _parse_query(query_string, args)
+        device_ids = list(self.rows.keys())
+        datapoints = None
+        for column, oper, value in conditions:
+            if column == "device_id" and oper == "IN":
+                device_ids = [device_id for device_id in dict.fromkeys(value) if device_id in self.rows]
+            elif column == "device_id" and oper == "=":
+                device_ids = [value] if value in self.rows else []
+            elif column == "device_id" and oper in ("NOT IN", "!="):
+                excluded = set(value) if oper == "NOT IN" else {value}
+                device_ids = [device_id for device_id in device_ids if device_id not in excluded]
+            elif column == "datapoint" and oper == "IN":
+                datapoints = set(value)
+            elif column == "datapoint" and oper == "=":
+                datapoints = {value}
+        if aggregations:
+            datapoints = {datapoint for datapoint, _ in aggregations}
+
+        selected = [row for device_id in device_ids for row in self.rows[device_id]
+                    if (datapoints is None) or (row[2] in datapoints)]
+        if aggregations:
+            return _aggregate_rows(selected, aggregations, bucket_minutes or 5), columns
+        positions = [("timestamp", "device_id", "datapoint", "value").index(column) for column in columns]
+        return [tuple(row[position] for position in positions) for row in selected], columns
+
+
+def _aggregate_rows(rows: list, aggregations: list, bucket_minutes: int):
+    """Same result as the `DATE_BIN` / `GROUP BY` statement: one row per (right bucket edge, device)"""
+    bucket_ms = bucket_minutes * 60 * 1000
+    buckets = dict()  # {(bucket_timestamp, device_id): {<datapoint>: [(timestamp, value), ...]}}
+    for timestamp, device_id, datapoint, value in rows:
+        key = ((timestamp // bucket_ms + 1) * bucket_ms, device_id)
+        buckets.setdefault(key, dict()).setdefault(datapoint, []).append((timestamp, value))
+    aggregated = []
+    for (bucket_timestamp, device_id), datapoint_values in buckets.items():
+        row = [bucket_timestamp, device_id]
+        for datapoint, aggfunc in aggregations:
+            values = datapoint_values.get(datapoint)
+            if not values:
+                row.append(None)
+            elif aggfunc == "mean":
+                numbers = []
+                for _, value in values:
+                    try:
+                        numbers.append(float(value))
+                    except (TypeError, ValueError):
+                        pass
+                row.append(sum(numbers) / len(numbers) if numbers else None)
+            else:
+                row.append(max(values, key=lambda value: value[0])[1])
+        aggregated.append(tuple(row))
+    return aggregated
+
+
+class _StubConnection:
+    def __init__(self, stub_client: StubCrateClient):
+        self._client = stub_client
+
+    def cursor(self):
+        return _StubCursor(self._client)
+
+    def close(self):
+        pass
+
+
+class _StubCursor:
+    def __init__(self, stub_client: StubCrateClient):
+        self._client = stub_client
+        self._rows = []
+        self.description = None
+
+    def execute(self, query_string: str, args: list=None):
+        if query_string.strip() == "SELECT 1":
+            self._rows, self.description = [(1,)], [("1",)]
+            return
+        if self._client.latency_seconds > 0:
+            time.sleep(self._client.latency_seconds)
+        self._rows, columns = self._client._select(query_string, args)
+        self.description = [(column,) for column in columns]
+        with self._client._lock:
+            self._client.queries += 1
+            self._client.rows_served += len(self._rows)
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass